@@ -1,14 +1,33 @@
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from config import Config
 import os
+import threading
+import time
 
 # Import the db instance from the new database.py file
 from database import db
 
+
+class BatchJWTManager(JWTManager):
+    """
+    JWTManager that trusts the token POST /api/batch has already verified.
+    
+    Sub-requests of a batch carry the batch's bearer token; their
+    @jwt_required() gets the claims stored in g.batch_jwt back instead of
+    checking the signature and expiry again. Any other token is decoded as usual.
+    """
+    
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        verified = g.get('batch_jwt')
+        if verified is not None and verified['token'] == encoded_token:
+            return verified['claims']
+        return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+
 # JWTManager is initialized without the app here
-jwt = JWTManager()
+jwt = BatchJWTManager()
 
 def create_app():
     """Application factory pattern"""
@@ -26,35 +45,76 @@ def create_app():
     db.init_app(app)
     jwt.init_app(app)
     
+    # Revoked JWTs (logout, password/role changes) are rejected without a DB query
+    from utils.token_revocation import init_token_revocation
+    init_token_revocation(app, jwt)
+    
+    # @use_replica routes read from DATABASE_REPLICA_URLS when configured
+    from utils.replica import init_replica_routing
+    init_replica_routing(app)
+    
     # Create upload folder if it doesn't exist
     upload_folder = app.config.get('UPLOAD_FOLDER')
     if upload_folder:
         os.makedirs(upload_folder, exist_ok=True)
     
-    # Register blueprints with error handling
-    try:
-        from routes.auth_routes import auth_bp
-        app.register_blueprint(auth_bp, url_prefix="/api/auth")
-    except ImportError as e:
-        print(f"Warning: Could not import auth_routes: {e}")
-    
-    try:
-        from routes.expense_routes import expense_bp
-        app.register_blueprint(expense_bp, url_prefix="/api/expenses")
-    except ImportError as e:
-        print(f"Warning: Could not import expense_routes: {e}")
-    
-    try:
-        from routes.approval_routes import approval_bp
-        app.register_blueprint(approval_bp, url_prefix="/api/approvals")
-    except ImportError as e:
-        print(f"Warning: Could not import approval_routes: {e}")
-    
-    try:
-        from routes.rule_routes import rule_bp
-        app.register_blueprint(rule_bp, url_prefix="/api/rules")
-    except ImportError as e:
-        print(f"Warning: Could not import rule_routes: {e}")
+    # Register blueprints. Import failures are real bugs, so they are no longer
+    # swallowed; heavy optional dependencies are imported lazily inside the routes.
+    from routes.auth_routes import auth_bp
+    from routes.expense_routes import expense_bp
+    from routes.approval_routes import approval_bp
+    from routes.rule_routes import rule_bp
+    from routes.analytics_routes import analytics_bp
+    from routes.profile_routes import profile_bp
+    from routes.stream_routes import stream_bp
+    from routes.change_routes import change_bp
+    from routes.batch_routes import batch_bp
+    
+    app.register_blueprint(auth_bp, url_prefix="/api/auth")
+    app.register_blueprint(expense_bp, url_prefix="/api/expenses")
+    app.register_blueprint(approval_bp, url_prefix="/api/approvals")
+    app.register_blueprint(rule_bp, url_prefix="/api/rules")
+    app.register_blueprint(analytics_bp, url_prefix="/api/analytics")
+    app.register_blueprint(profile_bp, url_prefix="/api/profiles")
+    app.register_blueprint(stream_bp, url_prefix="/api/stream")
+    app.register_blueprint(change_bp, url_prefix="/api/changes")
+    app.register_blueprint(batch_bp, url_prefix="/api/batch")
+    
+    # Per-worker cache in front of the idempotency_keys table
+    from utils.idempotency import configure_idempotency
+    configure_idempotency(app)
+    
+    # Historical exchange-rate index used for date-correct conversion
+    from services.rate_history import configure_rate_history
+    configure_rate_history(app)
+    
+    # Request latency, DB query and cache metrics exposed at /metrics
+    from utils.metrics import init_metrics
+    init_metrics(app)
+    
+    # Opt-in per-request profiling (signed header or sample rate)
+    from utils.profiling import init_profiling
+    init_profiling(app)
+    
+    # Per-IP/per-account token buckets (after metrics so 429s are still timed)
+    from utils.rate_limit import init_rate_limiting
+    init_rate_limiting(app)
+    
+    # Approval notifications are queued in the outbox inside each write transaction
+    from services.notification_service import install_outbox_listener
+    install_outbox_listener()
+    
+    # Expense/step mutations are appended to change_events for /api/changes
+    from services.change_log import install_change_log_listener
+    install_change_log_listener()
+    
+    # Live approval/expense events for /api/stream, published after commit
+    from services.event_bus import init_event_bus
+    init_event_bus(app)
+    
+    # Management commands (flask rollups rebuild, ...)
+    from commands import register_commands
+    register_commands(app)
     
     # Health check endpoint
     @app.route('/health', methods=['GET'])
@@ -65,6 +125,55 @@ def create_app():
             'environment': os.getenv('FLASK_ENV', 'development')
         }), 200
     
+    # Readiness check endpoint (unlike /health, this actually talks to the DB).
+    # The probe runs in a thread so a hung connect or pool checkout can't hold
+    # the request past the budget; one probe at a time keeps a hung database
+    # from piling up threads.
+    readiness_probe = {'thread': None}
+    
+    @app.route('/ready', methods=['GET'])
+    def readiness_check():
+        from sqlalchemy import text
+        
+        budget_ms = app.config.get('READINESS_TIMEOUT_MS', 500)
+        engine = db.engine
+        outcome = {}
+        
+        def probe():
+            try:
+                with engine.connect() as connection:
+                    if connection.dialect.name == 'postgresql':
+                        connection.execute(text(f"SET LOCAL statement_timeout = {int(budget_ms)}"))
+                    connection.execute(text("SELECT 1"))
+            except Exception as e:
+                outcome['error'] = e
+        
+        previous = readiness_probe['thread']
+        if previous is not None and previous.is_alive():
+            return jsonify({'status': 'unavailable', 'message': 'Previous database check has not finished'}), 503
+        
+        started = time.monotonic()
+        thread = threading.Thread(target=probe, name='readiness-probe', daemon=True)
+        readiness_probe['thread'] = thread
+        thread.start()
+        thread.join(budget_ms / 1000)
+        elapsed_ms = (time.monotonic() - started) * 1000
+        
+        if thread.is_alive():
+            return jsonify({
+                'status': 'unavailable',
+                'message': f'Database did not respond within {budget_ms}ms'
+            }), 503
+        if 'error' in outcome:
+            return jsonify({'status': 'unavailable', 'message': f"Database check failed: {outcome['error']}"}), 503
+        if elapsed_ms > budget_ms:
+            return jsonify({
+                'status': 'unavailable',
+                'message': f'Database responded in {elapsed_ms:.0f}ms (budget {budget_ms}ms)'
+            }), 503
+        
+        return jsonify({'status': 'ready', 'db_latency_ms': round(elapsed_ms, 1)}), 200
+    
     # Root endpoint
     @app.route('/', methods=['GET'])
     def root():
@@ -96,6 +205,10 @@ def create_app():
     def invalid_token_callback(error):
         return jsonify({'error': 'invalid_token', 'message': 'Signature verification failed'}), 401
     
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return jsonify({'error': 'token_revoked', 'message': 'The token has been revoked'}), 401
+    
     @jwt.unauthorized_loader
     def missing_token_callback(error):
         return jsonify({'error': 'authorization_required', 'message': 'Request does not contain an access token'}), 401
@@ -103,6 +216,7 @@ def create_app():
     return app
 
 if __name__ == "__main__":
+    # Development server only; production runs `gunicorn -c gunicorn.conf.py wsgi:app`
     app = create_app()
     
     with app.app_context():
@@ -118,5 +232,5 @@ if __name__ == "__main__":
     app.run(
         host='0.0.0.0',
         port=int(os.getenv('PORT', 5000)),
-        debug=app.config.get('DEBUG', True)
+        debug=app.config.get('DEBUG', False)
     )
@@ -0,0 +1,73 @@
+"""
+Benchmark the vectorized analytics kernels on synthetic expense data.
+
+Usage:
+    python benchmarks/bench_analytics.py [--rows 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.analytics_service import factorize, rolling_spend, employee_outliers, category_mix  # noqa: E402
+
+CATEGORIES = np.array(['Travel', 'Food', 'Office Supplies', 'Software', 'Training', 'Other'], dtype=object)
+CURRENCIES = np.array(['USD', 'EUR', 'GBP', 'INR', 'JPY'], dtype=object)
+RATES = np.array([1.0, 0.92, 0.79, 83.1, 149.5])
+
+
+def synthetic_columns(rows, employees=5000, days=3 * 365, seed=42):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2022-01-01')
+    currency_index = rng.integers(0, len(CURRENCIES), rows)
+    return {
+        'expense_date': start + rng.integers(0, days, rows).astype('timedelta64[D]'),
+        'amount': np.round(rng.lognormal(4.0, 1.0, rows), 2),
+        'category': CATEGORIES[rng.integers(0, len(CATEGORIES), rows)],
+        'employee_id': rng.integers(1, employees + 1, rows),
+        'original_currency': CURRENCIES[currency_index],
+        '_currency_index': currency_index,
+    }
+
+
+def timed(label, repeat, fn):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    print(f"{label:<28} best {min(samples) * 1000:8.1f} ms   median {np.median(samples) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    print(f"Generating {args.rows:,} synthetic expenses...")
+    columns = synthetic_columns(args.rows)
+    
+    def convert():
+        # Same shape as AnalyticsService.to_company_currency: one rate per currency
+        _, inverse = factorize(columns['original_currency'])
+        return columns['amount'] / RATES[np.argsort(CURRENCIES)][inverse]
+    
+    amounts = columns['amount'] / RATES[columns['_currency_index']]
+    
+    print("=" * 60)
+    timed('currency conversion', args.repeat, convert)
+    timed('rolling 30/90-day spend', args.repeat,
+          lambda: rolling_spend(columns['expense_date'], amounts, last_days=365))
+    timed('employee z-score outliers', args.repeat,
+          lambda: employee_outliers(columns['employee_id'], amounts))
+    timed('category mix by month', args.repeat,
+          lambda: category_mix(columns['expense_date'], columns['category'], amounts))
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
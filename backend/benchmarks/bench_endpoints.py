@@ -0,0 +1,431 @@
+"""
+Endpoint load benchmark.
+
+Seeds synthetic tenants with scripts/seed_data.py, then drives every API route
+through the Flask test client (in-process, with SQL statement counts) or
+against a running server via --base-url. Reports p50/p95/p99 latency,
+throughput and queries per request for each endpoint.
+
+Baselines are JSON files under benchmarks/baselines/ so a branch can be
+compared with main:
+
+    git checkout main   && python benchmarks/bench_endpoints.py --save main
+    git checkout my-pr  && python benchmarks/bench_endpoints.py --compare main
+
+Usage:
+    python benchmarks/bench_endpoints.py [--database-url URL] [--expenses 20000]
+                                         [--requests 50] [--concurrency 1]
+                                         [--save NAME] [--compare NAME] [--threshold 0.2]
+    python benchmarks/bench_endpoints.py --base-url http://127.0.0.1:5000 --no-seed \\
+        --database-url postgresql://user:pw@localhost/bench
+
+By default exchange-rate and country lookups are answered offline so results
+do not depend on third-party latency; pass --live-http to call the real APIs.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'scripts'))
+
+BASELINE_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'baselines')
+
+EXCHANGE_RATES = {'USD': 1.0, 'EUR': 0.92, 'GBP': 0.79, 'INR': 83.1, 'JPY': 149.5, 'AUD': 1.52, 'CAD': 1.36}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+    
+    def raise_for_status(self):
+        pass
+    
+    def json(self):
+        return self.payload
+
+
+def fake_get(url, *args, **kwargs):
+    if 'restcountries' in url:
+        return FakeResponse([{'name': {'common': 'United States'}, 'currencies': {'USD': {}}}])
+    base = url.rstrip('/').rsplit('/', 1)[-1]
+    rates = {quote: rate / EXCHANGE_RATES.get(base, 1.0) for quote, rate in EXCHANGE_RATES.items()}
+    return FakeResponse({'base': base, 'rates': rates})
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class TestClientDriver:
+    """
+    In-process requests through app.test_client(), counting SQL per request
+    """
+    
+    counts_queries = True
+    
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+    
+    def request(self, method, path, headers=None, body=None):
+        from utils.query_budget import QueryRecorder
+        
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        with QueryRecorder() as recorder:
+            response = client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.get_json(silent=True), recorder.count
+
+
+class HttpDriver:
+    """
+    Requests against a running server (gunicorn or app.py)
+    """
+    
+    counts_queries = False
+    
+    def __init__(self, base_url):
+        import requests
+        
+        self.base_url = base_url.rstrip('/')
+        self._requests = requests
+        self._local = threading.local()
+    
+    def request(self, method, path, headers=None, body=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.request(method, self.base_url + path, headers=headers, json=body, timeout=30)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        return response.status_code, payload, None
+
+
+class Context:
+    """
+    Tokens and ids for one seeded company, shared by all scenarios
+    """
+    
+    def __init__(self, driver, company_index, password):
+        self.driver = driver
+        self.domain = f'company{company_index}.example'
+        self.password = password
+        self.tokens = {}
+        self.ids = {}
+        self.pending_pool = []
+        self._lock = threading.Lock()
+    
+    def login(self, who, email):
+        status, payload, _ = self.driver.request('POST', '/api/auth/login',
+                                                 body={'email': email, 'password': self.password})
+        if status != 200:
+            raise RuntimeError(f'login failed for {email}: {status} {payload}')
+        self.tokens[who] = payload['access_token']
+        self.ids[who] = payload['user']['id']
+    
+    def headers(self, who):
+        return {'Authorization': f'Bearer {self.tokens[who]}'}
+    
+    def next_pending(self):
+        with self._lock:
+            return self.pending_pool.pop() if self.pending_pool else None
+
+
+def prepare_context(app, driver, company_index, password):
+    """
+    Log in as the company's admin, busiest approver and one of their reports
+    """
+    from database import db
+    from models import ApprovalStep, Expense, User
+    
+    context = Context(driver, company_index, password)
+    context.login('admin', f'admin@{context.domain}')
+    
+    with app.app_context():
+        admin = db.session.get(User, context.ids['admin'])
+        busiest = (
+            db.session.query(ApprovalStep.approver_id, db.func.count(ApprovalStep.id))
+            .join(Expense, Expense.id == ApprovalStep.expense_id)
+            .filter(Expense.company_id == admin.company_id, ApprovalStep.status == 'pending',
+                    ApprovalStep.approver_id != admin.id)
+            .group_by(ApprovalStep.approver_id)
+            .order_by(db.func.count(ApprovalStep.id).desc())
+            .first()
+        )
+        if busiest is None:
+            raise RuntimeError('No pending approvals found; seed more expenses')
+        approver = db.session.get(User, busiest[0])
+        report = User.query.filter_by(manager_id=approver.id).first() or \
+            User.query.filter_by(company_id=admin.company_id, role='employee').first()
+        context.pending_pool = [
+            expense_id for (expense_id,) in db.session.query(ApprovalStep.expense_id)
+            .filter_by(approver_id=approver.id, status='pending').order_by(ApprovalStep.expense_id)
+        ]
+        sample_expense = Expense.query.filter_by(employee_id=report.id).first() or \
+            Expense.query.filter_by(company_id=admin.company_id).first()
+        context.ids['expense'] = sample_expense.id
+        context.ids['report_user'] = report.id
+        approver_email, report_email = approver.email, report.email
+    
+    context.login('manager', approver_email)
+    context.login('employee', report_email)
+    
+    status, payload, _ = driver.request('GET', '/api/rules/', context.headers('admin'))
+    context.ids['rule'] = payload['rules'][0]['id']
+    return context
+
+
+def scenarios(context):
+    """
+    Endpoint table: (name, method, path, who, body factory or None)
+    """
+    today = date.today()
+    expense_body = lambda: {
+        'amount': 123.45, 'original_currency': 'EUR', 'category': 'Food',
+        'description': 'Benchmark lunch', 'expense_date': today.isoformat()
+    }
+    return [
+        ('auth.login', 'POST', '/api/auth/login', None,
+         lambda: {'email': f'admin@{context.domain}', 'password': context.password}),
+        ('auth.me', 'GET', '/api/auth/me', 'admin', None),
+        ('auth.users', 'GET', '/api/auth/users', 'admin', None),
+        ('auth.users_tree', 'GET', '/api/auth/users/tree', 'admin', None),
+        ('auth.users_search', 'GET', '/api/auth/users/search?q=e', 'admin', None),
+        ('auth.update_user', 'PUT', f"/api/auth/users/{context.ids['report_user']}", 'admin',
+         lambda: {'full_name': 'Benchmark Employee'}),
+        ('expense.list[admin]', 'GET', '/api/expenses/', 'admin', None),
+        ('expense.list[manager]', 'GET', '/api/expenses/', 'manager', None),
+        ('expense.list[employee]', 'GET', '/api/expenses/', 'employee', None),
+        ('expense.list[filtered]', 'GET', '/api/expenses/?status=approved&category=Travel', 'admin', None),
+        ('expense.get', 'GET', f"/api/expenses/{context.ids['expense']}", 'admin', None),
+        ('expense.stats', 'GET', '/api/expenses/stats', 'admin', None),
+        ('expense.create', 'POST', '/api/expenses/', 'employee', expense_body),
+        ('approval.pending', 'GET', '/api/approvals/pending', 'manager', None),
+        ('approval.history', 'GET', '/api/approvals/history', 'manager', None),
+        ('approval.approve', 'POST', '/api/approvals/{pending}/approve', 'manager',
+         lambda: {'comments': 'Approved by benchmark'}),
+        ('rule.list', 'GET', '/api/rules/', 'admin', None),
+        ('rule.get', 'GET', f"/api/rules/{context.ids['rule']}", 'admin', None),
+        ('analytics.monthly', 'GET', '/api/analytics/monthly?group_by=category', 'admin', None),
+        ('analytics.summary', 'GET', '/api/analytics/summary', 'admin', None),
+        ('analytics.trends', 'GET', '/api/analytics/trends', 'admin', None),
+        ('analytics.outliers', 'GET', '/api/analytics/outliers', 'admin', None),
+        ('analytics.category_mix', 'GET', '/api/analytics/category-mix', 'admin', None),
+        # The dashboard's four loads in one round trip; compare with the sum of their rows
+        ('batch.dashboard', 'POST', '/api/batch', 'manager', lambda: {'requests': [
+            {'id': 'me', 'path': '/api/auth/me'},
+            {'id': 'stats', 'path': '/api/expenses/stats'},
+            {'id': 'expenses', 'path': '/api/expenses/'},
+            {'id': 'pending', 'path': '/api/approvals/pending'},
+        ]}),
+    ]
+
+
+def run_scenario(context, scenario, requests_per_endpoint, concurrency, warmup):
+    """
+    Run one endpoint `requests_per_endpoint` times
+    
+    Returns:
+        Result dictionary, or None when the endpoint could not be exercised
+    """
+    name, method, path, who, body_factory = scenario
+    headers = context.headers(who) if who else None
+    
+    def one_call():
+        target = path
+        if '{pending}' in target:
+            expense_id = context.next_pending()
+            if expense_id is None:
+                return None
+            target = target.format(pending=expense_id)
+        started = time.perf_counter()
+        status, _, queries = context.driver.request(method, target, headers, body_factory() if body_factory else None)
+        return time.perf_counter() - started, status, queries
+    
+    for _ in range(warmup):
+        one_call()
+    
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = [sample for sample in pool.map(lambda _: one_call(), range(requests_per_endpoint)) if sample]
+    wall = time.perf_counter() - wall_started
+    
+    if not samples:
+        return None
+    
+    latencies = sorted(sample[0] for sample in samples)
+    errors = sum(1 for sample in samples if sample[1] >= 400)
+    query_counts = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'endpoint': name,
+        'requests': len(samples),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'throughput_rps': round(len(samples) / wall, 1) if wall else None,
+        'queries_per_request': round(sum(query_counts) / len(query_counts), 1) if query_counts else None,
+    }
+
+
+def print_report(results):
+    header = f"{'endpoint':<26} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'q/req':>6}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        queries = result['queries_per_request']
+        print(f"{result['endpoint']:<26} {result['requests']:>5} {result['errors']:>4} "
+              f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{result['throughput_rps'] or 0:>8.1f} {'-' if queries is None else queries:>6}")
+
+
+def baseline_path(name):
+    if name.endswith('.json') or os.sep in name:
+        return name
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def compare(results, baseline, threshold, settings):
+    """
+    Print per-endpoint deltas against a baseline
+    
+    Returns:
+        List of endpoints whose p95 latency or query count regressed
+    """
+    previous = {result['endpoint']: result for result in baseline['results']}
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created_at', '?')} ({baseline.get('database', '?')}):")
+    if baseline.get('settings', {}).get('concurrency') != settings.get('concurrency'):
+        print("  note: baseline was recorded with a different --concurrency; latencies are not comparable")
+    print(f"{'endpoint':<26} {'p95 before':>11} {'p95 now':>9} {'change':>8} {'q before':>9} {'q now':>6}")
+    for result in results:
+        before = previous.get(result['endpoint'])
+        if not before:
+            print(f"{result['endpoint']:<26} {'(new)':>11}")
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        # Pools of mixed rule types make a few endpoints vary by a fraction of a query
+        queries_up = (result['queries_per_request'] or 0) > (before['queries_per_request'] or 0) + 0.5
+        flag = ''
+        if change > threshold or queries_up:
+            regressions.append(result['endpoint'])
+            flag = '  ✗'
+        print(f"{result['endpoint']:<26} {before['p95_ms']:>11.2f} {result['p95_ms']:>9.2f} {change:>+8.0%} "
+              f"{str(before['queries_per_request']):>9} {str(result['queries_per_request']):>6}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Defaults to a throwaway SQLite file')
+    parser.add_argument('--base-url', help='Benchmark a running server instead of the test client')
+    parser.add_argument('--no-seed', action='store_true', help='Use data already in the database')
+    parser.add_argument('--companies', type=int, default=2)
+    parser.add_argument('--employees', type=int, default=60, help='Employees per company')
+    parser.add_argument('--expenses', type=int, default=20000, help='Total expenses to seed')
+    parser.add_argument('--company-index', type=int, default=1, help='Seeded company to benchmark')
+    parser.add_argument('--password', default=None, help='Password of the seeded users')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', help='Comma-separated endpoint name prefixes to run')
+    parser.add_argument('--live-http', action='store_true', help='Call the real exchange-rate/country APIs')
+    parser.add_argument('--save', metavar='NAME', help='Write results to benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='Compare with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed p95 slowdown before --compare fails (default 0.2 = 20%%)')
+    args = parser.parse_args()
+    
+    os.environ['DATABASE_URL'] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-endpoints-'), 'bench.db')}"
+    os.environ['SQLALCHEMY_ECHO'] = 'False'
+    os.environ.setdefault('METRICS_MULTIPROC_DIR', '')
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')  # Every scenario logs in from one address
+    
+    if not args.live_http:
+        import requests
+        requests.get = fake_get
+    
+    from app import create_app
+    from database import db
+    import seed_data
+    
+    password = args.password or seed_data.DEFAULT_PASSWORD
+    app = create_app()
+    
+    if not args.no_seed:
+        with app.app_context():
+            db.create_all()
+            print(f"Seeding {args.companies} companies / {args.expenses:,} expenses...")
+            started = time.perf_counter()
+            seed_data.seed(db, companies=args.companies, employees=args.employees,
+                           expenses=args.expenses, password=password)
+            print(f"  seeded in {time.perf_counter() - started:.1f}s\n")
+    
+    driver = HttpDriver(args.base_url) if args.base_url else TestClientDriver(app)
+    context = prepare_context(app, driver, args.company_index, password)
+    
+    selected = scenarios(context)
+    if args.only:
+        prefixes = tuple(prefix.strip() for prefix in args.only.split(','))
+        selected = [scenario for scenario in selected if scenario[0].startswith(prefixes)]
+    
+    results = []
+    for scenario in selected:
+        result = run_scenario(context, scenario, args.requests, args.concurrency, args.warmup)
+        if result is None:
+            print(f"  skipped {scenario[0]} (nothing left to act on)")
+            continue
+        results.append(result)
+    
+    with app.app_context():
+        database = db.engine.url.get_backend_name()
+    print(f"\nDatabase: {database}  driver: {'http' if args.base_url else 'test client'}  "
+          f"concurrency: {args.concurrency}\n")
+    print_report(results)
+    
+    report = {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'database': database,
+        'driver': 'http' if args.base_url else 'test_client',
+        'python': platform.python_version(),
+        'settings': {'requests': args.requests, 'concurrency': args.concurrency,
+                     'companies': args.companies, 'expenses': args.expenses},
+        'results': results,
+    }
+    
+    if args.save:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nSaved baseline to {path}")
+    
+    if args.compare:
+        with open(baseline_path(args.compare)) as handle:
+            baseline = json.load(handle)
+        regressions = compare(results, baseline, args.threshold, report['settings'])
+        if regressions:
+            print(f"\n✗ {len(regressions)} endpoint(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✓ No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark rule simulation (RuleSimulationService.replay) on synthetic history.
+
+Times replaying a company's expenses through its current and a proposed
+rule set; loading the columns from the database is not included.
+
+Usage:
+    python benchmarks/bench_rule_simulation.py [--rows 1000000] [--rules 20] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.rule_simulation import RuleSimulationService  # noqa: E402
+
+CATEGORIES = np.array(['Travel', 'Food', 'Office Supplies', 'Software', 'Training', 'Other'], dtype=object)
+
+
+def synthetic_history(rows, employees=5000, seed=42):
+    rng = np.random.default_rng(seed)
+    columns = {
+        'id': np.arange(1, rows + 1, dtype=np.int64),
+        'amount': np.round(rng.lognormal(4.0, 1.0, rows), 2),
+        'category': CATEGORIES[rng.integers(0, len(CATEGORIES), rows)],
+        'employee_id': rng.integers(1, employees + 1, rows),
+    }
+    # One manager per 10 employees; most employees route to their manager
+    users = [(user_id, f'User {user_id}', (user_id - 1) // 10 + 1 if user_id > 10 else None, user_id % 4 != 0)
+             for user_id in range(1, employees + 1)]
+    return columns, users
+
+
+def synthetic_rules(count, seed=7):
+    rng = np.random.default_rng(seed)
+    rules = []
+    for index in range(count):
+        low = float(rng.choice([0, 50, 100, 500]))
+        rules.append({
+            'id': index + 1,
+            'name': f'Rule {index + 1}',
+            'rule_type': 'sequential',
+            'approval_sequence': [int(approver) for approver in rng.integers(1, 500, rng.integers(1, 4))],
+            'min_amount': low or None,
+            'max_amount': low * 10 or None,
+            'category': CATEGORIES[index % len(CATEGORIES)],
+        })
+    return rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--rules', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    print(f"Generating {args.rows:,} synthetic expenses and {args.rules} rules...")
+    columns, users = synthetic_history(args.rows)
+    service = RuleSimulationService()
+    existing = {rule['id']: rule for rule in synthetic_rules(args.rules)}
+    current = service.normalize_rules(list(existing.values()), existing)
+    # Proposal: double every lower threshold and drop the last rule
+    proposed = service.normalize_rules([
+        {'id': rule['id'], 'min_amount': (rule['min_amount'] or 0) * 2} for rule in current[:-1]
+    ], existing)
+    
+    samples = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = service.replay(columns, users, current, proposed)
+        samples.append(time.perf_counter() - started)
+    
+    print("=" * 60)
+    print(f"{'replay':<28} best {min(samples) * 1000:8.1f} ms   median {np.median(samples) * 1000:8.1f} ms")
+    print(f"  {result['changed']:,} rerouted, {result['steps']['added']:+,} steps, "
+          f"{len(result['transitions'])} transitions, {len(result['approver_load'])} approvers")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
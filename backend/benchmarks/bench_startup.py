@@ -0,0 +1,92 @@
+"""
+Measure worker cold start with `python -X importtime` and enforce a budget.
+
+Runs `from app import create_app; create_app()` in a fresh interpreter several
+times, reports the slowest imports and exits non-zero when the best run exceeds
+the budget or a deferred module (HTTP client, NumPy, Pillow, ...) is imported
+eagerly.
+
+Usage:
+    python benchmarks/bench_startup.py [--budget-ms 800] [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SNIPPET = "from app import create_app; create_app()"
+
+# Modules that must only be imported on first use, never at worker start
+DEFERRED_MODULES = ('requests', 'numpy', 'PIL', 'pytesseract')
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def measure_once():
+    """
+    Run one cold start and parse its -X importtime report
+    
+    Returns:
+        List of (module, self_us, cumulative_us, depth) tuples
+    """
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SNIPPET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{result.stderr[-2000:]}")
+    
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_TIME_BUDGET_MS', 800)))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    
+    runs = [measure_once() for _ in range(args.runs)]
+    totals_ms = [sum(entry[1] for entry in run) / 1000 for run in runs]
+    best_index = totals_ms.index(min(totals_ms))
+    best = runs[best_index]
+    
+    print("=" * 60)
+    print(f"Import time over {args.runs} cold starts: best {min(totals_ms):.1f} ms, "
+          f"worst {max(totals_ms):.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print("=" * 60)
+    print("Slowest top-level imports (cumulative):")
+    top_level = sorted((entry for entry in best if entry[3] == 0), key=lambda entry: -entry[2])
+    for module, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+    
+    failures = []
+    if min(totals_ms) > args.budget_ms:
+        failures.append(f"import time {min(totals_ms):.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+    
+    imported = {entry[0] for entry in best}
+    for module in DEFERRED_MODULES:
+        if module in imported:
+            failures.append(f"'{module}' is imported at startup but should be deferred until first use")
+    
+    print("=" * 60)
+    if failures:
+        for failure in failures:
+            print(f"✗ {failure}")
+        sys.exit(1)
+    print("✓ Startup within budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+import click
+from flask.cli import AppGroup
+
+rollup_cli = AppGroup('rollups', help='Maintain the dashboard rollup tables.')
+profiling_cli = AppGroup('profiling', help='Request profiling helpers.')
+notification_cli = AppGroup('notifications', help='Deliver queued e-mail notifications.')
+rates_cli = AppGroup('rates', help='Manage historical exchange rates.')
+expense_cli = AppGroup('expenses', help='Expense maintenance jobs.')
+schema_cli = AppGroup('schema', help='Database schema maintenance.')
+partition_cli = AppGroup('partitions', help='PostgreSQL partitioning of expenses and approval steps.')
+archive_cli = AppGroup('archive', help='Cold storage of closed expenses.')
+idempotency_cli = AppGroup('idempotency', help='Maintain the Idempotency-Key store.')
+token_cli = AppGroup('tokens', help='Maintain the JWT revocation list.')
+inbox_cli = AppGroup('inbox', help='Maintain the approval inbox and its counters.')
+sla_cli = AppGroup('sla', help='Escalate approval steps that are past their SLA.')
+change_cli = AppGroup('changes', help='Maintain the change_events log behind /api/changes.')
+
+
+@rollup_cli.command('rebuild')
+@click.option('--company-id', type=int, default=None, help='Only rebuild this company.')
+def rebuild_rollups(company_id):
+    """
+    Recompute expense rollups from the raw expenses table
+    """
+    from services.rollup_service import RollupService
+    
+    try:
+        written = RollupService().rebuild(company_id=company_id)
+    except FileNotFoundError as e:
+        raise click.ClickException(f'{e} (is ARCHIVE_DIR set?)')
+    click.echo(f"✓ Rebuilt {written} rollup rows")
+
+
+@profiling_cli.command('sign')
+@click.argument('method')
+@click.argument('path')
+def sign_profile_header(method, path):
+    """
+    Print an X-Profile-Request header value for METHOD PATH (valid for 5 minutes)
+    """
+    from flask import current_app
+    from utils.profiling import PROFILE_HEADER, sign_profile_request
+    
+    secret = current_app.config.get('PROFILING_SECRET')
+    if not secret:
+        raise click.ClickException('PROFILING_SECRET is not set')
+    click.echo(f"{PROFILE_HEADER}: {sign_profile_request(secret, method, path)}")
+
+
+@notification_cli.command('dispatch')
+@click.option('--loop', is_flag=True, help='Keep polling the outbox instead of exiting when it is empty.')
+@click.option('--interval', type=float, default=5.0, show_default=True, help='Seconds between polls with --loop.')
+def dispatch_notifications(loop, interval):
+    """
+    Send due outbox notifications as per-recipient digests
+    """
+    from services.notification_service import NotificationDispatcher
+    
+    dispatcher = NotificationDispatcher()
+    if loop:
+        dispatcher.run_forever(interval=interval)
+        return
+    totals = dispatcher.dispatch_pending()
+    click.echo(f"✓ {totals['sent']} notifications sent in {totals['digests']} digests, "
+               f"{totals['retried']} scheduled for retry, {totals['failed']} failed")
+
+
+@notification_cli.command('prune')
+@click.option('--days', type=int, default=30, show_default=True, help='Keep sent notifications this many days.')
+def prune_notifications(days):
+    """
+    Delete delivered notifications older than --days
+    """
+    from services.notification_service import NotificationDispatcher
+    
+    deleted = NotificationDispatcher.prune(older_than_days=days)
+    click.echo(f"✓ Pruned {deleted} notifications")
+
+
+def _read_rate_rows(path, base):
+    """
+    Yield exchange_rates rows from a CSV file
+    
+    Long format: date,base,quote,rate (one pair per line).
+    Wide format (e.g. the ECB history file): Date,USD,JPY,... with --base.
+    """
+    import csv
+    from datetime import datetime
+    import os
+    
+    source = os.path.basename(path)
+    loaded_at = datetime.utcnow()
+    with open(path, newline='') as handle:
+        reader = csv.DictReader(handle)
+        fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+        date_field = fields.get('date') or fields.get('rate_date')
+        if not date_field:
+            raise click.ClickException(f'{path}: no date column')
+        
+        long_format = 'quote' in fields or 'quote_currency' in fields
+        if not long_format and not base:
+            raise click.ClickException(f'{path}: wide-format files need --base')
+        
+        for line in reader:
+            rate_date = datetime.strptime(line[date_field].strip(), '%Y-%m-%d').date()
+            if long_format:
+                value = line[fields.get('rate')].strip()
+                if value:
+                    yield {'rate_date': rate_date,
+                           'base_currency': line[fields.get('base') or fields['base_currency']].strip().upper(),
+                           'quote_currency': line[fields.get('quote') or fields['quote_currency']].strip().upper(),
+                           'rate': value, 'source': source, 'updated_at': loaded_at}
+                continue
+            for field in reader.fieldnames:
+                value = (line.get(field) or '').strip()
+                if field == date_field or not value or value.upper() == 'N/A':
+                    continue
+                yield {'rate_date': rate_date, 'base_currency': base.upper(),
+                       'quote_currency': field.strip().upper(), 'rate': value, 'source': source,
+                       'updated_at': loaded_at}
+
+
+@rates_cli.command('load')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--base', default=None, help='Base currency for wide-format files (one column per quote currency).')
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+def load_rates(paths, base, batch_size):
+    """
+    Bulk load historical exchange rates from CSV files (re-loading a day overwrites it)
+    """
+    from database import db
+    from models import ExchangeRate
+    from services.rate_history import rate_history
+    from utils.db_helpers import bulk_upsert
+    
+    keys = ['base_currency', 'quote_currency', 'rate_date']
+    total = 0
+    for path in paths:
+        batch = []
+        for row in _read_rate_rows(path, base):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                bulk_upsert(ExchangeRate, batch, keys, ['rate', 'source', 'updated_at'])
+                db.session.commit()
+                total += len(batch)
+                batch = []
+        bulk_upsert(ExchangeRate, batch, keys, ['rate', 'source', 'updated_at'])
+        db.session.commit()
+        total += len(batch)
+        click.echo(f"  {path}: loaded")
+    
+    rate_history.invalidate()
+    click.echo(f"✓ Loaded {total} exchange rates")
+
+
+@rates_cli.command('fetch')
+@click.option('--base', 'bases', multiple=True, default=['USD'], show_default=True,
+              help='Base currency to record (repeatable).')
+def fetch_rates(bases):
+    """
+    Record today's live rates so the history keeps growing (run daily)
+    """
+    from datetime import date, datetime
+    from database import db
+    from models import ExchangeRate
+    from services.currency_service import CurrencyService
+    from utils.db_helpers import bulk_upsert
+    
+    currency_service = CurrencyService()
+    fetched_at = datetime.utcnow()
+    total = 0
+    for base in bases:
+        rates = currency_service.get_exchange_rates(base.upper())
+        if not rates:
+            raise click.ClickException(f'Could not fetch rates for {base}')
+        rows = [
+            {'rate_date': date.today(), 'base_currency': base.upper(), 'quote_currency': quote,
+             'rate': rate, 'source': 'exchangerate-api', 'updated_at': fetched_at}
+            for quote, rate in rates.items() if quote != base.upper()
+        ]
+        bulk_upsert(ExchangeRate, rows, ['base_currency', 'quote_currency', 'rate_date'],
+                    ['rate', 'source', 'updated_at'])
+        total += len(rows)
+    db.session.commit()
+    click.echo(f"✓ Recorded {total} rates for {date.today().isoformat()}")
+
+
+@expense_cli.command('backfill-amounts')
+@click.option('--company-id', type=int, default=None, help='Only backfill this company.')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Rows per batch / transaction.')
+@click.option('--recompute', is_flag=True, help='Also recompute rows that already have a company amount.')
+def backfill_company_amounts(company_id, batch_size, recompute):
+    """
+    Fill amount_company_currency / exchange_rate on existing expenses
+    """
+    from services.company_amount_service import CompanyAmountService
+    
+    updated, skipped = CompanyAmountService().backfill(
+        company_id=company_id, batch_size=batch_size, recompute=recompute, log=click.echo
+    )
+    click.echo(f"✓ Backfilled {updated} expenses, {skipped} without a rate")
+
+
+@schema_cli.command('upgrade')
+def upgrade_schema_command():
+    """
+    Add tables, columns and indexes that are missing from the database
+    """
+    from database import db
+    from utils.schema import upgrade_schema
+    
+    changes = upgrade_schema(db, log=click.echo)
+    click.echo(f"✓ Schema up to date ({changes} changes applied)")
+
+
+@partition_cli.command('convert')
+@click.option('--strategy', type=click.Choice(['month', 'hash']), default='month', show_default=True,
+              help='Monthly RANGE on created_at, or HASH on company_id.')
+@click.option('--hash-modulus', type=int, default=8, show_default=True, help='Number of hash partitions.')
+@click.option('--keep-legacy', is_flag=True, help='Keep the original tables as <table>_legacy.')
+def convert_partitions(strategy, hash_modulus, keep_legacy):
+    """
+    Rewrite expenses and approval_steps as partitioned tables (one transaction)
+    """
+    from flask import current_app
+    from services.partition_service import PartitionService
+    
+    try:
+        converted = PartitionService().convert(
+            strategy=strategy, hash_modulus=hash_modulus, keep_legacy=keep_legacy,
+            months_ahead=current_app.config.get('PARTITION_MONTHS_AHEAD', 3), log=click.echo
+        )
+    except (RuntimeError, ValueError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"✓ Partitioned {len(converted)} tables")
+
+
+@partition_cli.command('maintain')
+@click.option('--months-ahead', type=int, default=None, help='Defaults to PARTITION_MONTHS_AHEAD.')
+@click.option('--retain-months', type=int, default=None, help='Defaults to PARTITION_RETENTION_MONTHS (0 = keep all).')
+def maintain_partitions(months_ahead, retain_months):
+    """
+    Create upcoming month partitions and detach ones past retention (run daily)
+    """
+    from flask import current_app
+    from services.partition_service import PartitionService
+    
+    if months_ahead is None:
+        months_ahead = current_app.config.get('PARTITION_MONTHS_AHEAD', 3)
+    if retain_months is None:
+        retain_months = current_app.config.get('PARTITION_RETENTION_MONTHS', 0)
+    try:
+        created, detached = PartitionService().maintain(months_ahead, retain_months, log=click.echo)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"✓ {len(created)} partitions created, {len(detached)} detached")
+
+
+@partition_cli.command('list')
+def list_partitions():
+    """
+    Show partitions with bounds and estimated row counts
+    """
+    from services.partition_service import PARTITIONED_TABLES, PartitionService
+    
+    service = PartitionService()
+    try:
+        for table in PARTITIONED_TABLES:
+            click.echo(f"{table}: {service.strategy(table) or 'not partitioned'}")
+            for partition in service.partitions(table):
+                click.echo(f"  {partition['name']:<32} {partition['rows']:>12,}  {partition['bounds']}")
+    except Exception as e:
+        raise click.ClickException(f'Partition listing needs PostgreSQL: {e}')
+
+
+@archive_cli.command('run')
+@click.option('--older-than-years', type=int, default=None, help='Defaults to ARCHIVE_AFTER_YEARS.')
+@click.option('--company-id', type=int, default=None, help='Only archive this company.')
+@click.option('--dry-run', is_flag=True, help='Report what would be archived without moving anything.')
+def run_archive(older_than_years, company_id, dry_run):
+    """
+    Move closed expenses and their approval steps to Parquet files
+    """
+    from flask import current_app
+    from services.archive_service import ArchiveService
+    
+    if older_than_years is None:
+        older_than_years = current_app.config.get('ARCHIVE_AFTER_YEARS', 2)
+    archived, months = ArchiveService().archive(
+        older_than_years, company_id=company_id, dry_run=dry_run, log=click.echo
+    )
+    verb = 'Would archive' if dry_run else 'Archived'
+    click.echo(f"✓ {verb} {archived} expenses in {months} company-months")
+
+
+@inbox_cli.command('reconcile')
+@click.option('--company-id', type=int, default=None, help='Only reconcile this company.')
+@click.option('--dry-run', is_flag=True, help='Report drift without fixing it.')
+def reconcile_inbox(company_id, dry_run):
+    """
+    Rebuild approval inbox items and counters from approval_steps where they drifted
+    """
+    from services.inbox_service import InboxService
+    
+    result = InboxService().reconcile(company_id=company_id, dry_run=dry_run, log=click.echo)
+    verb = 'Found' if dry_run else 'Fixed'
+    click.echo(f"✓ {verb} {result['added']} missing, {result['removed']} stale and {result['updated']} "
+               f"outdated items, {result['counters_fixed']} wrong counters")
+
+
+@sla_cli.command('sweep')
+@click.option('--loop', is_flag=True, help='Keep sweeping instead of exiting when nothing is overdue.')
+@click.option('--interval', type=float, default=60.0, show_default=True, help='Seconds between sweeps with --loop.')
+def sweep_sla(loop, interval):
+    """
+    Escalate pending approval steps that are past their due time
+    """
+    from services.sla_service import SlaService
+    
+    service = SlaService()
+    if loop:
+        service.run_forever(interval=interval)
+        return
+    totals = service.sweep()
+    click.echo(f"✓ {totals['escalated']} steps escalated, {totals['kept']} with nobody to escalate to, "
+               f"{totals['skipped']} skipped")
+
+
+@sla_cli.command('backfill')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Steps updated per transaction.')
+def backfill_sla(batch_size):
+    """
+    Give pending steps created before SLAs a due time
+    """
+    from services.sla_service import SlaService
+    
+    updated = SlaService().backfill(batch_size=batch_size, log=click.echo)
+    click.echo(f"✓ Set due_at on {updated} pending steps")
+
+
+@change_cli.command('compact')
+@click.option('--older-than-days', type=int, default=None,
+              help='Compact events older than this (default CHANGE_LOG_COMPACT_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Entities compacted per transaction.')
+def compact_changes(older_than_days, batch_size):
+    """
+    Fold each entity's old change events into one snapshot event
+    """
+    from services.change_log import ChangeLogService
+    
+    stats = ChangeLogService().compact(older_than_days=older_than_days, batch_size=batch_size, log=click.echo)
+    click.echo(f"✓ Compacted {stats['entities']} entities, removed {stats['removed']} events")
+
+
+@idempotency_cli.command('prune')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Keys deleted per transaction.')
+def prune_idempotency_keys(batch_size):
+    """
+    Delete idempotency keys past their TTL
+    """
+    from utils.idempotency import prune_expired_keys
+    
+    deleted = prune_expired_keys(batch_size=batch_size, log=click.echo)
+    click.echo(f"✓ Pruned {deleted} idempotency keys")
+
+
+@token_cli.command('prune')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Rows deleted per transaction.')
+def prune_revoked_tokens_command(batch_size):
+    """
+    Delete revocations of tokens that have expired anyway
+    """
+    from utils.token_revocation import prune_revoked_tokens
+    
+    deleted = prune_revoked_tokens(batch_size=batch_size, log=click.echo)
+    click.echo(f"✓ Pruned {deleted} revoked tokens")
+
+
+def register_commands(app):
+    """
+    Attach the management commands to the app's `flask` CLI
+    """
+    app.cli.add_command(rollup_cli)
+    app.cli.add_command(profiling_cli)
+    app.cli.add_command(notification_cli)
+    app.cli.add_command(rates_cli)
+    app.cli.add_command(expense_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(partition_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(token_cli)
+    app.cli.add_command(inbox_cli)
+    app.cli.add_command(sla_cli)
+    app.cli.add_command(change_cli)
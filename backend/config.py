@@ -1,16 +1,62 @@
+import json
 import os
 from datetime import timedelta
-from dotenv import load_dotenv  # <-- ADD THIS LINE
 
-# Load environment variables from .env file
-load_dotenv()  # <-- AND ADD THIS LINE
+# Load environment variables from .env file (python-dotenv is only imported when one exists)
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
+
+
+def engine_options(database_uri, threads_per_worker):
+    """
+    SQLAlchemy engine options sized for the worker model.
+    
+    Each worker process owns its own pool, and each worker thread holds at most
+    one connection at a time, so the steady-state pool matches the thread count.
+    Total connections per instance are roughly workers * (pool_size + max_overflow).
+    """
+    options = {
+        # Test connections on checkout so a DB failover doesn't surface as 500s
+        'pool_pre_ping': True,
+    }
+    
+    if database_uri.startswith('sqlite'):
+        return options
+    
+    options.update({
+        'pool_size': int(os.getenv("DB_POOL_SIZE", threads_per_worker)),
+        'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", max(2, threads_per_worker // 2))),
+        'pool_timeout': int(os.getenv("DB_POOL_TIMEOUT", 10)),
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    })
+    if database_uri.startswith('postgresql'):
+        options['connect_args'] = {'connect_timeout': int(os.getenv("DB_CONNECT_TIMEOUT", 5))}
+    return options
+
+
+def replica_binds(replica_urls, threads_per_worker):
+    """
+    SQLALCHEMY_BINDS entries for read replicas (replica_0, replica_1, ...),
+    each with its own pool sized like the primary's
+    """
+    return {
+        f'replica_{index}': dict(engine_options(url, threads_per_worker), url=url)
+        for index, url in enumerate(replica_urls)
+    }
+
 
 class Config:
     """Base configuration class with common settings"""
     
     # Flask Configuration
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
-    DEBUG = os.getenv("FLASK_DEBUG", "True").lower() == "true"
+    DEBUG = os.getenv("FLASK_DEBUG", "False").lower() == "true"
+    
+    # Worker Model (used by gunicorn.conf.py and the DB pool sizing below)
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", 2))
     
     # Database Configuration
     SQLALCHEMY_DATABASE_URI = os.getenv(
@@ -19,6 +65,16 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = os.getenv("SQLALCHEMY_ECHO", "False").lower() == "true"
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, WORKER_THREADS)
+    
+    # Read replicas for @use_replica routes (comma-separated URLs, one bind each).
+    # Clients that wrote within READ_AFTER_WRITE_SECONDS keep reading the primary.
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    SQLALCHEMY_BINDS = replica_binds(DATABASE_REPLICA_URLS, WORKER_THREADS)
+    READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", 5))
+    
+    # Readiness probe: /ready fails if the DB doesn't answer within this budget
+    READINESS_TIMEOUT_MS = int(os.getenv("READINESS_TIMEOUT_MS", 500))
     
     # JWT Configuration
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "jwt-secret-key-change-in-production")
@@ -27,6 +83,8 @@ class Config:
     JWT_TOKEN_LOCATION = ['headers']
     JWT_HEADER_NAME = 'Authorization'
     JWT_HEADER_TYPE = 'Bearer'
+    # How often each worker picks up tokens revoked by other workers
+    TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", 2))
     
     # CORS Configuration
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
@@ -41,10 +99,108 @@ class Config:
     EXCHANGERATE_API_URL = "https://api.exchangerate-api.com/v4/latest/"
     COUNTRIES_API_URL = "https://restcountries.com/v3.1/all?fields=name,currencies"
     
+    # Historical exchange rates (exchange_rates table, indexed in memory)
+    RATE_HISTORY_TTL_SECONDS = int(os.getenv("RATE_HISTORY_TTL_SECONDS", 300))  # How often to check for new rates
+    RATE_MAX_AGE_DAYS = int(os.getenv("RATE_MAX_AGE_DAYS", 7))  # Older stored rates fall back to the live API
+    RATE_PIVOT_CURRENCY = os.getenv("RATE_PIVOT_CURRENCY", "USD")  # Cross rates are derived through this currency
+    
     # OCR Configuration (for future implementation)
     OCR_ENABLED = os.getenv("OCR_ENABLED", "False").lower() == "true"
     TESSERACT_PATH = os.getenv("TESSERACT_PATH", "/usr/bin/tesseract")
     
+    # Metrics (/metrics in Prometheus text format)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    # Shared directory for multi-worker aggregation (required with gunicorn -w > 1)
+    METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 1.0))
+    
+    # On-demand profiling (see utils/profiling.py). Requests are profiled when they
+    # carry an X-Profile-Request header signed with PROFILING_SECRET, or at random
+    # with probability PROFILE_SAMPLE_RATE. Both are off by default.
+    PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+    PROFILER = os.getenv("PROFILER", "cprofile")  # cprofile or sampling
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+    PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 50))
+    # Store bound SQL parameters (user data) with each statement; off by default
+    PROFILE_CAPTURE_PARAMETERS = os.getenv("PROFILE_CAPTURE_PARAMETERS", "False").lower() == "true"
+    
+    # Live updates (/api/stream, Server-Sent Events). EVENT_BACKEND=postgres fans
+    # events out to every worker with LISTEN/NOTIFY; "local" only reaches
+    # streams served by the same process.
+    EVENT_BACKEND = os.getenv("EVENT_BACKEND", "local")
+    EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", 1000))  # Recent events kept for Last-Event-ID resume
+    STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 100))
+    STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+    # Streams end after this long and the browser reconnects, so each one only
+    # ties up a worker thread for a bounded time
+    STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", 300))
+    STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", 3000))
+    # Which routes this process serves: "api" (gunicorn.conf.py) answers
+    # /api/stream with 503 because streams run on their own server
+    # (gunicorn.stream.conf.py, role "stream") where an open stream cannot
+    # starve API requests of worker threads; "all" (flask run) serves both.
+    SERVER_ROLE = os.getenv("SERVER_ROLE", "all")
+    STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", 1))
+    STREAM_WORKER_THREADS = int(os.getenv("STREAM_WORKER_THREADS", 1000))  # Open streams per stream worker
+    
+    # Optional PostgreSQL partitioning of expenses/approval_steps
+    # (`flask partitions convert`, then `flask partitions maintain` daily)
+    PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))  # Month partitions created in advance
+    PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", 0))  # Detach older, fully archived months (0 = keep all)
+    # Default created_at window for expense lists/stats so month partitions are
+    # pruned; ?created_from= overrides it (0 = no default window)
+    HOT_QUERY_WINDOW_DAYS = int(os.getenv("HOT_QUERY_WINDOW_DAYS", 0))
+    
+    # Cold storage for closed expenses (`flask archive run`); needs pyarrow
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+    ARCHIVE_AFTER_YEARS = int(os.getenv("ARCHIVE_AFTER_YEARS", 2))  # Approved/rejected expenses older than this
+    ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+    
+    # Idempotency-Key support on expense submission and approval actions
+    IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))  # How long a key's response is replayed
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))  # Per-worker LRU of completed keys
+    # In-progress claims whose worker stopped sending heartbeats this long ago
+    # are abandoned; live requests refresh theirs every third of this
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))
+    
+    # Token-bucket rate limits, checked before any DB access or password hashing.
+    # Keys are endpoints ("auth.login") or blueprints ("auth"); scopes are "ip"
+    # and "account". RATE_LIMITS (JSON) replaces the defaults.
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+    RATE_LIMIT_STORAGE_URL = os.getenv("RATE_LIMIT_STORAGE_URL", "memory://")  # redis://host:6379/0 to share across workers
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 0))  # Proxies appending to X-Forwarded-For
+    RATE_LIMITS = json.loads(os.getenv("RATE_LIMITS", "null")) or {
+        'auth': {'ip': '300/minute'},
+        'auth.login': {'ip': '30/minute', 'account': '10/minute; burst=5'},
+        'auth.signup': {'ip': '10/hour; burst=5'},
+        'auth.refresh': {'ip': '60/minute'},
+        'auth.change_password': {'account': '5/minute'},
+        'auth.bulk_create_users': {'account': '30/hour; burst=10'},
+    }
+    
+    # Approval SLA: a pending step is due this long after it becomes pending
+    # (rules can override with sla_hours); `flask sla sweep` escalates overdue steps
+    APPROVAL_DUE_HOURS = int(os.getenv("APPROVAL_DUE_HOURS", 72))
+    SLA_SWEEP_BATCH_SIZE = int(os.getenv("SLA_SWEEP_BATCH_SIZE", 200))
+    SLA_MAX_ESCALATIONS = int(os.getenv("SLA_MAX_ESCALATIONS", 3))
+    
+    # Change log (change_events, written with every expense/step mutation) and
+    # /api/changes. The feed holds back events younger than the settle time so a
+    # slower concurrent transaction cannot commit a lower seq behind a client's cursor.
+    CHANGE_LOG_ENABLED = os.getenv("CHANGE_LOG_ENABLED", "True").lower() == "true"
+    CHANGE_FEED_SETTLE_SECONDS = float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", 5))
+    CHANGE_FEED_MAX_LIMIT = int(os.getenv("CHANGE_FEED_MAX_LIMIT", 1000))
+    CHANGE_LOG_COMPACT_AFTER_DAYS = int(os.getenv("CHANGE_LOG_COMPACT_AFTER_DAYS", 90))  # `flask changes compact`
+    
+    # POST /api/auth/users/bulk: rows per request and password-hashing processes
+    BULK_USERS_MAX_ROWS = int(os.getenv("BULK_USERS_MAX_ROWS", 5000))
+    BULK_HASH_WORKERS = int(os.getenv("BULK_HASH_WORKERS", 0)) or None  # Default: one per CPU
+    
+    # POST /api/batch: GET sub-requests per batch
+    BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 10))
+    
     # Pagination
     DEFAULT_PAGE_SIZE = 20
     MAX_PAGE_SIZE = 100
@@ -55,4 +211,13 @@ class Config:
     MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "True").lower() == "true"
     MAIL_USERNAME = os.getenv("MAIL_USERNAME", "")
     MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "")
-    MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER", "noreply@expense.com")
\ No newline at end of file
+    MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER", "noreply@expense.com")
+    MAIL_TIMEOUT = int(os.getenv("MAIL_TIMEOUT", 10))
+    
+    # Notification outbox (written with each approval transition, sent by
+    # `flask notifications dispatch`)
+    NOTIFICATIONS_ENABLED = os.getenv("NOTIFICATIONS_ENABLED", "True").lower() == "true"
+    NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 200))
+    NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 5))
+    NOTIFICATION_RETRY_BASE_SECONDS = int(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", 30))
+    NOTIFICATION_RETRY_MAX_SECONDS = int(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", 3600))
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+Gunicorn configuration for production serving
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Worker and thread counts come from Config (WEB_CONCURRENCY / WORKER_THREADS)
+so the SQLAlchemy pool in each worker is sized to match.
+
+These workers answer API requests only; /api/stream is served by a separate
+gunicorn.stream.conf.py server that the reverse proxy routes /api/stream to.
+"""
+import os
+import tempfile
+
+# Long-lived streams would hold this server's few worker threads
+os.environ.setdefault("SERVER_ROLE", "api")
+
+# Workers aggregate /metrics through a shared directory; default to one per master
+os.environ.setdefault(
+    "METRICS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), f"expense-metrics-{os.getpid()}")
+)
+
+from config import Config  # noqa: E402  (must read the environment set above)
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+
+workers = Config.WEB_CONCURRENCY
+threads = Config.WORKER_THREADS
+worker_class = "gthread" if threads > 1 else "sync"
+
+# The local event backend only reaches streams in the publishing process
+if Config.EVENT_BACKEND == "local":
+    if Config.SERVER_ROLE == "all" and workers > 1:
+        raise RuntimeError(
+            "EVENT_BACKEND=local cannot fan events out across workers: "
+            "set EVENT_BACKEND=postgres or WEB_CONCURRENCY=1"
+        )
+    if Config.SERVER_ROLE == "api":
+        print("Warning: EVENT_BACKEND=local does not reach the stream server; "
+              "set EVENT_BACKEND=postgres for live updates")
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = os.getenv("GUNICORN_ERROR_LOG", "-")
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def worker_exit(server, worker):
+    """
+    Write the exiting worker's final metrics snapshot
+    """
+    from utils.metrics import metrics
+    metrics.flush(force=True)
+
+
+def child_exit(server, worker):
+    """
+    Fold a dead worker's metrics into the shared archive (runs in the master)
+    """
+    from utils.metrics import metrics
+    metrics.configure(multiproc_dir=Config.METRICS_MULTIPROC_DIR or None)
+    metrics.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """
+    Drop any DB connections inherited from the master so each worker
+    opens its own pool (sockets must never be shared across processes)
+    """
+    from wsgi import app
+    from database import db
+    
+    with app.app_context():
+        db.engine.dispose(close=False)
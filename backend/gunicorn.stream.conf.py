@@ -0,0 +1,70 @@
+"""
+Gunicorn configuration for the Server-Sent Events server
+
+    gunicorn -c gunicorn.stream.conf.py wsgi:app
+
+Serves /api/stream next to the API server (gunicorn.conf.py); the reverse
+proxy routes /api/stream here with buffering off. A stream spends its life
+waiting on a queue and holds no DB connection, so each worker runs many
+threads (STREAM_WORKER_THREADS) without growing the SQLAlchemy pool.
+STREAM_WORKER_CLASS=gevent swaps threads for greenlets if gevent is installed.
+
+Events reach this server through EVENT_BACKEND=postgres (LISTEN/NOTIFY).
+"""
+import os
+
+os.environ["SERVER_ROLE"] = "stream"
+
+from config import Config  # noqa: E402  (must read the environment set above)
+
+if Config.EVENT_BACKEND != "postgres":
+    raise RuntimeError(
+        "The stream server only receives events published by the API server "
+        "through EVENT_BACKEND=postgres"
+    )
+
+bind = os.getenv("STREAM_BIND", f"0.0.0.0:{os.getenv('STREAM_PORT', 5001)}")
+
+workers = Config.STREAM_WORKERS
+worker_class = os.getenv("STREAM_WORKER_CLASS", "gthread")
+threads = Config.STREAM_WORKER_THREADS
+worker_connections = Config.STREAM_WORKER_THREADS
+
+preload_app = True
+
+# Let open streams run to STREAM_MAX_SECONDS when a worker restarts
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(Config.STREAM_MAX_SECONDS) + 5
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = os.getenv("GUNICORN_ERROR_LOG", "-")
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def worker_exit(server, worker):
+    """
+    Write the exiting worker's final metrics snapshot
+    """
+    from utils.metrics import metrics
+    metrics.flush(force=True)
+
+
+def child_exit(server, worker):
+    """
+    Fold a dead worker's metrics into the shared archive (runs in the master)
+    """
+    from utils.metrics import metrics
+    metrics.configure(multiproc_dir=Config.METRICS_MULTIPROC_DIR or None)
+    metrics.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """
+    Drop any DB connections inherited from the master (see gunicorn.conf.py)
+    """
+    from wsgi import app
+    from database import db
+    
+    with app.app_context():
+        db.engine.dispose(close=False)
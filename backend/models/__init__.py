@@ -2,6 +2,13 @@ from .user import User
 from .company import Company
 from .expense import Expense
 from .approval import ApprovalRule, ApprovalStep
+from .rollup import ExpenseRollup
+from .notification import NotificationOutbox
+from .exchange_rate import ExchangeRate
+from .archive import ArchivedExpense
+from .idempotency import IdempotencyKey
+from .revoked_token import RevokedToken
+from .inbox import ApprovalInboxItem, ApprovalInboxCounter
+from .change_event import ChangeEvent
 
-__all__ = ['User', 'Company', 'Expense', 'ApprovalRule', 'ApprovalStep']
-
+__all__ = ['User', 'Company', 'Expense', 'ApprovalRule', 'ApprovalStep', 'ExpenseRollup', 'NotificationOutbox', 'ExchangeRate', 'ArchivedExpense', 'IdempotencyKey', 'RevokedToken', 'ApprovalInboxItem', 'ApprovalInboxCounter', 'ChangeEvent']
@@ -1,4 +1,4 @@
-from app import db
+from database import db
 from datetime import datetime
 import json
 
@@ -30,6 +30,12 @@ class ApprovalRule(db.Model):
     # Category filter
     category = db.Column(db.String(50), nullable=True)
     
+    # SLA: a pending step of this rule is escalated after sla_hours
+    # (APPROVAL_DUE_HOURS when unset) to the approver's manager, falling
+    # back to escalation_user_id
+    sla_hours = db.Column(db.Integer, nullable=True)
+    escalation_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    
     is_active = db.Column(db.Boolean, default=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -47,6 +53,8 @@ class ApprovalRule(db.Model):
             'min_amount': float(self.min_amount) if self.min_amount else None,
             'max_amount': float(self.max_amount) if self.max_amount else None,
             'category': self.category,
+            'sla_hours': self.sla_hours,
+            'escalation_user_id': self.escalation_user_id,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
         }
@@ -57,6 +65,11 @@ class ApprovalRule(db.Model):
 
 class ApprovalStep(db.Model):
     __tablename__ = 'approval_steps'
+    __table_args__ = (
+        # The SLA sweeper only looks at pending steps, so only they are indexed
+        db.Index('ix_approval_steps_pending_due', 'due_at',
+                 postgresql_where=db.text("status = 'pending'"), sqlite_where=db.text("status = 'pending'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -73,6 +86,16 @@ class ApprovalStep(db.Model):
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, approved, rejected
     comments = db.Column(db.Text, nullable=True)
     
+    # Rule that created the step (not a foreign key: rules can be deleted)
+    rule_id = db.Column(db.Integer, nullable=True)
+    
+    # SLA: set whenever the step becomes pending; escalation hands the step
+    # to another approver and keeps the first one in original_approver_id
+    due_at = db.Column(db.DateTime, nullable=True)
+    escalated_at = db.Column(db.DateTime, nullable=True)
+    escalation_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    original_approver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     action_taken_at = db.Column(db.DateTime, nullable=True)
@@ -87,6 +110,9 @@ class ApprovalStep(db.Model):
             'step_order': self.step_order,
             'status': self.status,
             'comments': self.comments,
+            'due_at': self.due_at.isoformat() if self.due_at else None,
+            'escalated_at': self.escalated_at.isoformat() if self.escalated_at else None,
+            'original_approver_id': self.original_approver_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'action_taken_at': self.action_taken_at.isoformat() if self.action_taken_at else None,
         }
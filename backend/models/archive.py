@@ -0,0 +1,28 @@
+from database import db
+from datetime import datetime
+
+
+class ArchivedExpense(db.Model):
+    """
+    Tombstone for an expense moved to cold storage (`flask archive run`).
+    The full row and its approval steps live in the Parquet files under
+    ARCHIVE_DIR; this row only records where, so reads can go through.
+    """
+    __tablename__ = 'archived_expenses'
+    __table_args__ = (
+        db.Index('ix_archived_expenses_company_date', 'company_id', 'expense_date'),
+    )
+    
+    # Same id the expense had in the hot table
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    
+    company_id = db.Column(db.Integer, nullable=False)
+    employee_id = db.Column(db.Integer, nullable=False)
+    expense_date = db.Column(db.Date, nullable=False)
+    
+    # Directory relative to ARCHIVE_DIR, e.g. company_3/2021-04
+    archive_path = db.Column(db.String(255), nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedExpense {self.id} {self.archive_path}>'
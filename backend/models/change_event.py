@@ -0,0 +1,58 @@
+from database import db
+from datetime import datetime
+
+
+class ChangeEvent(db.Model):
+    """
+    Append-only log of expense and approval-step mutations.
+    
+    Rows are written in the same transaction as the change (see
+    services/change_log.py) and never updated, except that
+    `flask changes compact` folds an entity's old rows into one snapshot.
+    The id is the change-feed cursor.
+    """
+    __tablename__ = 'change_events'
+    __table_args__ = (
+        db.Index('ix_change_events_company_id', 'company_id', 'id'),
+        db.Index('ix_change_events_entity', 'entity', 'entity_id', 'id'),
+        db.Index('ix_change_events_created_at', 'created_at'),
+    )
+    
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    
+    company_id = db.Column(db.Integer, nullable=False)
+    
+    # expense or approval_step
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    
+    # Not foreign keys: the log outlives deleted expenses and users.
+    # employee_id and approver_id decide who may read the event.
+    expense_id = db.Column(db.Integer, nullable=False)
+    employee_id = db.Column(db.Integer, nullable=False)
+    approver_id = db.Column(db.Integer, nullable=True)
+    actor_id = db.Column(db.Integer, nullable=True)
+    
+    # create, update, delete, archived (moved to the Parquet archive), or
+    # snapshot (compacted creates/updates)
+    op = db.Column(db.String(10), nullable=False)
+    
+    # Changed columns with their new values (all columns on create)
+    changes = db.Column(db.JSON, nullable=True)
+    
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'seq': self.id,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'expense_id': self.expense_id,
+            'op': self.op,
+            'changes': self.changes,
+            'actor_id': self.actor_id,
+            'at': self.created_at.isoformat() if self.created_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.entity} {self.entity_id} {self.op}>'
@@ -1,8 +1,7 @@
-from database import db  # <-- CHANGE THIS LINE
+from database import db
 from datetime import datetime
 
 class Company(db.Model):
-    # ... (the rest of the file is unchanged)
     __tablename__ = 'companies'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -10,13 +9,16 @@ class Company(db.Model):
     country = db.Column(db.String(100), nullable=False)
     currency = db.Column(db.String(10), nullable=False)
     
+    # Bumped whenever the company's users or reporting lines change
+    org_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     users = db.relationship('User', back_populates='company', cascade='all, delete-orphan')
     expenses = db.relationship('Expense', back_populates='company', cascade='all, delete-orphan')
     approval_rules = db.relationship('ApprovalRule', back_populates='company', cascade='all, delete-orphan')
-
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,40 @@
+from database import db
+from datetime import datetime
+
+
+class ExchangeRate(db.Model):
+    """
+    Historical exchange rate: one unit of base_currency buys `rate` units of
+    quote_currency on rate_date. Loaded in bulk (`flask rates load`) or recorded
+    daily from the live API (`flask rates fetch`).
+    """
+    __tablename__ = 'exchange_rates'
+    __table_args__ = (
+        # Column order matches the lookup pattern (pair first, then date)
+        db.UniqueConstraint('base_currency', 'quote_currency', 'rate_date', name='uq_exchange_rates_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    rate_date = db.Column(db.Date, nullable=False)
+    base_currency = db.Column(db.String(10), nullable=False)
+    quote_currency = db.Column(db.String(10), nullable=False)
+    rate = db.Column(db.Numeric(18, 8), nullable=False)
+    
+    source = db.Column(db.String(50), nullable=True)  # csv file name, exchangerate-api, ...
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set by every load/fetch, including rows it overwrites, so the in-memory
+    # rate index (services/rate_history.py) notices updated rates
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'rate_date': self.rate_date.isoformat() if self.rate_date else None,
+            'base_currency': self.base_currency,
+            'quote_currency': self.quote_currency,
+            'rate': float(self.rate),
+            'source': self.source,
+        }
+    
+    def __repr__(self):
+        return f'<ExchangeRate {self.rate_date} {self.base_currency}/{self.quote_currency} {self.rate}>'
@@ -1,8 +1,11 @@
-from app import db
+from database import db
 from datetime import datetime
 
 class Expense(db.Model):
     __tablename__ = 'expenses'
+    __table_args__ = (
+        db.Index('ix_expenses_company_amount', 'company_id', 'amount_company_currency'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -17,6 +20,11 @@ class Expense(db.Model):
     # Expense details
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     original_currency = db.Column(db.String(10), nullable=False)  # Currency of the expense
+    
+    # Amount in the company currency at the rate in effect on expense_date,
+    # stored so totals, sorts and range filters run in SQL (NULL until converted)
+    exchange_rate = db.Column(db.Numeric(18, 8), nullable=True)
+    amount_company_currency = db.Column(db.Numeric(14, 2), nullable=True)
     category = db.Column(db.String(50), nullable=False)  # Travel, Food, Office Supplies, etc.
     description = db.Column(db.Text, nullable=True)
     expense_date = db.Column(db.Date, nullable=False)
@@ -47,6 +55,8 @@ class Expense(db.Model):
             'company_id': self.company_id,
             'amount': float(self.amount),
             'original_currency': self.original_currency,
+            'amount_company_currency': float(self.amount_company_currency) if self.amount_company_currency is not None else None,
+            'exchange_rate': float(self.exchange_rate) if self.exchange_rate is not None else None,
             'category': self.category,
             'description': self.description,
             'expense_date': self.expense_date.isoformat() if self.expense_date else None,
@@ -0,0 +1,36 @@
+from database import db
+from datetime import datetime
+
+
+class IdempotencyKey(db.Model):
+    """
+    Outcome of a request sent with an Idempotency-Key header (see
+    utils/idempotency.py). The unique (user_id, key) index is what stops two
+    concurrent retries from both executing.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+        db.Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    
+    # SHA-256 of method, path and body; a reused key with a different request is rejected
+    request_hash = db.Column(db.String(64), nullable=False)
+    
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, applied (route committed), completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Refreshed by the worker running the request; a stale one means it died
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key} {self.status}>'
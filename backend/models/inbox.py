@@ -0,0 +1,72 @@
+from database import db
+from datetime import datetime
+
+
+class ApprovalInboxItem(db.Model):
+    """
+    One pending approval step of a pending expense, denormalized so an
+    approver's inbox is a single index range read. Maintained by
+    InboxService in the same transaction as the step transition.
+    """
+    __tablename__ = 'approval_inbox_items'
+    __table_args__ = (
+        db.Index('ix_approval_inbox_items_approver_due', 'approver_id', 'due_at'),
+        db.Index('ix_approval_inbox_items_expense', 'expense_id'),
+    )
+    
+    # Same id as the approval step
+    step_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    
+    approver_id = db.Column(db.Integer, nullable=False)
+    company_id = db.Column(db.Integer, nullable=False)
+    expense_id = db.Column(db.Integer, nullable=False)
+    step_order = db.Column(db.Integer, nullable=False)
+    
+    # Copied from the expense and its employee
+    employee_id = db.Column(db.Integer, nullable=False)
+    employee_name = db.Column(db.String(100), nullable=True)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    original_currency = db.Column(db.String(10), nullable=False)
+    amount_company_currency = db.Column(db.Numeric(14, 2), nullable=True)
+    category = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    expense_date = db.Column(db.Date, nullable=False)
+    
+    pending_since = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    due_at = db.Column(db.DateTime, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'step_id': self.step_id,
+            'expense_id': self.expense_id,
+            'step_order': self.step_order,
+            'employee_id': self.employee_id,
+            'employee_name': self.employee_name,
+            'amount': float(self.amount),
+            'original_currency': self.original_currency,
+            'amount_company_currency': (float(self.amount_company_currency)
+                                        if self.amount_company_currency is not None else None),
+            'category': self.category,
+            'description': self.description,
+            'expense_date': self.expense_date.isoformat() if self.expense_date else None,
+            'pending_since': self.pending_since.isoformat() if self.pending_since else None,
+            'due_at': self.due_at.isoformat() if self.due_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<ApprovalInboxItem step={self.step_id} approver={self.approver_id}>'
+
+
+class ApprovalInboxCounter(db.Model):
+    """
+    Number of inbox items per approver and due date. Pending, overdue and
+    due-today badges sum an approver's few rows (a primary-key range read).
+    """
+    __tablename__ = 'approval_inbox_counters'
+    
+    approver_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    due_date = db.Column(db.Date, primary_key=True)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ApprovalInboxCounter {self.approver_id} {self.due_date}: {self.pending_count}>'
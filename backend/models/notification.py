@@ -0,0 +1,58 @@
+from database import db
+from datetime import datetime
+
+
+class NotificationOutbox(db.Model):
+    """
+    Transactional outbox for e-mail notifications.
+    
+    Rows are added in the same flush as the approval step or expense change
+    that caused them (see services/notification_service.py), so a notification
+    exists if and only if the change was committed. The dispatcher drains
+    pending rows and sends them as per-recipient digests.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        db.Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    
+    # approval_requested, expense_approved, expense_rejected
+    event_type = db.Column(db.String(40), nullable=False)
+    
+    # Not a foreign key: the notification outlives a deleted expense
+    expense_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.JSON, nullable=True)
+    
+    # Delivery state
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    recipient = db.relationship('User')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'recipient_id': self.recipient_id,
+            'event_type': self.event_type,
+            'expense_id': self.expense_id,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} {self.event_type} -> {self.recipient_id} ({self.status})>'
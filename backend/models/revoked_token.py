@@ -0,0 +1,29 @@
+from database import db
+from datetime import datetime
+
+
+class RevokedToken(db.Model):
+    """
+    A revoked JWT (jti set) or, for password and role changes, every token a
+    user was issued before revoked_at (jti NULL). Workers keep an in-memory
+    copy (utils/token_revocation.py) and follow new rows by id.
+    """
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = (
+        db.Index('ix_revoked_tokens_revoked_at', 'revoked_at'),
+        db.Index('ix_revoked_tokens_expires_at', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    jti = db.Column(db.String(36), nullable=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)  # access, refresh, all
+    reason = db.Column(db.String(30), nullable=True)  # logout, password_change, role_change
+    
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # When the revoked token(s) would have expired anyway; the row can go then
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<RevokedToken {self.jti or "all"} user={self.user_id}>'
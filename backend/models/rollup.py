@@ -0,0 +1,45 @@
+from database import db
+from datetime import datetime
+
+
+class ExpenseRollup(db.Model):
+    """
+    Pre-aggregated expense totals per (company, month, category, employee, status).
+    Amounts are stored in the company currency so dashboards can sum them directly.
+    """
+    __tablename__ = 'expense_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'month', 'category', 'employee_id', 'status',
+                            name='uq_expense_rollups_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # First day of the expense month
+    category = db.Column(db.String(50), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    
+    # Aggregates
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # In company currency
+    # Expenses counted above whose amount could not be converted (left out of total_amount)
+    unconverted_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'company_id': self.company_id,
+            'month': self.month.strftime('%Y-%m') if self.month else None,
+            'category': self.category,
+            'employee_id': self.employee_id,
+            'status': self.status,
+            'expense_count': self.expense_count,
+            'total_amount': float(self.total_amount or 0),
+            'unconverted_count': self.unconverted_count or 0,
+        }
+    
+    def __repr__(self):
+        return f'<ExpenseRollup {self.company_id} {self.month} {self.category} {self.status}>'
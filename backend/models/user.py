@@ -1,9 +1,8 @@
-from database import db  # <-- CHANGE THIS LINE
+from database import db
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class User(db.Model):
-    # ... (the rest of the file is unchanged)
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -31,7 +30,7 @@ class User(db.Model):
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
-
+    
     def to_dict(self, include_company=False):
         data = {
             'id': self.id,
@@ -46,3 +45,10 @@ class User(db.Model):
         if include_company and self.company:
             data['company'] = self.company.to_dict()
         return data
+
+
+# Prefix search for approver pickers: lower(name) LIKE 'ab%' within a company
+db.Index('ix_users_company_name_lower', User.company_id, db.func.lower(User.full_name).label('name_lower'),
+         postgresql_ops={'name_lower': 'text_pattern_ops'})
+db.Index('ix_users_company_email_lower', User.company_id, db.func.lower(User.email).label('email_lower'),
+         postgresql_ops={'email_lower': 'text_pattern_ops'})
@@ -0,0 +1,222 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from database import db
+from models import User, ExpenseRollup
+from datetime import datetime
+from utils.query_budget import query_budget
+from utils.replica import use_replica
+
+analytics_bp = Blueprint('analytics', __name__)
+_analytics_service = None
+
+GROUP_COLUMNS = {
+    'category': ExpenseRollup.category,
+    'employee': ExpenseRollup.employee_id,
+    'status': ExpenseRollup.status,
+}
+
+
+def get_analytics_service():
+    """
+    Shared AnalyticsService, created on first use so NumPy is not imported at startup
+    """
+    global _analytics_service
+    if _analytics_service is None:
+        from services.analytics_service import AnalyticsService
+        _analytics_service = AnalyticsService()
+    return _analytics_service
+
+
+def _parse_month(value):
+    """
+    Parse a YYYY-MM query parameter into the first day of that month
+    """
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def _scoped_rollups(user, columns):
+    """
+    Build a rollup query limited to what the user is allowed to see,
+    applying the common from/to/status query parameters
+    """
+    query = db.session.query(*columns).filter(ExpenseRollup.company_id == user.company_id)
+    
+    if user.role == 'manager':
+        subordinate_ids = [sub.id for sub in user.subordinates]
+        query = query.filter(ExpenseRollup.employee_id.in_(subordinate_ids + [user.id]))
+    elif user.role != 'admin':
+        query = query.filter(ExpenseRollup.employee_id == user.id)
+    
+    if request.args.get('from'):
+        query = query.filter(ExpenseRollup.month >= _parse_month(request.args['from']))
+    if request.args.get('to'):
+        query = query.filter(ExpenseRollup.month <= _parse_month(request.args['to']))
+    if request.args.get('status'):
+        query = query.filter(ExpenseRollup.status == request.args['status'])
+    
+    return query
+
+
+@analytics_bp.route('/monthly', methods=['GET'])
+@query_budget(3)
+@use_replica
+@jwt_required()
+def get_monthly_spend():
+    """
+    Monthly spend in company currency grouped by category, employee or status.
+    Reads only the pre-aggregated rollup table.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        group_by = request.args.get('group_by', 'category')
+        if group_by not in GROUP_COLUMNS:
+            return jsonify({'error': 'Invalid group_by. Must be: category, employee, or status'}), 400
+        
+        try:
+            group_column = GROUP_COLUMNS[group_by]
+            query = _scoped_rollups(user, [
+                ExpenseRollup.month,
+                group_column,
+                db.func.sum(ExpenseRollup.expense_count),
+                db.func.sum(ExpenseRollup.total_amount),
+                db.func.sum(ExpenseRollup.unconverted_count)
+            ])
+        except ValueError:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+        
+        rows = query.group_by(ExpenseRollup.month, group_column).order_by(ExpenseRollup.month).all()
+        
+        return jsonify({
+            'group_by': group_by,
+            'currency': user.company.currency,
+            'rows': [
+                {
+                    'month': month.strftime('%Y-%m'),
+                    'key': key,
+                    'count': int(count or 0),
+                    'total_amount': float(total or 0),
+                    'unconverted': int(unconverted or 0)
+                }
+                for month, key, count, total, unconverted in rows
+                if count
+            ]
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@analytics_bp.route('/summary', methods=['GET'])
+@query_budget(4)
+@use_replica
+@jwt_required()
+def get_spend_summary():
+    """
+    Count and total spend per status over the requested month range
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        try:
+            query = _scoped_rollups(user, [
+                ExpenseRollup.status,
+                db.func.sum(ExpenseRollup.expense_count),
+                db.func.sum(ExpenseRollup.total_amount),
+                db.func.sum(ExpenseRollup.unconverted_count)
+            ])
+        except ValueError:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+        
+        # Expenses without an exchange rate are counted but left out of the amounts
+        summary = {'total': 0, 'total_amount': 0.0, 'unconverted': 0}
+        for status, count, total, unconverted in query.group_by(ExpenseRollup.status).all():
+            summary[status] = {'count': int(count or 0), 'total_amount': float(total or 0),
+                               'unconverted': int(unconverted or 0)}
+            summary['total'] += int(count or 0)
+            summary['total_amount'] += float(total or 0)
+            summary['unconverted'] += int(unconverted or 0)
+        
+        summary['currency'] = user.company.currency
+        
+        return jsonify({'summary': summary}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@analytics_bp.route('/trends', methods=['GET'])
+@query_budget(4)
+@use_replica
+@jwt_required()
+def get_spend_trends():
+    """
+    Daily spend with rolling 30/90-day totals in company currency
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        last_days = min(int(request.args.get('days', 365)), 3650)
+        
+        return jsonify({
+            'trends': get_analytics_service().spend_trends(user.company, last_days=last_days)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@analytics_bp.route('/outliers', methods=['GET'])
+@query_budget(4)
+@use_replica
+@jwt_required()
+def get_spend_outliers():
+    """
+    Expenses whose amount is unusual for the submitting employee (z-score)
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        threshold = float(request.args.get('z', 3.0))
+        min_samples = int(request.args.get('min_samples', 5))
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        
+        return jsonify(get_analytics_service().outliers(
+            user.company, threshold=threshold, min_samples=min_samples, limit=limit
+        )), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@analytics_bp.route('/category-mix', methods=['GET'])
+@query_budget(4)
+@use_replica
+@jwt_required()
+def get_category_mix():
+    """
+    Monthly spend per category and its share of the month's total
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        return jsonify({
+            'category_mix': get_analytics_service().category_mix(user.company)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,12 +1,28 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
+from database import db
 from models import User, Expense, ApprovalStep, ApprovalRule
 from datetime import datetime
+from sqlalchemy.orm import joinedload
+from services.currency_service import CurrencyService
+from services.expense_queries import load_expense_with_approvals
+from services.rollup_service import RollupService
+from services.inbox_service import InboxService
+from services.sla_service import SlaService
+from utils.query_budget import query_budget
+from utils.idempotency import idempotent
+from utils.replica import use_replica
+from utils.query_window import created_range, filter_created
 
 approval_bp = Blueprint('approval', __name__)
+currency_service = CurrencyService()
+rollup_service = RollupService()
+inbox_service = InboxService()
+sla_service = SlaService()
 
 @approval_bp.route('/pending', methods=['GET'])
+@query_budget(5)
+@use_replica
 @jwt_required()
 def get_pending_approvals():
     """
@@ -20,10 +36,19 @@ def get_pending_approvals():
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
         
+        # Pending steps can be old, so only an explicit range is applied here
+        try:
+            created_from, created_to = created_range(request.args, use_default_window=False)
+        except ValueError:
+            return jsonify({'error': 'Invalid created_from/created_to. Use YYYY-MM-DD'}), 400
+        
         # Find approval steps where user is approver and status is pending
-        approval_steps = ApprovalStep.query.filter_by(
+        approval_steps = filter_created(ApprovalStep.query.filter_by(
             approver_id=user.id,
             status='pending'
+        ), ApprovalStep.created_at, created_from, created_to).options(
+            joinedload(ApprovalStep.expense).joinedload(Expense.employee),
+            joinedload(ApprovalStep.approver)
         ).order_by(ApprovalStep.created_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
@@ -36,13 +61,14 @@ def get_pending_approvals():
             
             # Convert to company currency
             if expense.original_currency != user.company.currency:
-                from services.currency_service import CurrencyService
-                currency_service = CurrencyService()
-                expense_dict['converted_amount'] = currency_service.convert(
-                    expense.amount,
-                    expense.original_currency,
-                    user.company.currency
-                )
+                expense_dict['converted_amount'] = expense_dict['amount_company_currency']
+                if expense_dict['converted_amount'] is None:
+                    expense_dict['converted_amount'] = currency_service.convert(
+                        expense.amount,
+                        expense.original_currency,
+                        user.company.currency,
+                        on_date=expense.expense_date
+                    )
                 expense_dict['company_currency'] = user.company.currency
             
             expenses_data.append(expense_dict)
@@ -53,13 +79,64 @@ def get_pending_approvals():
             'page': page,
             'pages': approval_steps.pages
         }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@approval_bp.route('/inbox', methods=['GET'])
+@query_budget(2)
+@use_replica
+@jwt_required()
+def get_inbox():
+    """
+    Current user's approval inbox (pending steps of pending expenses), most
+    urgent first, with its badge counts. ?overdue=true lists overdue items only.
+    """
+    try:
+        user_id = get_jwt_identity()
+        
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+        overdue_only = request.args.get('overdue', 'false').lower() == 'true'
         
+        counts = inbox_service.counts(user_id)
+        items = inbox_service.items(user_id, limit=per_page, offset=(page - 1) * per_page, overdue_only=overdue_only)
+        total = counts['overdue'] if overdue_only else counts['pending']
+        
+        return jsonify({
+            'items': [item.to_dict() for item in items],
+            'counts': counts,
+            'total': total,
+            'page': page,
+            'pages': (total + per_page - 1) // per_page
+        }), 200
+    
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@approval_bp.route('/inbox/counts', methods=['GET'])
+@query_budget(1)
+@use_replica
+@jwt_required()
+def get_inbox_counts():
+    """
+    Badge counts for the current user: pending, overdue and due_today
+    """
+    try:
+        return jsonify(inbox_service.counts(get_jwt_identity())), 200
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @approval_bp.route('/<int:expense_id>/approve', methods=['POST'])
+@query_budget(20)
 @jwt_required()
+@idempotent
 def approve_expense(expense_id):
     """
     Approve an expense
@@ -68,7 +145,8 @@ def approve_expense(expense_id):
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        expense = Expense.query.get(expense_id)
+        # Row lock: concurrent transitions of one expense run one after another
+        expense = Expense.query.filter_by(id=expense_id).with_for_update().first()
         if not expense:
             return jsonify({'error': 'Expense not found'}), 404
         
@@ -89,6 +167,9 @@ def approve_expense(expense_id):
         if not approval_step:
             return jsonify({'error': 'No pending approval found for this user'}), 400
         
+        rollup_before = rollup_service.snapshot(expense)
+        activated = []  # Steps that become pending with this approval
+        
         # Mark this step as approved
         approval_step.status = 'approved'
         approval_step.comments = comments
@@ -110,6 +191,7 @@ def approve_expense(expense_id):
             if next_step:
                 next_step.status = 'pending'
                 expense.current_approval_step = next_step.step_order
+                activated.append(next_step)
             else:
                 # No more steps, approve expense
                 expense.status = 'approved'
@@ -138,6 +220,7 @@ def approve_expense(expense_id):
                     ).first()
                     if next_step:
                         next_step.status = 'pending'
+                        activated.append(next_step)
                     else:
                         expense.status = 'approved'
         else:
@@ -145,20 +228,32 @@ def approve_expense(expense_id):
             if all(step.status == 'approved' for step in all_steps):
                 expense.status = 'approved'
         
+        # Keep the approvers' inboxes in the same transaction
+        if expense.status == 'pending':
+            sla_service.start(activated)
+            inbox_service.remove_steps([approval_step.id])
+            inbox_service.add_steps(expense, activated)
+        else:
+            inbox_service.remove_expense(expense.id)
+        
+        rollup_service.apply_change(rollup_before, rollup_service.snapshot(expense))
         db.session.commit()
+        expense = load_expense_with_approvals(expense_id)
         
         return jsonify({
             'message': 'Expense approved successfully',
             'expense': expense.to_dict(include_approvals=True)
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @approval_bp.route('/<int:expense_id>/reject', methods=['POST'])
+@query_budget(17)
 @jwt_required()
+@idempotent
 def reject_expense(expense_id):
     """
     Reject an expense
@@ -167,7 +262,7 @@ def reject_expense(expense_id):
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        expense = Expense.query.get(expense_id)
+        expense = Expense.query.filter_by(id=expense_id).with_for_update().first()
         if not expense:
             return jsonify({'error': 'Expense not found'}), 404
         
@@ -190,6 +285,8 @@ def reject_expense(expense_id):
         if not approval_step:
             return jsonify({'error': 'No pending approval found for this user'}), 400
         
+        rollup_before = rollup_service.snapshot(expense)
+        
         # Mark as rejected
         approval_step.status = 'rejected'
         approval_step.comments = comments
@@ -197,20 +294,25 @@ def reject_expense(expense_id):
         
         # Reject the entire expense
         expense.status = 'rejected'
+        inbox_service.remove_expense(expense.id)
         
+        rollup_service.apply_change(rollup_before, rollup_service.snapshot(expense))
         db.session.commit()
+        expense = load_expense_with_approvals(expense_id)
         
         return jsonify({
             'message': 'Expense rejected successfully',
             'expense': expense.to_dict(include_approvals=True)
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @approval_bp.route('/history', methods=['GET'])
+@query_budget(4)
+@use_replica
 @jwt_required()
 def get_approval_history():
     """
@@ -226,6 +328,9 @@ def get_approval_history():
             approver_id=user_id
         ).filter(
             ApprovalStep.status.in_(['approved', 'rejected'])
+        ).options(
+            joinedload(ApprovalStep.expense).joinedload(Expense.employee),
+            joinedload(ApprovalStep.approver)
         ).order_by(ApprovalStep.action_taken_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
@@ -242,7 +347,7 @@ def get_approval_history():
             'page': page,
             'pages': approval_steps.pages
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -254,7 +359,7 @@ def _get_applicable_rule(expense):
     rules = ApprovalRule.query.filter_by(
         company_id=expense.company_id,
         is_active=True
-    ).all()
+    ).order_by(ApprovalRule.id).all()
     
     for rule in rules:
         if rule.min_amount and expense.amount < rule.min_amount:
@@ -291,7 +396,8 @@ def _check_conditional_approval(expense, rule):
     
     # Check specific approver rule
     if 'specific_approvers' in conditions:
-        approved_ids = [step.approver_id for step in approved_steps]
+        # An escalated step still stands for the approver the rule named
+        approved_ids = [step.original_approver_id or step.approver_id for step in approved_steps]
         for approver_id in conditions['specific_approvers']:
             if approver_id in approved_ids:
                 if conditions.get('operator') == 'OR':
@@ -1,14 +1,24 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
-from database import db  # <-- CHANGE THIS LINE
+from flask import Blueprint, Response, current_app, request, jsonify
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token, get_jwt, get_jwt_identity, jwt_required
+from database import db
 from models import User, Company
+from services.inbox_service import InboxService
+from services.org_chart_service import OrgChartService
+from services.user_provisioning import ProvisioningError, UserProvisioningService
 from datetime import datetime
-import requests
+from sqlalchemy.exc import IntegrityError
+from utils.metrics import time_http_call
+from utils.query_budget import query_budget
+from utils.replica import use_replica
+from utils.token_revocation import revoke_token, revoke_user_tokens
 
-# ... (the rest of the file is unchanged)
 auth_bp = Blueprint('auth', __name__)
+user_provisioning_service = UserProvisioningService()
+inbox_service = InboxService()
+org_chart_service = OrgChartService()
 
 @auth_bp.route('/signup', methods=['POST'])
+@query_budget(5)
 def signup():
     """
     Register a new user and create company on first signup
@@ -27,10 +37,13 @@ def signup():
             return jsonify({'error': 'Email already registered'}), 400
         
         # Get currency for the country
+        import requests  # Deferred: only signup needs an HTTP client
+        
         currency = 'USD' # Default
         try:
-            response = requests.get('https://restcountries.com/v3.1/all?fields=name,currencies', timeout=5)
-            response.raise_for_status()
+            with time_http_call('restcountries'):
+                response = requests.get('https://restcountries.com/v3.1/all?fields=name,currencies', timeout=5)
+                response.raise_for_status()
             countries = response.json()
             
             for country in countries:
@@ -75,7 +88,7 @@ def signup():
             'access_token': access_token,
             'refresh_token': refresh_token
         }), 201
-        
+    
     except Exception as e:
         db.session.rollback()
         # It's good practice to log the actual error for debugging
@@ -84,6 +97,7 @@ def signup():
 
 
 @auth_bp.route('/login', methods=['POST'])
+@query_budget(2)
 def login():
     """
     Login user and return JWT tokens
@@ -111,12 +125,14 @@ def login():
             'access_token': access_token,
             'refresh_token': refresh_token
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @auth_bp.route('/me', methods=['GET'])
+@query_budget(2)
+@use_replica
 @jwt_required()
 def get_current_user():
     """
@@ -132,12 +148,13 @@ def get_current_user():
         return jsonify({
             'user': user.to_dict(include_company=True)
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @auth_bp.route('/refresh', methods=['POST'])
+@query_budget(0)
 @jwt_required(refresh=True)
 def refresh():
     """
@@ -150,12 +167,84 @@ def refresh():
         return jsonify({
             'access_token': access_token
         }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/logout', methods=['POST'])
+@query_budget(3)
+@jwt_required(verify_type=False)
+def logout():
+    """
+    Revoke the presented token (access or refresh). Include "refresh_token"
+    in the body to revoke it as well, or "all": true to end every session.
+    """
+    try:
+        token = get_jwt()
+        data = request.get_json(silent=True) or {}
+        
+        if data.get('all'):
+            revoke_user_tokens(int(token['sub']), reason='logout')
+        else:
+            revoke_token(token)
+            if data.get('refresh_token'):
+                try:
+                    refresh_token = decode_token(data['refresh_token'])
+                except Exception:
+                    return jsonify({'error': 'Invalid refresh token'}), 400
+                if refresh_token.get('type') != 'refresh' or str(refresh_token['sub']) != str(token['sub']):
+                    return jsonify({'error': 'Invalid refresh token'}), 400
+                revoke_token(refresh_token)
+        
+        db.session.commit()
+        
+        return jsonify({'message': 'Logged out'}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/change-password', methods=['POST'])
+@query_budget(3)
+@jwt_required()
+def change_password():
+    """
+    Change the current user's password. Every token issued before the change
+    is revoked; the response carries a fresh pair.
+    """
+    try:
+        data = request.get_json() or {}
+        
+        if not data.get('current_password') or not data.get('new_password'):
+            return jsonify({'error': 'current_password and new_password are required'}), 400
         
+        user = User.query.get(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not user.check_password(data['current_password']):
+            return jsonify({'error': 'Current password is incorrect'}), 401
+        
+        user.set_password(data['new_password'])
+        user.updated_at = datetime.utcnow()
+        revoke_user_tokens(user.id, reason='password_change')
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Password changed',
+            'access_token': create_access_token(identity=get_jwt_identity()),
+            'refresh_token': create_refresh_token(identity=get_jwt_identity())
+        }), 200
+    
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @auth_bp.route('/users', methods=['POST'])
+@query_budget(5)
 @jwt_required()
 def create_user():
     """
@@ -197,19 +286,83 @@ def create_user():
         user.set_password(data['password'])
         
         db.session.add(user)
+        org_chart_service.bump_version(current_user.company_id)
         db.session.commit()
         
         return jsonify({
             'message': 'User created successfully',
             'user': user.to_dict()
         }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/users/bulk', methods=['POST'])
+@query_budget(9, max_repeats=6)
+@jwt_required()
+def bulk_create_users():
+    """
+    Admin creates many users at once, all or nothing.
+    
+    Accepts JSON ({"users": [...]}) or CSV (text/csv body or a "file" upload)
+    with columns email, full_name, role, password, manager_email and
+    is_manager_approver. Rows without a password get a temporary one, returned
+    in the response. ?dry_run=true only validates.
+    """
+    try:
+        current_user = User.query.get(get_jwt_identity())
         
+        # Only admins can create users
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        upload = request.files.get('file')
+        if upload is not None:
+            rows = user_provisioning_service.parse_csv(upload.read().decode('utf-8-sig'))
+        elif request.mimetype == 'text/csv':
+            rows = user_provisioning_service.parse_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            rows = data.get('users') if isinstance(data, dict) else data
+            if not isinstance(rows, list):
+                return jsonify({'error': 'Expected a JSON list of users, {"users": [...]}, or CSV'}), 400
+        
+        if not rows:
+            return jsonify({'error': 'No users to create'}), 400
+        max_rows = current_app.config.get('BULK_USERS_MAX_ROWS', 5000)
+        if len(rows) > max_rows:
+            return jsonify({'error': f'At most {max_rows} users per request'}), 400
+        
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        users = user_provisioning_service.provision(current_user.company_id, rows, dry_run=dry_run)
+        if dry_run:
+            return jsonify({'message': f'{len(users)} users would be created', 'users': users}), 200
+        
+        org_chart_service.bump_version(current_user.company_id)
+        db.session.commit()
+        
+        return jsonify({
+            'message': f'{len(users)} users created successfully',
+            'users': users
+        }), 201
+    
+    except ProvisioningError as e:
+        db.session.rollback()
+        return jsonify({'error': 'No users were created', 'errors': e.errors}), 400
+    except IntegrityError:
+        # Another request registered one of the e-mails in the meantime
+        db.session.rollback()
+        return jsonify({'error': 'Email already registered'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @auth_bp.route('/users', methods=['GET'])
+@query_budget(2)
+@use_replica
 @jwt_required()
 def get_users():
     """
@@ -225,12 +378,77 @@ def get_users():
         return jsonify({
             'users': [user.to_dict() for user in users]
         }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/users/tree', methods=['GET'])
+@query_budget(2)
+@use_replica
+@jwt_required()
+def get_org_tree():
+    """
+    Reporting tree of the company: nested {id, manager_id, full_name, role,
+    children} nodes under "roots". Served from cache until a user changes;
+    the ETag lets clients skip unchanged trees.
+    """
+    try:
+        company_id, version = db.session.execute(
+            db.select(User.company_id, Company.org_version)
+            .join(Company, Company.id == User.company_id)
+            .where(User.id == get_jwt_identity())
+        ).one()
+        
+        etag = f'org-{company_id}-{version}'
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(org_chart_service.tree_json(company_id, version), status=200,
+                                mimetype='application/json')
+        response.set_etag(etag)
+        return response
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/users/search', methods=['GET'])
+@query_budget(2)
+@use_replica
+@jwt_required()
+def search_users():
+    """
+    Users of the company whose name or e-mail starts with ?q, by name.
+    ?role=manager,admin filters roles; paginated with page/per_page.
+    """
+    try:
+        current_user = User.query.get(get_jwt_identity())
         
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+        roles = [role for role in request.args.get('role', '').split(',') if role]
+        
+        users, has_more = org_chart_service.search(
+            current_user.company_id, request.args.get('q', ''), roles=roles,
+            limit=per_page, offset=(page - 1) * per_page
+        )
+        
+        return jsonify({
+            'users': [user.to_dict() for user in users],
+            'page': page,
+            'per_page': per_page,
+            'has_more': has_more
+        }), 200
+    
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @auth_bp.route('/users/<int:user_id>', methods=['PUT'])
+@query_budget(7)
 @jwt_required()
 def update_user(user_id):
     """
@@ -255,23 +473,27 @@ def update_user(user_id):
         data = request.get_json()
         
         # Update fields
-        if 'full_name' in data:
+        if 'full_name' in data and data['full_name'] != user.full_name:
             user.full_name = data['full_name']
-        if 'role' in data and data['role'] in ['employee', 'manager', 'admin']:
+            inbox_service.rename_employee(user)
+        if 'role' in data and data['role'] in ['employee', 'manager', 'admin'] and data['role'] != user.role:
             user.role = data['role']
+            # Sessions opened under the old role end with it
+            revoke_user_tokens(user.id, reason='role_change')
         if 'manager_id' in data:
             user.manager_id = data['manager_id']
         if 'is_manager_approver' in data:
             user.is_manager_approver = data['is_manager_approver']
         
         user.updated_at = datetime.utcnow()
+        org_chart_service.bump_version(user.company_id)
         db.session.commit()
         
         return jsonify({
             'message': 'User updated successfully',
             'user': user.to_dict()
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
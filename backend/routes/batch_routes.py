@@ -0,0 +1,110 @@
+from flask import Blueprint, current_app, g, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from werkzeug.test import EnvironBuilder
+from database import db
+from models import User
+
+batch_bp = Blueprint('batch', __name__)
+
+# Not reachable from a batch: the batch itself and long-lived event streams
+EXCLUDED_PREFIXES = ('/api/batch', '/api/stream')
+
+
+def _dispatch(app, item, headers):
+    """
+    Run one sub-request through the app's normal dispatch (before/after
+    request hooks, rate limits, error handlers) in a nested request context.
+    
+    The nested context reuses the batch's app context, so sub-requests share
+    its DB session and identity map: the user loaded by the batch is not
+    queried again. `g` lives on the app context too: g.batch_jwt (the token
+    the batch verified) stays in place for every sub-request, and the rest
+    is restored afterwards to keep per-request state (@use_replica, metrics
+    timers) from leaking into the next one.
+    
+    Returns:
+        Tuple of (status, body)
+    """
+    path = item.get('path')
+    method = str(item.get('method') or 'GET').upper()
+    if not isinstance(path, str) or not path.startswith('/api/') or path.startswith(EXCLUDED_PREFIXES):
+        return 400, {'error': 'path must be an /api/ URL other than /api/batch and /api/stream'}
+    if method != 'GET':
+        return 405, {'error': 'Only GET sub-requests can be batched'}
+    
+    environ = EnvironBuilder(
+        path=path,
+        method=method,
+        base_url=request.host_url,
+        headers=headers,
+        environ_base={'REMOTE_ADDR': request.remote_addr},
+    ).get_environ()
+    
+    saved = dict(g.__dict__)
+    try:
+        with app.request_context(environ):
+            try:
+                response = app.full_dispatch_request()
+            except Exception as e:
+                # What the app's 500 handler does for a standalone request
+                db.session.rollback()
+                return 500, {'error': str(e)}
+            
+            if response.is_streamed:
+                response.close()
+                return 400, {'error': 'Streamed responses (exports) cannot be batched'}
+            body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+            return response.status_code, body
+    finally:
+        g.__dict__.clear()
+        g.__dict__.update(saved)
+
+
+@batch_bp.route('', methods=['POST'])
+@jwt_required()
+def batch():
+    """
+    Execute several GET requests in one round trip
+    
+    Body: {"requests": [{"id": "stats", "method": "GET", "path": "/api/expenses/stats"}, ...]}
+    
+    Sub-requests run in order with the batch's bearer token (headers of the
+    sub-requests are not used), which is verified once here, and count
+    against rate limits like separate requests. The response lists {"id", "status", "body"} per sub-request in
+    the same order; the batch itself returns 200 unless it is malformed.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json(silent=True) or {}
+        items = data.get('requests')
+        max_requests = current_app.config.get('BATCH_MAX_REQUESTS', 10)
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'requests must be a non-empty list'}), 400
+        if len(items) > max_requests:
+            return jsonify({'error': f'A batch can contain at most {max_requests} requests'}), 400
+        if not all(isinstance(item, dict) for item in items):
+            return jsonify({'error': 'Each request must be an object with a path'}), 400
+        
+        # Sub-requests send the same token; BatchJWTManager (app.py) hands
+        # them these claims instead of verifying it again
+        authorization = request.headers.get('Authorization', '')
+        g.batch_jwt = {'token': authorization.split(' ', 1)[-1], 'claims': get_jwt()}
+        
+        headers = {'Authorization': authorization}
+        if 'X-Forwarded-For' in request.headers:
+            headers['X-Forwarded-For'] = request.headers['X-Forwarded-For']
+        
+        app = current_app._get_current_object()
+        responses = []
+        for index, item in enumerate(items):
+            status, body = _dispatch(app, item, headers)
+            responses.append({'id': item.get('id', index), 'status': status, 'body': body})
+        
+        return jsonify({'responses': responses}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
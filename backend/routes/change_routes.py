@@ -0,0 +1,58 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import User
+from services.change_log import ChangeLogService
+from utils.query_budget import query_budget
+
+change_bp = Blueprint('change', __name__)
+change_log_service = ChangeLogService()
+
+@change_bp.route('/', methods=['GET'])
+@query_budget(3)
+@jwt_required()
+def get_changes():
+    """
+    Expense and approval-step changes after ?since= (default 0), oldest
+    first, scoped like the expense list; managers also get steps they hold.
+    
+    Each change has a seq, the entity ('expense' or 'approval_step') and its
+    id, and an op: create, update and snapshot carry the changed columns
+    (apply them as an upsert), delete removes the entity, and archived
+    removes it from the live set (archived expenses stay readable through
+    GET /api/expenses/<id>). Pass next_cursor as ?since= on the next call;
+    keep paging while has_more is true.
+    
+    Reads the primary, not a replica: the settle window that stops the feed
+    at not-yet-visible ids is measured against the primary's commits.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        max_limit = current_app.config.get('CHANGE_FEED_MAX_LIMIT', 1000)
+        since = int(request.args.get('since', 0))
+        limit = min(max(int(request.args.get('limit', 500)), 1), max_limit)
+        if since < 0:
+            return jsonify({'error': 'since must be a non-negative cursor'}), 400
+        
+        employee_ids, approver_id = None, None
+        if user.role == 'manager':
+            employee_ids = [sub.id for sub in user.subordinates] + [user.id]
+            approver_id = user.id
+        elif user.role != 'admin':
+            employee_ids = [user.id]
+        
+        changes, next_cursor, has_more = change_log_service.feed(
+            user.company_id, since=since, limit=limit, employee_ids=employee_ids, approver_id=approver_id
+        )
+        
+        return jsonify({
+            'changes': [change.to_dict() for change in changes],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }), 200
+    
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,15 +1,40 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
-from models import User, Expense, ApprovalStep, ApprovalRule
+from database import db
+from models import User, Expense, ApprovalStep, ApprovalRule, ArchivedExpense
 from datetime import datetime
+from sqlalchemy.orm import joinedload
+from services.archive_service import ArchiveService
+from services.inbox_service import InboxService
+from services.company_amount_service import CompanyAmountService
 from services.currency_service import CurrencyService
+from services.expense_queries import load_expense_with_approvals
+from services.rollup_service import RollupService
+from services.sla_service import SlaService
+from utils.query_budget import query_budget
+from utils.idempotency import idempotent
+from utils.replica import use_replica
+from utils.query_window import created_range, filter_created
 
 expense_bp = Blueprint('expense', __name__)
 currency_service = CurrencyService()
+rollup_service = RollupService()
+company_amount_service = CompanyAmountService(currency_service)
+archive_service = ArchiveService()
+inbox_service = InboxService()
+sla_service = SlaService()
+
+# ?sort= values accepted by GET /api/expenses ('-' prefix for descending)
+SORT_COLUMNS = {
+    'created_at': Expense.created_at,
+    'expense_date': Expense.expense_date,
+    'amount': Expense.amount_company_currency,
+}
 
 @expense_bp.route('/', methods=['POST'])
+@query_budget(18)
 @jwt_required()
+@idempotent
 def create_expense():
     """
     Employee submits a new expense
@@ -46,19 +71,27 @@ def create_expense():
             status='pending'
         )
         
+        # Store the company-currency amount at the rate of the expense date
+        company_amount_service.apply(expense, user.company.currency)
+        
         db.session.add(expense)
         db.session.flush()  # Get expense ID
         
-        # Create approval workflow
-        _create_approval_workflow(expense, user)
+        # Create approval workflow and put its first steps in the approvers' inboxes
+        steps = _create_approval_workflow(expense, user)
+        inbox_service.add_steps(expense, steps)
+        
+        # Keep dashboard rollups in the same transaction
+        rollup_service.apply_change(None, rollup_service.snapshot(expense))
         
         db.session.commit()
+        expense = load_expense_with_approvals(expense.id)
         
         return jsonify({
             'message': 'Expense created successfully',
             'expense': expense.to_dict(include_approvals=True)
         }), 201
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -67,12 +100,16 @@ def create_expense():
 def _create_approval_workflow(expense, employee):
     """
     Create approval workflow based on rules
+    
+    Returns:
+        List of the created approval steps
     """
     # Find applicable approval rule
+    # First match by id, like _get_applicable_rule and the rule simulator
     rules = ApprovalRule.query.filter_by(
         company_id=employee.company_id,
         is_active=True
-    ).all()
+    ).order_by(ApprovalRule.id).all()
     
     applicable_rule = None
     for rule in rules:
@@ -99,9 +136,12 @@ def _create_approval_workflow(expense, employee):
                 status='pending'
             )
             db.session.add(step)
-        return
+            sla_service.start([step])
+            return [step]
+        return []
     
     # Create approval steps based on rule
+    steps = []
     if applicable_rule.rule_type in ['sequential', 'hybrid']:
         # Sequential approval
         for idx, approver_id in enumerate(applicable_rule.approval_sequence or [], start=1):
@@ -109,9 +149,11 @@ def _create_approval_workflow(expense, employee):
                 expense_id=expense.id,
                 approver_id=approver_id,
                 step_order=idx,
-                status='pending' if idx == 1 else 'waiting'
+                status='pending' if idx == 1 else 'waiting',
+                rule_id=applicable_rule.id
             )
             db.session.add(step)
+            steps.append(step)
     
     elif applicable_rule.rule_type == 'conditional':
         # Conditional approval - create steps for all potential approvers
@@ -123,12 +165,20 @@ def _create_approval_workflow(expense, employee):
                 expense_id=expense.id,
                 approver_id=approver_id,
                 step_order=idx,
-                status='pending'
+                status='pending',
+                rule_id=applicable_rule.id
             )
             db.session.add(step)
+            steps.append(step)
+    
+    # Start the SLA clock of the steps that are pending now
+    sla_service.start(steps, applicable_rule)
+    return steps
 
 
 @expense_bp.route('/', methods=['GET'])
+@query_budget(5)
+@use_replica
 @jwt_required()
 def get_expenses():
     """
@@ -143,6 +193,24 @@ def get_expenses():
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
         
+        sort = request.args.get('sort', '-created_at')
+        sort_column = SORT_COLUMNS.get(sort.lstrip('-'))
+        if sort_column is None:
+            return jsonify({'error': f"Invalid sort. Use one of: {', '.join(SORT_COLUMNS)} (prefix '-' for descending)"}), 400
+        
+        try:
+            min_amount = request.args.get('min_amount')
+            max_amount = request.args.get('max_amount')
+            min_amount = float(min_amount) if min_amount else None
+            max_amount = float(max_amount) if max_amount else None
+        except ValueError:
+            return jsonify({'error': 'min_amount and max_amount must be numbers'}), 400
+        
+        try:
+            created_from, created_to = created_range(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid created_from/created_to. Use YYYY-MM-DD'}), 400
+        
         # Build query based on role
         if user.role == 'admin':
             # Admin sees all company expenses
@@ -155,15 +223,26 @@ def get_expenses():
                 Expense.employee_id.in_(subordinate_ids + [user.id])
             )
         else:
-            # Employee sees only their expenses
-            query = Expense.query.filter_by(employee_id=user.id)
+            # Employee sees only their expenses (company_id lets hash partitions prune)
+            query = Expense.query.filter_by(company_id=user.company_id, employee_id=user.id)
         
         # Filter by status
         if status:
             query = query.filter_by(status=status)
         
-        # Paginate
-        expenses = query.order_by(Expense.created_at.desc()).paginate(
+        # created_at predicates let month-partitioned tables skip old partitions
+        query = filter_created(query, Expense.created_at, created_from, created_to)
+        
+        # Amount range in company currency (served by ix_expenses_company_amount)
+        if min_amount is not None:
+            query = query.filter(Expense.amount_company_currency >= min_amount)
+        if max_amount is not None:
+            query = query.filter(Expense.amount_company_currency <= max_amount)
+        
+        order = sort_column.desc() if sort.startswith('-') else sort_column.asc()
+        
+        # Paginate (id breaks ties so pages are stable)
+        expenses = query.options(joinedload(Expense.employee)).order_by(order, Expense.id.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
@@ -173,12 +252,14 @@ def get_expenses():
             'page': page,
             'pages': expenses.pages
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @expense_bp.route('/<int:expense_id>', methods=['GET'])
+@query_budget(5)
+@use_replica
 @jwt_required()
 def get_expense(expense_id):
     """
@@ -188,9 +269,9 @@ def get_expense(expense_id):
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        expense = Expense.query.get(expense_id)
+        expense = load_expense_with_approvals(expense_id)
         if not expense:
-            return jsonify({'error': 'Expense not found'}), 404
+            return _get_archived_expense(expense_id, user)
         
         # Check permissions
         if expense.company_id != user.company_id:
@@ -201,11 +282,14 @@ def get_expense(expense_id):
         
         # Convert amount to company currency if different
         converted_amount = None
-        if expense.original_currency != user.company.currency:
+        if expense.amount_company_currency is not None:
+            converted_amount = float(expense.amount_company_currency)
+        elif expense.original_currency != user.company.currency:
             converted_amount = currency_service.convert(
                 expense.amount,
                 expense.original_currency,
-                user.company.currency
+                user.company.currency,
+                on_date=expense.expense_date
             )
         
         expense_data = expense.to_dict(include_approvals=True)
@@ -215,12 +299,136 @@ def get_expense(expense_id):
         return jsonify({
             'expense': expense_data
         }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _get_archived_expense(expense_id, user):
+    """
+    Read through to cold storage for an expense that is no longer in the hot tables
+    """
+    tombstone = db.session.get(ArchivedExpense, expense_id)
+    if not tombstone:
+        return jsonify({'error': 'Expense not found'}), 404
+    
+    if tombstone.company_id != user.company_id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if user.role == 'employee' and tombstone.employee_id != user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    expense_data = archive_service.load_expense(tombstone)
+    if expense_data is None:
+        return jsonify({'error': 'Archived expense is missing from the archive'}), 500
+    
+    expense_data['converted_amount'] = expense_data['amount_company_currency']
+    expense_data['company_currency'] = user.company.currency
+    return jsonify({
+        'expense': expense_data
+    }), 200
+
+
+EXPORT_COLUMNS = [
+    'id', 'expense_date', 'employee_id', 'employee_name', 'category', 'description', 'vendor_name',
+    'amount', 'original_currency', 'amount_company_currency', 'exchange_rate', 'status',
+    'created_at', 'archived',
+]
+
+
+@expense_bp.route('/export', methods=['GET'])
+@query_budget(5)
+@use_replica
+@jwt_required()
+def export_expenses():
+    """
+    Download expenses as CSV, including archived ones
+    
+    Query parameters:
+        date_from, date_to: expense_date range (YYYY-MM-DD, inclusive)
+        status: only this status
+        include_archived: read through to cold storage (default true)
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        try:
+            date_from = request.args.get('date_from')
+            date_to = request.args.get('date_to')
+            date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+            date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        status = request.args.get('status')
+        include_archived = request.args.get('include_archived', 'true').lower() != 'false'
         
+        # Same visibility as the expense list
+        if user.role == 'admin':
+            employee_ids = None
+        elif user.role == 'manager':
+            employee_ids = [sub.id for sub in user.subordinates] + [user.id]
+        else:
+            employee_ids = [user.id]
+        
+        def scoped(model):
+            query = model.query.filter(model.company_id == user.company_id)
+            if employee_ids is not None:
+                query = query.filter(model.employee_id.in_(employee_ids))
+            if date_from:
+                query = query.filter(model.expense_date >= date_from)
+            if date_to:
+                query = query.filter(model.expense_date <= date_to)
+            return query
+        
+        hot = scoped(Expense).options(joinedload(Expense.employee)).order_by(Expense.expense_date, Expense.id)
+        if status:
+            hot = hot.filter(Expense.status == status)
+        
+        archived_ids = {}
+        if include_archived:
+            for expense_id, archive_path in scoped(ArchivedExpense).with_entities(
+                ArchivedExpense.id, ArchivedExpense.archive_path
+            ).order_by(ArchivedExpense.archive_path):
+                archived_ids.setdefault(archive_path, []).append(expense_id)
+        
+        def generate():
+            import csv
+            import io
+            
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            
+            def flush():
+                data = buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                return data
+            
+            for expense in hot.yield_per(1000):
+                writer.writerow(dict(expense.to_dict(), archived=False))
+                if buffer.tell() > 65536:
+                    yield flush()
+            
+            # One Parquet read per company-month directory
+            for archive_path, expense_ids in archived_ids.items():
+                for row in archive_service.read_expenses(archive_path, expense_ids):
+                    if not status or row['status'] == status:
+                        writer.writerow(row)
+                yield flush()
+            yield flush()
+        
+        return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+            'Content-Disposition': 'attachment; filename=expenses.csv'
+        })
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @expense_bp.route('/<int:expense_id>', methods=['PUT'])
+@query_budget(8)
 @jwt_required()
 def update_expense(expense_id):
     """
@@ -230,7 +438,7 @@ def update_expense(expense_id):
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        expense = Expense.query.get(expense_id)
+        expense = Expense.query.filter_by(id=expense_id).with_for_update().first()
         if not expense:
             return jsonify({'error': 'Expense not found'}), 404
         
@@ -243,6 +451,7 @@ def update_expense(expense_id):
             return jsonify({'error': 'Cannot update non-pending expense'}), 400
         
         data = request.get_json()
+        rollup_before = rollup_service.snapshot(expense)
         
         # Update fields
         if 'amount' in data:
@@ -256,20 +465,26 @@ def update_expense(expense_id):
         if 'receipt_url' in data:
             expense.receipt_url = data['receipt_url']
         
+        if 'amount' in data or 'expense_date' in data:
+            company_amount_service.apply(expense, expense.company.currency)
+        
         expense.updated_at = datetime.utcnow()
+        inbox_service.refresh_expense(expense)
+        rollup_service.apply_change(rollup_before, rollup_service.snapshot(expense))
         db.session.commit()
         
         return jsonify({
             'message': 'Expense updated successfully',
             'expense': expense.to_dict()
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @expense_bp.route('/<int:expense_id>', methods=['DELETE'])
+@query_budget(11)
 @jwt_required()
 def delete_expense(expense_id):
     """
@@ -279,7 +494,7 @@ def delete_expense(expense_id):
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        expense = Expense.query.get(expense_id)
+        expense = Expense.query.filter_by(id=expense_id).with_for_update().first()
         if not expense:
             return jsonify({'error': 'Expense not found'}), 404
         
@@ -291,19 +506,23 @@ def delete_expense(expense_id):
         if expense.status != 'pending':
             return jsonify({'error': 'Cannot delete non-pending expense'}), 400
         
+        rollup_service.apply_change(rollup_service.snapshot(expense), None)
+        inbox_service.remove_expense(expense.id)
         db.session.delete(expense)
         db.session.commit()
         
         return jsonify({
             'message': 'Expense deleted successfully'
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @expense_bp.route('/stats', methods=['GET'])
+@query_budget(4)
+@use_replica
 @jwt_required()
 def get_expense_stats():
     """
@@ -313,6 +532,11 @@ def get_expense_stats():
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
+        try:
+            created_from, created_to = created_range(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid created_from/created_to. Use YYYY-MM-DD'}), 400
+        
         # Build query based on role
         if user.role == 'admin':
             query = Expense.query.filter_by(company_id=user.company_id)
@@ -323,27 +547,33 @@ def get_expense_stats():
                 Expense.employee_id.in_(subordinate_ids + [user.id])
             )
         else:
-            query = Expense.query.filter_by(employee_id=user.id)
-        
-        total = query.count()
-        pending = query.filter_by(status='pending').count()
-        approved = query.filter_by(status='approved').count()
-        rejected = query.filter_by(status='rejected').count()
-        
-        total_amount = db.session.query(db.func.sum(Expense.amount)).filter(
-            Expense.id.in_([e.id for e in query.all()])
-        ).scalar() or 0
+            query = Expense.query.filter_by(company_id=user.company_id, employee_id=user.id)
+        query = filter_created(query, Expense.created_at, created_from, created_to)
+        
+        # One grouped query instead of a COUNT per status; amounts are summed
+        # in company currency, rows still waiting for a rate are counted apart
+        rows = query.with_entities(
+            Expense.status,
+            db.func.count(Expense.id),
+            db.func.sum(Expense.amount_company_currency),
+            db.func.count(Expense.id) - db.func.count(Expense.amount_company_currency)
+        ).group_by(Expense.status).all()
+        
+        counts = {status: count for status, count, _, _ in rows}
+        total_amount = sum((amount or 0) for _, _, amount, _ in rows)
+        unconverted = sum(missing for _, _, _, missing in rows)
         
         return jsonify({
             'stats': {
-                'total': total,
-                'pending': pending,
-                'approved': approved,
-                'rejected': rejected,
+                'total': sum(counts.values()),
+                'pending': counts.get('pending', 0),
+                'approved': counts.get('approved', 0),
+                'rejected': counts.get('rejected', 0),
                 'total_amount': float(total_amount),
+                'unconverted': unconverted,
                 'currency': user.company.currency
             }
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
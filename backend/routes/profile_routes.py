@@ -0,0 +1,94 @@
+from flask import Blueprint, current_app, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from database import db
+from models import User
+from utils.query_budget import query_budget
+import os
+
+profile_bp = Blueprint('profile', __name__)
+
+
+def _require_admin():
+    """
+    Returns:
+        Tuple of (admin user, None), or (None, error response) unless the
+        caller is an admin. Admins only see profiles of their own company.
+    """
+    user = db.session.get(User, get_jwt_identity())
+    if not user or user.role != 'admin':
+        return None, (jsonify({'error': 'Admin access required'}), 403)
+    return user, None
+
+
+@profile_bp.route('/', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def list_profiles():
+    """
+    List captured request profiles, newest first
+    """
+    try:
+        admin, error = _require_admin()
+        if error:
+            return error
+        
+        store = current_app.extensions['profile_store']
+        profiles = store.list(company_id=admin.company_id)
+        
+        return jsonify({
+            'profiles': profiles,
+            'count': len(profiles),
+            'max_profiles': store.max_profiles
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@profile_bp.route('/<profile_id>', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def get_profile(profile_id):
+    """
+    Full metadata of one profile: request, SQL statements with timings, top functions
+    """
+    try:
+        admin, error = _require_admin()
+        if error:
+            return error
+        
+        metadata = current_app.extensions['profile_store'].load(profile_id, company_id=admin.company_id)
+        if not metadata:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        return jsonify({'profile': metadata}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@profile_bp.route('/<profile_id>/download', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def download_profile(profile_id):
+    """
+    Download the raw profile: a .prof file for cProfile (open with snakeviz or
+    pstats) or collapsed stacks for the sampler (flamegraph.pl, speedscope)
+    """
+    try:
+        admin, error = _require_admin()
+        if error:
+            return error
+        
+        store = current_app.extensions['profile_store']
+        metadata = store.load(profile_id, company_id=admin.company_id)
+        if not metadata:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        extension = '.prof' if metadata.get('mode') == 'cprofile' else '.folded'
+        path = store.path(profile_id, extension)
+        if not os.path.exists(path):
+            return jsonify({'error': 'Profile data has been rotated out'}), 404
+        
+        return send_file(path, as_attachment=True, download_name=f'{profile_id}{extension}',
+                         mimetype='application/octet-stream')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
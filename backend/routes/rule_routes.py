@@ -1,12 +1,44 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
+from database import db
 from models import User, ApprovalRule
 from datetime import datetime
+from utils.query_budget import query_budget
+from utils.replica import use_replica
 
 rule_bp = Blueprint('rule', __name__)
+_rule_simulation_service = None
+
+
+def get_rule_simulation_service():
+    """
+    Shared RuleSimulationService, created on first use so NumPy is not imported at startup
+    """
+    global _rule_simulation_service
+    if _rule_simulation_service is None:
+        from services.rule_simulation import RuleSimulationService
+        _rule_simulation_service = RuleSimulationService()
+    return _rule_simulation_service
+
+
+def _sla_error(data, company_id):
+    """
+    Validate the SLA fields of a rule payload
+    
+    Returns:
+        Error message, or None when the fields are valid or absent
+    """
+    if data.get('sla_hours') is not None:
+        if isinstance(data['sla_hours'], bool) or not isinstance(data['sla_hours'], int) or data['sla_hours'] < 1:
+            return 'sla_hours must be a positive whole number of hours'
+    if data.get('escalation_user_id') is not None:
+        if not User.query.filter_by(id=data['escalation_user_id'], company_id=company_id).first():
+            return 'escalation_user_id must be a user of your company'
+    return None
+
 
 @rule_bp.route('/', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def create_approval_rule():
     """
@@ -42,6 +74,10 @@ def create_approval_rule():
             if not data.get('conditions'):
                 return jsonify({'error': 'conditions are required for conditional/hybrid rules'}), 400
         
+        sla_error = _sla_error(data, user.company_id)
+        if sla_error:
+            return jsonify({'error': sla_error}), 400
+        
         # Create rule
         rule = ApprovalRule(
             company_id=user.company_id,
@@ -53,6 +89,8 @@ def create_approval_rule():
             min_amount=data.get('min_amount'),
             max_amount=data.get('max_amount'),
             category=data.get('category'),
+            sla_hours=data.get('sla_hours'),
+            escalation_user_id=data.get('escalation_user_id'),
             is_active=data.get('is_active', True)
         )
         
@@ -63,13 +101,15 @@ def create_approval_rule():
             'message': 'Approval rule created successfully',
             'rule': rule.to_dict()
         }), 201
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @rule_bp.route('/', methods=['GET'])
+@query_budget(2)
+@use_replica
 @jwt_required()
 def get_approval_rules():
     """
@@ -86,12 +126,55 @@ def get_approval_rules():
         return jsonify({
             'rules': [rule.to_dict() for rule in rules]
         }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@rule_bp.route('/simulate', methods=['POST'])
+@query_budget(4)
+@use_replica
+@jwt_required()
+def simulate_approval_rules():
+    """
+    Admin dry-runs a proposed rule set against the company's expense history.
+    
+    Body: {"rules": [...], "since": "YYYY-MM-DD", "until": "YYYY-MM-DD"}.
+    "rules" replaces the active rules, in priority order; an entry with an
+    "id" starts from that rule, e.g. {"id": 4, "max_amount": 500}. Returns the
+    expenses that would be routed differently, steps added and approver load.
+    Nothing is saved.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        # Only admins can simulate rules
+        if user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
         
+        data = request.get_json(silent=True) or {}
+        if 'rules' not in data:
+            return jsonify({'error': 'Missing required field: rules'}), 400
+        
+        try:
+            since = datetime.strptime(data['since'], '%Y-%m-%d').date() if data.get('since') else None
+            until = datetime.strptime(data['until'], '%Y-%m-%d').date() if data.get('until') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        result = get_rule_simulation_service().simulate(user.company_id, data['rules'], since=since, until=until)
+        return jsonify(result), 200
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @rule_bp.route('/<int:rule_id>', methods=['GET'])
+@query_budget(2)
+@use_replica
 @jwt_required()
 def get_approval_rule(rule_id):
     """
@@ -112,12 +195,13 @@ def get_approval_rule(rule_id):
         return jsonify({
             'rule': rule.to_dict()
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @rule_bp.route('/<int:rule_id>', methods=['PUT'])
+@query_budget(5)
 @jwt_required()
 def update_approval_rule(rule_id):
     """
@@ -140,6 +224,10 @@ def update_approval_rule(rule_id):
         
         data = request.get_json()
         
+        sla_error = _sla_error(data, user.company_id)
+        if sla_error:
+            return jsonify({'error': sla_error}), 400
+        
         # Update fields
         if 'name' in data:
             rule.name = data['name']
@@ -159,6 +247,10 @@ def update_approval_rule(rule_id):
             rule.max_amount = data['max_amount']
         if 'category' in data:
             rule.category = data['category']
+        if 'sla_hours' in data:
+            rule.sla_hours = data['sla_hours']
+        if 'escalation_user_id' in data:
+            rule.escalation_user_id = data['escalation_user_id']
         if 'is_active' in data:
             rule.is_active = data['is_active']
         
@@ -169,13 +261,14 @@ def update_approval_rule(rule_id):
             'message': 'Approval rule updated successfully',
             'rule': rule.to_dict()
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @rule_bp.route('/<int:rule_id>', methods=['DELETE'])
+@query_budget(3)
 @jwt_required()
 def delete_approval_rule(rule_id):
     """
@@ -202,13 +295,14 @@ def delete_approval_rule(rule_id):
         return jsonify({
             'message': 'Approval rule deleted successfully'
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @rule_bp.route('/<int:rule_id>/toggle', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def toggle_rule_status(rule_id):
     """
@@ -238,7 +332,7 @@ def toggle_rule_status(rule_id):
             'message': f'Rule {"activated" if rule.is_active else "deactivated"} successfully',
             'rule': rule.to_dict()
         }), 200
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,105 @@
+from flask import Blueprint, Response, current_app, request, jsonify
+from flask_jwt_extended import decode_token
+from utils.token_revocation import revocation_list
+import json
+import time
+
+stream_bp = Blueprint('stream', __name__)
+
+
+def _format_event(item):
+    data = dict(item['data'], type=item['type'])
+    return f"id: {item['id']}\nevent: {item['type']}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _authenticate():
+    """
+    Decode the access token from ?token= (EventSource cannot send headers)
+    or the Authorization header. No database access: streams hold no session.
+    
+    Returns:
+        The token's claims, or None without an access token
+    """
+    token = request.args.get('token')
+    header = request.headers.get('Authorization', '')
+    if not token and header.startswith('Bearer '):
+        token = header[len('Bearer '):]
+    if not token:
+        return None
+    
+    claims = decode_token(token)
+    if claims.get('type') != 'access':
+        return None
+    return claims
+
+
+@stream_bp.route('/', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events for the current user.
+    
+    Events:
+        approval_requested  one of the user's approval steps became pending
+        expense_approved    one of the user's expenses was approved
+        expense_rejected    one of the user's expenses was rejected
+        resync              events were missed; refetch pending approvals / stats
+    
+    Reconnecting clients send Last-Event-ID (browsers do this automatically,
+    or pass ?last_event_id=) to receive events they missed.
+    """
+    if current_app.config.get('SERVER_ROLE') == 'api':
+        return jsonify({'error': 'stream_server_required',
+                        'message': 'Streams are served by the stream server (gunicorn.stream.conf.py)'}), 503
+    
+    try:
+        claims = _authenticate()
+    except Exception as e:
+        return jsonify({'error': 'invalid_token', 'message': str(e)}), 401
+    if claims is None:
+        return jsonify({'error': 'authorization_required', 'message': 'Request does not contain an access token'}), 401
+    # decode_token() skips the blocklist check that @jwt_required() runs
+    if revocation_list.is_revoked(claims):
+        return jsonify({'error': 'token_revoked', 'message': 'The token has been revoked'}), 401
+    user_id = claims['sub']
+    
+    bus = current_app.extensions['event_bus']
+    heartbeat = current_app.config.get('STREAM_HEARTBEAT_SECONDS', 15)
+    max_duration = current_app.config.get('STREAM_MAX_SECONDS', 300)
+    retry_ms = current_app.config.get('STREAM_RETRY_MS', 3000)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    def generate():
+        deadline = time.monotonic() + max_duration
+        sent_up_to = 0
+        # Subscribe before replaying so nothing published in between is lost
+        subscription = bus.subscribe(user_id)
+        missed, complete = [], True
+        if last_event_id and last_event_id.isdigit():
+            missed, complete = bus.replay(user_id, int(last_event_id))
+        try:
+            yield f"retry: {retry_ms}\n\n"
+            if not complete:
+                yield "event: resync\ndata: {}\n\n"
+            for item in missed:
+                sent_up_to = item['id']
+                yield _format_event(item)
+            
+            while time.monotonic() < deadline:
+                # Logout, password or role changes end open streams too
+                if revocation_list.is_revoked(claims):
+                    break
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield "event: resync\ndata: {}\n\n"
+                item = subscription.get(timeout=min(heartbeat, max(0.0, deadline - time.monotonic())))
+                if item is None:
+                    yield ": heartbeat\n\n"
+                elif item['id'] > sent_up_to:
+                    yield _format_event(item)
+        finally:
+            bus.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # stop nginx from buffering the stream
+    })
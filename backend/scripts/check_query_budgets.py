@@ -0,0 +1,341 @@
+"""
+Query-budget and N+1 check for every API route.
+
+Builds the app against a throwaway SQLite database, seeds a realistic tenant
+(manager tree, rules of every type, multi-currency expenses with approval
+history), then calls each route through the Flask test client while capturing
+SQL. A route fails when it runs more statements than its @query_budget allows
+or repeats one parameterized statement more than the budget's max_repeats.
+
+Every route in the auth, expense, approval, rule and change blueprints must
+declare a budget and be exercised here.
+
+Usage:
+    python scripts/check_query_budgets.py [--verbose]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(prefix='query-budgets-'), 'check.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+os.environ['SQLALCHEMY_ECHO'] = 'False'
+os.environ['METRICS_MULTIPROC_DIR'] = ''
+
+# Blueprints whose routes must all declare and meet a budget
+REQUIRED_BLUEPRINTS = ('auth', 'expense', 'approval', 'rule', 'change')
+
+# Offline stand-ins for the two external APIs
+EXCHANGE_RATES = {'USD': 1.0, 'EUR': 0.92, 'GBP': 0.79, 'INR': 83.1, 'JPY': 149.5}
+COUNTRIES = [{'name': {'common': 'United States'}, 'currencies': {'USD': {}}},
+             {'name': {'common': 'India'}, 'currencies': {'INR': {}}}]
+
+PASSWORD = 'budget-check-password'
+CATEGORIES = ['Travel', 'Food', 'Office Supplies', 'Software', 'Training']
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+    
+    def raise_for_status(self):
+        pass
+    
+    def json(self):
+        return self.payload
+
+
+def fake_get(url, *args, **kwargs):
+    if 'restcountries' in url:
+        return FakeResponse(COUNTRIES)
+    base = url.rstrip('/').rsplit('/', 1)[-1]
+    rates = {quote: rate / EXCHANGE_RATES.get(base, 1.0) for quote, rate in EXCHANGE_RATES.items()}
+    return FakeResponse({'base': base, 'rates': rates})
+
+
+class Tenant:
+    """
+    Handles to the seeded company: tokens per user and a few well-known ids
+    """
+    
+    def __init__(self, client):
+        self.client = client
+        self.tokens = {}
+        self.ids = {}
+    
+    def headers(self, who):
+        return {'Authorization': f'Bearer {self.tokens[who]}'}
+    
+    def call(self, method, path, who=None, **kwargs):
+        headers = self.headers(who) if who else {}
+        return self.client.open(path, method=method, headers=headers, **kwargs)
+
+
+def seed(app, client):
+    """
+    Create one realistic tenant through the public API
+    """
+    tenant = Tenant(client)
+    random.seed(7)
+    
+    response = tenant.call('POST', '/api/auth/signup', json={
+        'email': 'admin@budget.test', 'password': PASSWORD,
+        'full_name': 'Ada Admin', 'country': 'United States', 'company_name': 'Budget Co'
+    })
+    tenant.tokens['admin'] = response.get_json()['access_token']
+    tenant.ids['admin'] = response.get_json()['user']['id']
+    
+    def create_user(key, role, manager=None, approver=False):
+        response = tenant.call('POST', '/api/auth/users', 'admin', json={
+            'email': f'{key}@budget.test', 'password': PASSWORD, 'full_name': key.title(),
+            'role': role, 'manager_id': tenant.ids.get(manager), 'is_manager_approver': approver
+        })
+        tenant.ids[key] = response.get_json()['user']['id']
+    
+    create_user('director', 'manager')
+    for team in ('alpha', 'beta'):
+        create_user(f'{team}_lead', 'manager', manager='director', approver=True)
+        for member in range(4):
+            create_user(f'{team}_{member}', 'employee', manager=f'{team}_lead', approver=True)
+    
+    for key in list(tenant.ids):
+        if key != 'admin':
+            response = tenant.call('POST', '/api/auth/login', json={'email': f'{key}@budget.test', 'password': PASSWORD})
+            tenant.tokens[key] = response.get_json()['access_token']
+    
+    rules = [
+        {'name': 'Large travel', 'rule_type': 'sequential', 'category': 'Travel', 'min_amount': 500,
+         'approval_sequence': [tenant.ids['alpha_lead'], tenant.ids['director'], tenant.ids['admin']]},
+        {'name': 'Software purchases', 'rule_type': 'conditional', 'category': 'Software',
+         'conditions': {'percentage': 50, 'specific_approvers': [tenant.ids['director'], tenant.ids['admin']],
+                        'operator': 'OR'}},
+        {'name': 'Big training spend', 'rule_type': 'hybrid', 'category': 'Training', 'min_amount': 1000,
+         'approval_sequence': [tenant.ids['beta_lead'], tenant.ids['director']],
+         'conditions': {'specific_approvers': [tenant.ids['director']], 'operator': 'OR'}},
+    ]
+    for rule in rules:
+        response = tenant.call('POST', '/api/rules/', 'admin', json=rule)
+        tenant.ids.setdefault('rule', response.get_json()['rule']['id'])
+    
+    employees = [key for key in tenant.ids if key.startswith(('alpha_', 'beta_')) and not key.endswith('lead')]
+    today = date.today()
+    for index in range(60):
+        who = employees[index % len(employees)]
+        category = CATEGORIES[index % len(CATEGORIES)]
+        amount = round(random.lognormvariate(5, 1), 2)
+        response = tenant.call('POST', '/api/expenses/', who, json={
+            'amount': amount,
+            'original_currency': random.choice(list(EXCHANGE_RATES)),
+            'category': category,
+            'description': f'{category} expense {index}',
+            'expense_date': (today - timedelta(days=random.randint(0, 200))).isoformat(),
+        })
+        expense_id = response.get_json()['expense']['id']
+        tenant.ids.setdefault(f'expense_of_{who}', expense_id)
+    
+    # Approval history: leads work through part of their queue
+    for lead in ('alpha_lead', 'beta_lead'):
+        pending = tenant.call('GET', '/api/approvals/pending?per_page=100', lead).get_json()['pending_approvals']
+        for position, item in enumerate(pending[:8]):
+            action = 'approve' if position % 3 else 'reject'
+            tenant.call('POST', f"/api/approvals/{item['id']}/{action}", lead, json={'comments': 'Reviewed'})
+    
+    return tenant
+
+
+def pending_expense_for(app, approver_id):
+    from models import ApprovalStep
+    with app.app_context():
+        step = ApprovalStep.query.filter_by(approver_id=approver_id, status='pending').first()
+        return step.expense_id if step else None
+
+
+def scenarios(app, tenant):
+    """
+    One request per route: (expected endpoint, method, path, user, json body[, extra headers])
+    """
+    ids = tenant.ids
+    own_expense = ids['expense_of_alpha_0']
+    return [
+        ('auth.signup', 'POST', '/api/auth/signup', None, {
+            'email': 'second@budget.test', 'password': PASSWORD, 'full_name': 'Second Admin', 'country': 'India'}),
+        ('auth.login', 'POST', '/api/auth/login', None, {'email': 'alpha_0@budget.test', 'password': PASSWORD}),
+        ('auth.get_current_user', 'GET', '/api/auth/me', 'alpha_0', None),
+        ('auth.get_users', 'GET', '/api/auth/users', 'admin', None),
+        ('auth.get_org_tree', 'GET', '/api/auth/users/tree', 'admin', None),
+        ('auth.search_users', 'GET', '/api/auth/users/search?q=alp&role=employee,manager', 'admin', None),
+        ('auth.create_user', 'POST', '/api/auth/users', 'admin', {
+            'email': 'newhire@budget.test', 'password': PASSWORD, 'full_name': 'New Hire',
+            'role': 'employee', 'manager_id': ids['alpha_lead']}),
+        ('auth.update_user', 'PUT', f"/api/auth/users/{ids['beta_3']}", 'admin', {'full_name': 'Beta Three'}),
+        ('auth.bulk_create_users', 'POST', '/api/auth/users/bulk', 'admin', {'users': [
+            {'email': 'gamma_lead@budget.test', 'full_name': 'Gamma Lead', 'role': 'manager',
+             'manager_email': 'director@budget.test', 'password': PASSWORD},
+            *({'email': f'gamma_{n}@budget.test', 'full_name': f'Gamma {n}', 'role': 'employee',
+               'manager_email': 'gamma_lead@budget.test', 'is_manager_approver': True} for n in range(3)),
+            {'email': 'gamma_intern@budget.test', 'full_name': 'Gamma Intern', 'role': 'employee',
+             'manager_email': 'gamma_0@budget.test'},
+        ]}),
+        ('expense.get_expenses', 'GET', '/api/expenses/?per_page=20', 'admin', None),
+        ('expense.get_expenses', 'GET', '/api/expenses/?per_page=20', 'alpha_lead', None),
+        ('expense.get_expenses', 'GET', '/api/expenses/?per_page=20', 'alpha_0', None),
+        ('expense.get_expense', 'GET', f'/api/expenses/{own_expense}', 'admin', None),
+        ('expense.get_expense_stats', 'GET', '/api/expenses/stats', 'admin', None),
+        ('expense.export_expenses', 'GET', '/api/expenses/export', 'admin', None),
+        ('expense.export_expenses', 'GET', '/api/expenses/export?status=approved', 'alpha_lead', None),
+        ('expense.get_expense_stats', 'GET', '/api/expenses/stats', 'alpha_lead', None),
+        ('expense.create_expense', 'POST', '/api/expenses/', 'beta_1', {
+            'amount': 1500, 'original_currency': 'EUR', 'category': 'Training', 'expense_date': date.today().isoformat()}),
+        ('expense.create_expense', 'POST', '/api/expenses/', 'beta_2', {
+            'amount': 80, 'original_currency': 'USD', 'category': 'Food', 'expense_date': date.today().isoformat()},
+         {'Idempotency-Key': 'budget-create'}),
+        ('expense.update_expense', 'PUT', lambda: f"/api/expenses/{pending_expense_for(app, ids['beta_lead'])}",
+         lambda: _owner_of(app, pending_expense_for(app, ids['beta_lead'])), {'description': 'Updated'}),
+        ('approval.get_pending_approvals', 'GET', '/api/approvals/pending', 'alpha_lead', None),
+        ('approval.get_approval_history', 'GET', '/api/approvals/history', 'alpha_lead', None),
+        ('approval.get_inbox', 'GET', '/api/approvals/inbox', 'alpha_lead', None),
+        ('approval.get_inbox', 'GET', '/api/approvals/inbox?overdue=true', 'director', None),
+        ('approval.get_inbox_counts', 'GET', '/api/approvals/inbox/counts', 'alpha_lead', None),
+        ('approval.approve_expense', 'POST', lambda: f"/api/approvals/{pending_expense_for(app, ids['alpha_lead'])}/approve",
+         'alpha_lead', {'comments': 'OK'}),
+        ('approval.reject_expense', 'POST', lambda: f"/api/approvals/{pending_expense_for(app, ids['beta_lead'])}/reject",
+         'beta_lead', {'comments': 'Missing receipt'}),
+        ('approval.approve_expense', 'POST', lambda: f"/api/approvals/{pending_expense_for(app, ids['alpha_lead'])}/approve",
+         'alpha_lead', {'comments': 'OK'}, {'Idempotency-Key': 'budget-approve'}),
+        ('approval.reject_expense', 'POST', lambda: f"/api/approvals/{pending_expense_for(app, ids['beta_lead'])}/reject",
+         'beta_lead', {'comments': 'Duplicate'}, {'Idempotency-Key': 'budget-reject'}),
+        ('expense.delete_expense', 'DELETE', lambda: f"/api/expenses/{pending_expense_for(app, ids['alpha_lead'])}",
+         lambda: _owner_of(app, pending_expense_for(app, ids['alpha_lead'])), None),
+        ('rule.get_approval_rules', 'GET', '/api/rules/', 'admin', None),
+        ('rule.get_approval_rule', 'GET', f"/api/rules/{ids['rule']}", 'admin', None),
+        ('rule.simulate_approval_rules', 'POST', '/api/rules/simulate', 'admin', {'rules': [
+            {'id': ids['rule'], 'max_amount': 50},
+            {'name': 'Everything else', 'rule_type': 'sequential', 'approval_sequence': [ids['alpha_lead']]}]}),
+        ('rule.create_approval_rule', 'POST', '/api/rules/', 'admin', {
+            'name': 'Office', 'rule_type': 'sequential', 'category': 'Office Supplies',
+            'approval_sequence': [ids['director']], 'sla_hours': 24, 'escalation_user_id': ids['director']}),
+        ('rule.update_approval_rule', 'PUT', f"/api/rules/{ids['rule']}", 'admin', {'description': 'Tightened'}),
+        ('rule.toggle_rule_status', 'POST', f"/api/rules/{ids['rule']}/toggle", 'admin', None),
+        ('rule.delete_approval_rule', 'DELETE', f"/api/rules/{ids['rule']}", 'admin', None),
+        ('analytics.get_monthly_spend', 'GET', '/api/analytics/monthly?group_by=employee', 'admin', None),
+        ('analytics.get_spend_summary', 'GET', '/api/analytics/summary', 'alpha_lead', None),
+        ('analytics.get_spend_trends', 'GET', '/api/analytics/trends', 'admin', None),
+        ('analytics.get_spend_outliers', 'GET', '/api/analytics/outliers?z=2', 'admin', None),
+        ('analytics.get_category_mix', 'GET', '/api/analytics/category-mix', 'admin', None),
+        ('auth.refresh', 'POST', '/api/auth/refresh', None, None),
+        ('auth.update_user', 'PUT', f"/api/auth/users/{ids['beta_3']}", 'admin', {'role': 'manager'}),
+        ('auth.change_password', 'POST', '/api/auth/change-password', 'beta_0', {
+            'current_password': PASSWORD, 'new_password': PASSWORD + '!'}),
+        ('auth.logout', 'POST', '/api/auth/logout', 'alpha_2', None),
+        ('change.get_changes', 'GET', '/api/changes/?since=0', 'admin', None),
+        ('change.get_changes', 'GET', '/api/changes/?since=0', 'alpha_lead', None),
+        ('change.get_changes', 'GET', '/api/changes/?since=0', 'alpha_0', None),
+    ]
+
+
+# Seeded user id -> tenant key, filled in after seeding
+_USER_KEYS = {}
+
+
+def _owner_of(app, expense_id):
+    from database import db
+    from models import Expense
+    with app.app_context():
+        return _USER_KEYS[db.session.get(Expense, expense_id).employee_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help='Print every captured statement fingerprint')
+    args = parser.parse_args()
+    
+    import requests
+    requests.get = fake_get
+    
+    from app import create_app
+    from database import db
+    from utils.query_budget import QueryRecorder
+    
+    app = create_app()
+    app.config['TESTING'] = True
+    # Serve the freshly seeded change events instead of holding them back
+    app.config['CHANGE_FEED_SETTLE_SECONDS'] = 0
+    with app.app_context():
+        db.create_all()
+    
+    client = app.test_client()
+    tenant = seed(app, client)
+    _USER_KEYS.update({user_id: key for key, user_id in tenant.ids.items() if key in tenant.tokens})
+    
+    # Refresh needs a refresh token rather than an access token
+    login = tenant.call('POST', '/api/auth/login', json={'email': 'alpha_1@budget.test', 'password': PASSWORD})
+    refresh_token = login.get_json()['refresh_token']
+    
+    failures = []
+    exercised = set()
+    print("=" * 96)
+    print(f"{'endpoint':<40} {'user':<11} {'status':>6} {'queries':>8} {'budget':>7} {'max rpt':>8}")
+    print("=" * 96)
+    
+    for expected, method, path, who, body, *extra_headers in scenarios(app, tenant):
+        path = path() if callable(path) else path
+        who = who() if callable(who) else who
+        headers = tenant.headers(who) if who else {}
+        for extra in extra_headers:
+            headers.update(extra)
+        if expected == 'auth.refresh':
+            headers = {'Authorization': f'Bearer {refresh_token}'}
+        
+        with app.test_request_context(path, method=method):
+            from flask import request
+            endpoint = request.url_rule.endpoint if request.url_rule else None
+        if endpoint != expected:
+            failures.append(f'{method} {path}: routed to {endpoint}, expected {expected}')
+            continue
+        
+        with QueryRecorder() as recorder:
+            response = client.open(path, method=method, headers=headers, json=body)
+            # Streamed responses run their queries while the body is read
+            response.get_data()
+            response.close()
+        
+        exercised.add(endpoint)
+        budget = getattr(app.view_functions[endpoint], 'query_budget', None)
+        repeats = recorder.fingerprints().most_common(1)
+        worst = repeats[0][1] if repeats else 0
+        print(f"{endpoint:<40} {who or '-':<11} {response.status_code:>6} {recorder.count:>8} "
+              f"{budget.max_queries if budget else '-':>7} {worst:>8}")
+        
+        if args.verbose:
+            for statement, count in recorder.fingerprints().most_common():
+                print(f"    {count:>3}x {statement[:140]}")
+        
+        if response.status_code >= 500:
+            failures.append(f'{endpoint}: returned {response.status_code} {response.get_data(as_text=True)[:200]}')
+        if budget is None:
+            if endpoint.split('.')[0] in REQUIRED_BLUEPRINTS:
+                failures.append(f'{endpoint}: no @query_budget declared')
+            continue
+        failures.extend(f'{endpoint} ({who or "anonymous"}): {problem}' for problem in recorder.check(budget))
+    
+    for rule in app.url_map.iter_rules():
+        blueprint = rule.endpoint.split('.')[0] if '.' in rule.endpoint else None
+        if blueprint in REQUIRED_BLUEPRINTS and rule.endpoint not in exercised:
+            failures.append(f'{rule.endpoint}: route is not exercised by this check')
+    
+    print("=" * 96)
+    if failures:
+        for failure in failures:
+            print(f"✗ {failure}")
+        sys.exit(1)
+    print(f"✓ {len(exercised)} endpoints within their query budgets")
+
+
+if __name__ == '__main__':
+    main()
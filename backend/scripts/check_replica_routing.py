@@ -0,0 +1,145 @@
+"""
+Read-replica routing check.
+
+Runs the app against a primary and one replica database. The replica gets a
+snapshot of the primary and is then left stale on purpose, so which database
+answered a request shows in the results:
+
+  1. @use_replica reads from a client that has not written come from the replica
+  2. the writer's reads stay on the primary for READ_AFTER_WRITE_SECONDS,
+     both via the cookie and (for a client without cookies) via the user id
+  3. once the window expires, the writer reads from the replica again
+  4. writes always go to the primary
+
+By default both databases are temporary SQLite files. Two local PostgreSQL
+databases work too. Their tables are DROPPED and recreated:
+
+    python scripts/check_replica_routing.py \\
+        --primary-url postgresql://localhost/expense_primary \\
+        --replica-url postgresql://localhost/expense_replica
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PASSWORD = 'replica-check-password'
+WINDOW_SECONDS = 1.0
+
+
+def fake_get(url, *args, **kwargs):
+    """Offline stand-in for the country and exchange-rate APIs"""
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+        
+        def json(self):
+            if 'restcountries' in url:
+                return [{'name': {'common': 'United States'}, 'currencies': {'USD': {}}}]
+            return {'base': 'USD', 'rates': {'USD': 1.0, 'EUR': 0.92}}
+    return FakeResponse()
+
+
+def copy_database(db, source, target):
+    """
+    Copy every table from the primary engine to the replica engine
+    """
+    from sqlalchemy import insert, select
+    with source.connect() as reader, target.begin() as writer:
+        for table in db.metadata.sorted_tables:
+            rows = reader.execute(select(table)).mappings().all()
+            if rows:
+                writer.execute(insert(table), [dict(row) for row in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--primary-url', default=None)
+    parser.add_argument('--replica-url', default=None)
+    args = parser.parse_args()
+    
+    directory = tempfile.mkdtemp(prefix='replica-check-')
+    os.environ['DATABASE_URL'] = args.primary_url or f"sqlite:///{os.path.join(directory, 'primary.db')}"
+    os.environ['DATABASE_REPLICA_URLS'] = args.replica_url or f"sqlite:///{os.path.join(directory, 'replica.db')}"
+    os.environ['READ_AFTER_WRITE_SECONDS'] = str(WINDOW_SECONDS)
+    os.environ['SQLALCHEMY_ECHO'] = 'False'
+    os.environ['METRICS_MULTIPROC_DIR'] = ''
+    
+    import requests
+    requests.get = fake_get
+    
+    from app import create_app
+    from database import db
+    
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        primary, replica = db.engines[None], db.engines['replica_0']
+        for engine in (primary, replica):
+            db.metadata.drop_all(engine)
+            db.metadata.create_all(engine)
+    
+    failures = []
+    
+    def check(label, passed, detail=''):
+        print(f"{'✓' if passed else '✗'} {label}{f' ({detail})' if detail else ''}")
+        if not passed:
+            failures.append(label)
+    
+    admin = app.test_client()
+    writer = app.test_client()
+    
+    def call(client, method, path, token, **kwargs):
+        return client.open(path, method=method, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+    
+    response = admin.post('/api/auth/signup', json={
+        'email': 'admin@replica.test', 'password': PASSWORD, 'full_name': 'Admin', 'country': 'United States'})
+    admin_token = response.get_json()['access_token']
+    call(admin, 'POST', '/api/auth/users', admin_token, json={
+        'email': 'employee@replica.test', 'password': PASSWORD, 'full_name': 'Employee', 'role': 'employee'})
+    employee_token = writer.post('/api/auth/login', json={
+        'email': 'employee@replica.test', 'password': PASSWORD}).get_json()['access_token']
+    
+    expense = {'amount': 42, 'original_currency': 'USD', 'category': 'Food', 'expense_date': '2024-05-01'}
+    for _ in range(2):
+        call(writer, 'POST', '/api/expenses/', employee_token, json=expense)
+    
+    # Snapshot, then make the replica lag behind by one expense
+    with app.app_context():
+        copy_database(db, primary, replica)
+    time.sleep(WINDOW_SECONDS + 0.2)
+    call(writer, 'POST', '/api/expenses/', employee_token, json=expense)
+    
+    def total(client, token, path='/api/expenses/'):
+        return call(client, 'GET', path, token).get_json()['total']
+    
+    check('writer reads its own write from the primary (cookie)', total(writer, employee_token) == 3)
+    check('writer without cookies reads from the primary (user id)',
+          total(app.test_client(use_cookies=False), employee_token) == 3)
+    check('other clients read from the replica', total(admin, admin_token) == 2)
+    
+    time.sleep(WINDOW_SECONDS + 0.2)
+    check('writer reads from the replica after the window', total(writer, employee_token) == 2)
+    
+    response = call(app.test_client(), 'PUT', '/api/auth/users/2', admin_token, json={'full_name': 'Renamed'})
+    with app.app_context():
+        from sqlalchemy import text
+        query = text("SELECT full_name FROM users WHERE id = 2")
+        with primary.connect() as connection:
+            on_primary = connection.execute(query).scalar()
+        with replica.connect() as connection:
+            on_replica = connection.execute(query).scalar()
+    check('writes go to the primary only', response.status_code == 200 and on_primary == 'Renamed'
+          and on_replica != 'Renamed', f'primary={on_primary!r} replica={on_replica!r}')
+    
+    if failures:
+        sys.exit(1)
+    print("✓ Replica routing behaves as expected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+SLA escalation check for conditional approval rules.
+
+Builds the app against a throwaway SQLite database and walks one expense
+through a conditional rule that needs both the CFO and the controller
+("specific_approvers" with operator AND):
+
+  1. the CFO's step goes past its due time and the sweeper hands it to the
+     rule's escalation user
+  2. the escalation user approves it in the CFO's place; the expense waits
+     for the controller
+  3. the controller approves and the expense is approved, because the
+     escalated step still counts as the CFO's
+
+Usage:
+    python scripts/check_sla_escalation.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(prefix='sla-check-'), 'check.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+os.environ['SQLALCHEMY_ECHO'] = 'False'
+os.environ['METRICS_MULTIPROC_DIR'] = ''
+
+PASSWORD = 'sla-check-password'
+
+
+def fake_get(url, *args, **kwargs):
+    """Offline stand-in for the country and exchange-rate APIs"""
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+        
+        def json(self):
+            if 'restcountries' in url:
+                return [{'name': {'common': 'United States'}, 'currencies': {'USD': {}}}]
+            return {'base': 'USD', 'rates': {'USD': 1.0}}
+    return FakeResponse()
+
+
+def main():
+    import requests
+    requests.get = fake_get
+    
+    from app import create_app
+    from database import db
+    from models import ApprovalStep, Expense
+    from services.sla_service import SlaService
+    from utils.rate_limit import rate_limiter
+    
+    app = create_app()
+    app.config['TESTING'] = True
+    rate_limiter.enabled = False
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    
+    failures = []
+    
+    def check(label, passed, detail=''):
+        print(f"{'✓' if passed else '✗'} {label}{f' ({detail})' if detail else ''}")
+        if not passed:
+            failures.append(label)
+    
+    def call(method, path, token, **kwargs):
+        return client.open(path, method=method, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+    
+    response = client.post('/api/auth/signup', json={
+        'email': 'admin@sla.test', 'password': PASSWORD, 'full_name': 'Admin', 'country': 'United States'})
+    admin_token = response.get_json()['access_token']
+    
+    ids, tokens = {}, {}
+    for key, role in (('cfo', 'manager'), ('controller', 'manager'), ('deputy', 'manager'), ('employee', 'employee')):
+        response = call('POST', '/api/auth/users', admin_token, json={
+            'email': f'{key}@sla.test', 'password': PASSWORD, 'full_name': key.title(), 'role': role})
+        ids[key] = response.get_json()['user']['id']
+        tokens[key] = client.post('/api/auth/login', json={
+            'email': f'{key}@sla.test', 'password': PASSWORD}).get_json()['access_token']
+    
+    call('POST', '/api/rules/', admin_token, json={
+        'name': 'Software sign-off', 'rule_type': 'conditional', 'category': 'Software',
+        'conditions': {'specific_approvers': [ids['cfo'], ids['controller']], 'operator': 'AND'},
+        'sla_hours': 1, 'escalation_user_id': ids['deputy']})
+    response = call('POST', '/api/expenses/', tokens['employee'], json={
+        'amount': 300, 'original_currency': 'USD', 'category': 'Software',
+        'description': 'IDE licences', 'expense_date': date.today().isoformat()})
+    expense_id = response.get_json()['expense']['id']
+    
+    # The CFO lets the step run past its SLA
+    with app.app_context():
+        step = ApprovalStep.query.filter_by(expense_id=expense_id, approver_id=ids['cfo']).one()
+        step.due_at = datetime.utcnow() - timedelta(minutes=5)
+        db.session.commit()
+        totals = SlaService().sweep()
+        step = db.session.get(ApprovalStep, step.id)
+        check("overdue CFO step escalates to the rule's escalation user",
+              totals['escalated'] == 1 and step.approver_id == ids['deputy']
+              and step.original_approver_id == ids['cfo'], f'approver_id={step.approver_id}')
+    
+    def expense_status():
+        with app.app_context():
+            return db.session.get(Expense, expense_id).status
+    
+    response = call('POST', f'/api/approvals/{expense_id}/approve', tokens['deputy'], json={'comments': 'For the CFO'})
+    check('escalation user approves the escalated step', response.status_code == 200, str(response.status_code))
+    check('expense still waits for the controller', expense_status() == 'pending', expense_status())
+    
+    response = call('POST', f'/api/approvals/{expense_id}/approve', tokens['controller'], json={'comments': 'OK'})
+    check('controller approves', response.status_code == 200, str(response.status_code))
+    check('escalated step counts as the CFO for the AND condition', expense_status() == 'approved', expense_status())
+    
+    if failures:
+        sys.exit(1)
+    print("✓ Escalated conditional steps keep their approver's place")
+
+
+if __name__ == '__main__':
+    main()
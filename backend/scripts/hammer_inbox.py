@@ -0,0 +1,206 @@
+"""
+Concurrency check for the approval inbox.
+
+Seeds one company through the API, then runs worker threads that submit,
+edit, delete, approve and reject expenses at the same time. Several
+threads deliberately race on the same inbox items, so the same step is
+often approved twice or approved and rejected concurrently. Afterwards
+`InboxService.reconcile(dry_run=True)` must find no drift between
+approval_steps, approval_inbox_items and approval_inbox_counters.
+
+    python scripts/hammer_inbox.py --threads 8 --seconds 20
+
+The default database is a temporary SQLite file, where writers take turns.
+Point it at a scratch PostgreSQL database to get real row-level races.
+Its tables are DROPPED and recreated:
+
+    python scripts/hammer_inbox.py --database-url postgresql://localhost/expense_hammer
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PASSWORD = 'hammer-password'
+
+
+def fake_get(url, *args, **kwargs):
+    """Offline stand-in for the country and exchange-rate APIs"""
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+        
+        def json(self):
+            if 'restcountries' in url:
+                return [{'name': {'common': 'United States'}, 'currencies': {'USD': {}}}]
+            return {'base': 'USD', 'rates': {'USD': 1.0, 'EUR': 0.92}}
+    return FakeResponse()
+
+
+def serialize_sqlite_writers(engine):
+    """
+    SQLite ignores FOR UPDATE and starts transactions lazily, so a route could
+    read an expense before another commits its transition. BEGIN IMMEDIATE
+    takes the write lock up front, as the row lock does on PostgreSQL.
+    """
+    from sqlalchemy import event
+    
+    @event.listens_for(engine, 'connect')
+    def _no_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+    
+    @event.listens_for(engine, 'begin')
+    def _begin_immediate(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--threads', type=int, default=6)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--employees', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+    
+    os.environ['DATABASE_URL'] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='hammer-inbox-'), 'hammer.db')}"
+    os.environ['SQLALCHEMY_ECHO'] = 'False'
+    os.environ['METRICS_MULTIPROC_DIR'] = ''
+    os.environ['RATE_LIMIT_ENABLED'] = 'False'
+    
+    import requests
+    requests.get = fake_get
+    
+    from app import create_app
+    from database import db
+    from services.inbox_service import InboxService
+    
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            serialize_sqlite_writers(db.engine)
+        db.drop_all()
+        db.create_all()
+    
+    client = app.test_client()
+    
+    def call(method, path, token=None, client=client, **kwargs):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return client.open(path, method=method, headers=headers, **kwargs)
+    
+    # ----- Seed: two managers who both approve Software, a sequential Travel chain -----
+    admin = call('POST', '/api/auth/signup', json={
+        'email': 'admin@hammer.test', 'password': PASSWORD, 'full_name': 'Admin', 'country': 'United States'
+    }).get_json()['access_token']
+    
+    users = {}
+    
+    def create_user(key, role, manager=None):
+        response = call('POST', '/api/auth/users', admin, json={
+            'email': f'{key}@hammer.test', 'password': PASSWORD, 'full_name': key.title(), 'role': role,
+            'manager_id': users.get(manager, {}).get('id'), 'is_manager_approver': True})
+        users[key] = {'id': response.get_json()['user']['id']}
+    
+    create_user('lead_a', 'manager')
+    create_user('lead_b', 'manager')
+    for index in range(args.employees):
+        create_user(f'employee_{index}', 'employee', manager='lead_a' if index % 2 else 'lead_b')
+    for key in users:
+        users[key]['token'] = call('POST', '/api/auth/login', json={
+            'email': f'{key}@hammer.test', 'password': PASSWORD}).get_json()['access_token']
+    
+    call('POST', '/api/rules/', admin, json={
+        'name': 'Software', 'rule_type': 'conditional', 'category': 'Software',
+        'conditions': {'specific_approvers': [users['lead_a']['id'], users['lead_b']['id']], 'operator': 'OR'}})
+    call('POST', '/api/rules/', admin, json={
+        'name': 'Travel', 'rule_type': 'sequential', 'category': 'Travel',
+        'approval_sequence': [users['lead_a']['id'], users['lead_b']['id']]})
+    
+    approvers = ['lead_a', 'lead_b']
+    employees = [key for key in users if key.startswith('employee_')]
+    categories = ['Software', 'Travel', 'Food']
+    
+    # ----- Hammer -----
+    outcomes = Counter()
+    outcomes_lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    
+    def record(operation, response):
+        with outcomes_lock:
+            outcomes[(operation, response.status_code)] += 1
+    
+    def worker(seed):
+        rng = random.Random(seed)
+        own = app.test_client()
+        while time.monotonic() < deadline:
+            roll = rng.random()
+            if roll < 0.35:
+                who = rng.choice(employees)
+                record('submit', call('POST', '/api/expenses/', users[who]['token'], client=own, json={
+                    'amount': round(rng.uniform(5, 500), 2), 'original_currency': rng.choice(['USD', 'EUR']),
+                    'category': rng.choice(categories),
+                    'expense_date': (date.today() - timedelta(days=rng.randint(0, 60))).isoformat()}))
+                continue
+            
+            if roll < 0.85:
+                who = rng.choice(approvers)
+                items = call('GET', '/api/approvals/inbox?per_page=3', users[who]['token'],
+                             client=own).get_json().get('items', [])
+                if not items:
+                    continue
+                # Everyone grabs from the top of the inbox, so actions collide
+                expense_id = rng.choice(items)['expense_id']
+                action = 'approve' if rng.random() < 0.75 else 'reject'
+                record(action, call('POST', f'/api/approvals/{expense_id}/{action}', users[who]['token'],
+                                    client=own, json={'comments': 'hammer'}))
+                continue
+            
+            who = rng.choice(employees)
+            expenses = call('GET', '/api/expenses/?status=pending&per_page=5', users[who]['token'],
+                            client=own).get_json().get('expenses', [])
+            if not expenses:
+                continue
+            expense_id = rng.choice(expenses)['id']
+            if roll < 0.93:
+                record('edit', call('PUT', f'/api/expenses/{expense_id}', users[who]['token'], client=own,
+                                    json={'amount': round(rng.uniform(5, 500), 2)}))
+            else:
+                record('delete', call('DELETE', f'/api/expenses/{expense_id}', users[who]['token'], client=own))
+    
+    threads = [threading.Thread(target=worker, args=(args.seed + index,)) for index in range(args.threads)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    
+    print(f"{sum(outcomes.values())} requests in {elapsed:.1f}s on {args.threads} threads")
+    for (operation, status), count in sorted(outcomes.items()):
+        print(f"  {operation:<8} {status}  {count}")
+    
+    # ----- Verify -----
+    with app.app_context():
+        from models import ApprovalInboxCounter
+        drift = InboxService().reconcile(dry_run=True)
+        negative = ApprovalInboxCounter.query.filter(ApprovalInboxCounter.pending_count < 0).count()
+    
+    print(f"drift: {drift}, negative counters: {negative}")
+    if any(drift.values()) or negative:
+        print("✗ Inbox drifted from approval_steps under concurrent transitions")
+        sys.exit(1)
+    print("✓ Inbox and counters match approval_steps")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""
+Generate realistic synthetic tenants for load testing and hardware sizing.
+
+Each company gets an admin, a deep manager tree, approval rules of every
+rule_type, and expenses across currencies and categories with ApprovalStep
+histories that follow the same routing as the API. Rows are written with bulk
+Core inserts and pre-assigned ids, so millions of expenses take minutes, not
+hours.
+
+Every seeded user's password is --password. Logins are admin@company<N>.example,
+manager<M>@company<N>.example and employee<E>@company<N>.example.
+
+Usage:
+    python scripts/seed_data.py --companies 5 --employees 200 --expenses 200000
+    python scripts/seed_data.py --database-url postgresql://user:pw@localhost/bench --expenses 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+CATEGORIES = ['Travel', 'Food', 'Office Supplies', 'Software', 'Training', 'Accommodation', 'Other']
+CURRENCIES = ['USD', 'EUR', 'GBP', 'INR', 'JPY', 'AUD', 'CAD']
+COUNTRIES = [('United States', 'USD'), ('Germany', 'EUR'), ('United Kingdom', 'GBP'), ('India', 'INR'),
+             ('Japan', 'JPY')]
+DEFAULT_PASSWORD = 'password123'
+
+
+class IdAllocator:
+    """
+    Hands out primary keys above the current maximum so rows can be bulk
+    inserted without a RETURNING round trip per batch
+    """
+    
+    def __init__(self, db, models):
+        self.next_ids = {}
+        for model in models:
+            current = db.session.query(db.func.max(model.id)).scalar() or 0
+            self.next_ids[model.__tablename__] = current + 1
+    
+    def take(self, model):
+        value = self.next_ids[model.__tablename__]
+        self.next_ids[model.__tablename__] = value + 1
+        return value
+
+
+class TenantGenerator:
+    def __init__(self, db, rng, password_hash, batch_size=5000):
+        from models import ApprovalRule, ApprovalStep, Company, Expense, User
+        
+        self.db = db
+        self.rng = rng
+        self.password_hash = password_hash
+        self.batch_size = batch_size
+        self.models = {'company': Company, 'user': User, 'rule': ApprovalRule,
+                       'expense': Expense, 'step': ApprovalStep}
+        self.ids = IdAllocator(db, self.models.values())
+    
+    def _insert(self, model, rows):
+        for start in range(0, len(rows), self.batch_size):
+            self.db.session.execute(model.__table__.insert(), rows[start:start + self.batch_size])
+    
+    def create_company(self, index, employees, fanout, team_size):
+        """
+        Create a company with an admin, manager tree and employees
+        
+        Returns:
+            Dictionary describing the tenant (ids used by later steps)
+        """
+        Company, User = self.models['company'], self.models['user']
+        country, currency = COUNTRIES[index % len(COUNTRIES)]
+        now = datetime.utcnow()
+        company_id = self.ids.take(Company)
+        self._insert(Company, [{'id': company_id, 'name': f'Company {index}', 'country': country,
+                                'currency': currency, 'created_at': now, 'updated_at': now}])
+        
+        users = []
+        
+        def add_user(email, name, role, manager_id):
+            user_id = self.ids.take(User)
+            users.append({'id': user_id, 'email': email, 'password_hash': self.password_hash,
+                          'full_name': name, 'role': role, 'company_id': company_id,
+                          'manager_id': manager_id, 'is_manager_approver': manager_id is not None,
+                          'created_at': now, 'updated_at': now})
+            return user_id
+        
+        domain = f'company{index}.example'
+        admin_id = add_user(f'admin@{domain}', f'Admin {index}', 'admin', None)
+        
+        # Grow the manager tree breadth-first with a small fanout so it gets deep
+        managers_needed = max(1, -(-employees // team_size))
+        managers = [add_user(f'manager1@{domain}', 'Manager 1', 'manager', admin_id)]
+        frontier = list(managers)
+        while len(managers) < managers_needed:
+            parent = frontier.pop(0)
+            for _ in range(fanout):
+                if len(managers) >= managers_needed:
+                    break
+                number = len(managers) + 1
+                manager_id = add_user(f'manager{number}@{domain}', f'Manager {number}', 'manager', parent)
+                managers.append(manager_id)
+                frontier.append(manager_id)
+        
+        leaves = frontier or managers
+        employee_ids = []
+        manager_of = {}
+        for number in range(1, employees + 1):
+            manager_id = leaves[(number - 1) % len(leaves)]
+            employee_id = add_user(f'employee{number}@{domain}', f'Employee {number}', 'employee', manager_id)
+            employee_ids.append(employee_id)
+            manager_of[employee_id] = manager_id
+        
+        self._insert(User, users)
+        
+        rules = self._create_rules(company_id, admin_id, managers, now)
+        return {
+            'id': company_id,
+            'currency': currency,
+            'admin_id': admin_id,
+            'managers': managers,
+            'employees': employee_ids,
+            'manager_of': manager_of,
+            'rules': rules,
+        }
+    
+    def _create_rules(self, company_id, admin_id, managers, now):
+        ApprovalRule = self.models['rule']
+        senior = managers[:3]
+        definitions = [
+            {'name': 'Large travel', 'rule_type': 'sequential', 'category': 'Travel',
+             'min_amount': Decimal('500'), 'max_amount': None,
+             'approval_sequence': senior + [admin_id], 'conditions': None},
+            {'name': 'Software purchases', 'rule_type': 'conditional', 'category': 'Software',
+             'min_amount': None, 'max_amount': None, 'approval_sequence': None,
+             'conditions': {'percentage': 60, 'specific_approvers': senior[:2] + [admin_id], 'operator': 'OR'}},
+            {'name': 'Training budget', 'rule_type': 'hybrid', 'category': 'Training',
+             'min_amount': Decimal('1000'), 'max_amount': None,
+             'approval_sequence': senior[:2],
+             'conditions': {'specific_approvers': [admin_id], 'operator': 'OR'}},
+            {'name': 'Everything large', 'rule_type': 'sequential', 'category': None,
+             'min_amount': Decimal('5000'), 'max_amount': None,
+             'approval_sequence': [senior[0], admin_id], 'conditions': None},
+        ]
+        rows = []
+        for definition in definitions:
+            rows.append(dict(definition, id=self.ids.take(ApprovalRule), company_id=company_id,
+                             description='Seeded rule', is_active=True, created_at=now, updated_at=now))
+        self._insert(ApprovalRule, rows)
+        return rows
+    
+    @staticmethod
+    def _matching_rule(rules, amount, category):
+        # Same first-match semantics as _create_approval_workflow
+        for rule in rules:
+            if rule['min_amount'] and amount < rule['min_amount']:
+                continue
+            if rule['max_amount'] and amount > rule['max_amount']:
+                continue
+            if rule['category'] and rule['category'] != category:
+                continue
+            return rule
+        return None
+    
+    def create_expenses(self, tenant, count, history_days=730):
+        """
+        Insert `count` expenses with approval step histories for a tenant
+        """
+        Expense, ApprovalStep = self.models['expense'], self.models['step']
+        rng = self.rng
+        today = date.today()
+        currencies = [tenant['currency']] * 6 + CURRENCIES
+        
+        expenses, steps = [], []
+        for _ in range(count):
+            employee_id = rng.choice(tenant['employees'])
+            category = rng.choice(CATEGORIES)
+            amount = Decimal(str(round(min(rng.lognormvariate(4.5, 1.2), 99999), 2)))
+            expense_date = today - timedelta(days=rng.randint(0, history_days))
+            created_at = datetime.combine(expense_date, datetime.min.time()) + timedelta(
+                days=rng.randint(0, 10), minutes=rng.randint(0, 1439))
+            age_days = (today - expense_date).days
+            
+            roll = rng.random()
+            if age_days > 30:
+                status = 'approved' if roll < 0.75 else 'rejected' if roll < 0.9 else 'pending'
+            else:
+                status = 'pending' if roll < 0.7 else 'approved' if roll < 0.9 else 'rejected'
+            
+            expense_id = self.ids.take(Expense)
+            rule = self._matching_rule(tenant['rules'], amount, category)
+            if rule is None:
+                approvers = [tenant['manager_of'][employee_id]]
+                sequential = True
+            elif rule['rule_type'] == 'conditional':
+                approvers = rule['conditions']['specific_approvers']
+                sequential = False
+            else:
+                approvers = rule['approval_sequence']
+                sequential = True
+            
+            decided = rng.randint(1, len(approvers)) if status != 'pending' else rng.randint(0, len(approvers) - 1)
+            current_step = 0
+            for order, approver_id in enumerate(approvers, start=1):
+                action_at = None
+                if status == 'approved' and order <= decided:
+                    step_status, action_at = 'approved', created_at + timedelta(hours=order * 5)
+                elif status == 'rejected' and order == decided:
+                    step_status, action_at = 'rejected', created_at + timedelta(hours=order * 5)
+                elif status == 'rejected' and order < decided:
+                    step_status, action_at = 'approved', created_at + timedelta(hours=order * 5)
+                elif status == 'pending' and order <= decided:
+                    step_status, action_at = 'approved', created_at + timedelta(hours=order * 5)
+                elif status == 'pending' and (order == decided + 1 or not sequential):
+                    step_status = 'pending'
+                    current_step = current_step or order
+                else:
+                    step_status = 'waiting' if sequential else 'pending'
+                steps.append({'id': self.ids.take(ApprovalStep), 'expense_id': expense_id,
+                              'approver_id': approver_id, 'step_order': order, 'status': step_status,
+                              'comments': 'Seeded' if action_at else None,
+                              'created_at': created_at, 'action_taken_at': action_at})
+            
+            expenses.append({'id': expense_id, 'employee_id': employee_id, 'company_id': tenant['id'],
+                             'amount': amount, 'original_currency': rng.choice(currencies),
+                             'category': category, 'description': f'{category} expense',
+                             'expense_date': expense_date, 'receipt_url': None,
+                             'vendor_name': f'Vendor {rng.randint(1, 500)}', 'status': status,
+                             'current_approval_step': current_step, 'created_at': created_at,
+                             'updated_at': created_at})
+            
+            if len(expenses) >= self.batch_size:
+                self._flush(expenses, steps)
+                expenses, steps = [], []
+        
+        self._flush(expenses, steps)
+    
+    def _flush(self, expenses, steps):
+        Expense, ApprovalStep = self.models['expense'], self.models['step']
+        if expenses:
+            self._insert(Expense, expenses)
+        if steps:
+            self._insert(ApprovalStep, steps)
+        self.db.session.commit()
+    
+    def sync_sequences(self):
+        """
+        Move PostgreSQL id sequences past the pre-assigned ids
+        """
+        if self.db.session.get_bind().dialect.name != 'postgresql':
+            return
+        from sqlalchemy import text
+        for table in self.ids.next_ids:
+            self.db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 1))"
+            ))
+        self.db.session.commit()
+
+
+def seed(db, companies=2, employees=50, expenses=10000, fanout=3, team_size=8,
+         password=DEFAULT_PASSWORD, seed_value=42, batch_size=5000, rebuild_rollups=True, log=print):
+    """
+    Seed synthetic tenants into the database bound to the current app context
+    
+    Returns:
+        List of tenant dictionaries (company id, admin/manager/employee ids)
+    """
+    from werkzeug.security import generate_password_hash
+    
+    rng = random.Random(seed_value)
+    generator = TenantGenerator(db, rng, generate_password_hash(password), batch_size=batch_size)
+    tenants = []
+    per_company = expenses // companies
+    
+    for index in range(1, companies + 1):
+        started = time.perf_counter()
+        tenant = generator.create_company(index, employees, fanout, team_size)
+        generator.create_expenses(tenant, per_company)
+        tenants.append(tenant)
+        log(f"  company {tenant['id']}: {len(tenant['managers'])} managers, "
+            f"{len(tenant['employees'])} employees, {per_company:,} expenses "
+            f"({time.perf_counter() - started:.1f}s)")
+    
+    generator.sync_sequences()
+    
+    from services.company_amount_service import CompanyAmountService
+    updated, skipped = CompanyAmountService().backfill(batch_size=batch_size)
+    log(f"  company amounts: {updated:,} converted, {skipped:,} without a rate")
+    
+    if rebuild_rollups:
+        from services.rollup_service import RollupService
+        rollup_service = RollupService()
+        for tenant in tenants:
+            rollup_service.rebuild(company_id=tenant['id'])
+        log("  rollups rebuilt")
+    
+    from services.inbox_service import InboxService
+    inbox_service = InboxService()
+    for tenant in tenants:
+        inbox_service.reconcile(company_id=tenant['id'])
+    log("  approval inboxes built")
+    
+    return tenants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL / config')
+    parser.add_argument('--companies', type=int, default=2)
+    parser.add_argument('--employees', type=int, default=50, help='Employees per company')
+    parser.add_argument('--expenses', type=int, default=10000, help='Total expenses across all companies')
+    parser.add_argument('--fanout', type=int, default=3, help='Direct reports per manager (smaller = deeper tree)')
+    parser.add_argument('--team-size', type=int, default=8, help='Employees per leaf manager')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild dashboard rollups')
+    parser.add_argument('--create-tables', action='store_true', help='Run db.create_all() first')
+    args = parser.parse_args()
+    
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    
+    from app import create_app
+    from database import db
+    
+    app = create_app()
+    with app.app_context():
+        if args.create_tables:
+            db.create_all()
+        print(f"Seeding {args.companies} companies, {args.expenses:,} expenses...")
+        started = time.perf_counter()
+        seed(db, companies=args.companies, employees=args.employees, expenses=args.expenses,
+             fanout=args.fanout, team_size=args.team_size, password=args.password,
+             seed_value=args.seed, batch_size=args.batch_size, rebuild_rollups=not args.skip_rollups)
+        print(f"✓ Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
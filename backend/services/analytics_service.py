@@ -0,0 +1,311 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import select
+from database import db
+from models import Expense
+from services.currency_service import CurrencyService
+from services.rate_history import rate_history
+from utils.metrics import record_cache_lookup
+
+# date.toordinal() of 1970-01-01, to turn datetime64[D] values into ordinals
+EPOCH_ORDINAL = 719163
+
+
+def factorize(values):
+    """
+    Encode an array of labels as integer codes in a single hash pass
+    (np.unique on object arrays sorts Python strings and is much slower)
+    
+    Returns:
+        Tuple of (sorted unique labels, int64 codes into that array)
+    """
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values),
+                        dtype=np.int64, count=len(values))
+    labels = np.array(list(lookup), dtype=object)
+    order = np.argsort(labels) if len(labels) else np.array([], dtype=np.int64)
+    remap = np.empty(len(labels), dtype=np.int64)
+    remap[order] = np.arange(len(labels))
+    return labels[order], remap[codes]
+
+
+def rolling_spend(days, amounts, windows=(30, 90), last_days=None):
+    """
+    Trailing-window spend totals per calendar day
+    
+    Args:
+        days: datetime64[D] array of expense dates
+        amounts: float array of amounts (same length)
+        windows: Window sizes in days
+        last_days: Only return the most recent N days of the series
+    
+    Returns:
+        Dictionary with 'dates', 'daily' and one 'rolling_<n>d' series per window
+    """
+    if len(days) == 0:
+        return {'dates': [], 'daily': []} | {f'rolling_{w}d': [] for w in windows}
+    
+    start = days.min()
+    index = (days - start).astype(np.int64)
+    n_days = int(index.max()) + 1
+    
+    daily = np.bincount(index, weights=amounts, minlength=n_days)
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    positions = np.arange(1, n_days + 1)
+    
+    result = {}
+    for window in windows:
+        lower = np.maximum(positions - window, 0)
+        result[f'rolling_{window}d'] = cumulative[positions] - cumulative[lower]
+    
+    offset = max(n_days - last_days, 0) if last_days else 0
+    dates = start + np.arange(offset, n_days)
+    
+    series = {'dates': [str(d) for d in dates], 'daily': np.round(daily[offset:], 2).tolist()}
+    for key, values in result.items():
+        series[key] = np.round(values[offset:], 2).tolist()
+    return series
+
+
+def employee_outliers(employee_ids, amounts, threshold=3.0, min_samples=5):
+    """
+    Find expenses whose amount is unusual for the submitting employee
+    
+    Args:
+        employee_ids: int array of employee ids
+        amounts: float array of amounts
+        threshold: Minimum absolute z-score to report
+        min_samples: Employees with fewer expenses are skipped
+    
+    Returns:
+        Tuple of (row indices, z-scores, employee means, employee stds),
+        ordered by descending absolute z-score
+    """
+    if len(amounts) == 0:
+        empty = np.array([], dtype=np.float64)
+        return np.array([], dtype=np.int64), empty, empty, empty
+    
+    _, inverse = np.unique(employee_ids, return_inverse=True)
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=amounts)
+    squares = np.bincount(inverse, weights=amounts * amounts)
+    
+    means = sums / counts
+    stds = np.sqrt(np.maximum(squares / counts - means * means, 0.0))
+    
+    row_means = means[inverse]
+    row_stds = stds[inverse]
+    eligible = (counts[inverse] >= min_samples) & (row_stds > 0)
+    
+    z_scores = np.zeros_like(amounts)
+    z_scores[eligible] = (amounts[eligible] - row_means[eligible]) / row_stds[eligible]
+    
+    rows = np.nonzero(np.abs(z_scores) >= threshold)[0]
+    rows = rows[np.argsort(-np.abs(z_scores[rows]), kind='stable')]
+    return rows, z_scores[rows], row_means[rows], row_stds[rows]
+
+
+def category_mix(days, categories, amounts):
+    """
+    Monthly spend per category and each category's share of the month
+    
+    Returns:
+        Dictionary with 'months', 'categories', 'totals' (months x categories)
+        and 'shares' (same shape, rows sum to 1)
+    """
+    if len(days) == 0:
+        return {'months': [], 'categories': [], 'totals': [], 'shares': []}
+    
+    months, month_index = np.unique(days.astype('datetime64[M]'), return_inverse=True)
+    names, category_index = factorize(categories)
+    
+    cells = month_index * len(names) + category_index
+    totals = np.bincount(cells, weights=amounts, minlength=len(months) * len(names))
+    totals = totals.reshape(len(months), len(names))
+    
+    month_totals = totals.sum(axis=1, keepdims=True)
+    shares = np.divide(totals, month_totals, out=np.zeros_like(totals), where=month_totals > 0)
+    
+    return {
+        'months': [str(m) for m in months],
+        'categories': names.tolist(),
+        'totals': np.round(totals, 2).tolist(),
+        'shares': np.round(shares, 4).tolist(),
+    }
+
+
+class AnalyticsService:
+    """
+    Columnar spend analytics over a company's expense history.
+    
+    Columns are streamed from the database in one query into NumPy arrays and
+    all aggregation is vectorized. Results are cached per company and dropped
+    as soon as the company's expenses change.
+    """
+    
+    COLUMNS = ('id', 'expense_date', 'amount', 'category', 'employee_id', 'original_currency',
+               'amount_company_currency')
+    
+    def __init__(self, max_cache_entries=256):
+        self.currency_service = CurrencyService()
+        self.max_cache_entries = max_cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def load_columns(self, company_id, exclude_status=('rejected',), batch_size=50000):
+        """
+        Stream the analytics columns for a company into NumPy arrays
+        
+        Returns:
+            Dictionary of arrays keyed by column name
+        """
+        stmt = select(*[getattr(Expense, name) for name in self.COLUMNS]).where(
+            Expense.company_id == company_id
+        )
+        if exclude_status:
+            stmt = stmt.where(Expense.status.notin_(exclude_status))
+        
+        result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+        
+        chunks = {name: [] for name in self.COLUMNS}
+        for partition in result.partitions():
+            columns = list(zip(*partition))
+            chunks['id'].append(np.array(columns[0], dtype=np.int64))
+            chunks['expense_date'].append(np.array(columns[1], dtype='datetime64[D]'))
+            chunks['amount'].append(np.array(columns[2], dtype=np.float64))
+            chunks['category'].append(np.array(columns[3], dtype=object))
+            chunks['employee_id'].append(np.array(columns[4], dtype=np.int64))
+            chunks['original_currency'].append(np.array(columns[5], dtype=object))
+            chunks['amount_company_currency'].append(np.array(
+                [np.nan if value is None else value for value in columns[6]], dtype=np.float64))
+        
+        empty = {
+            'id': np.int64, 'expense_date': 'datetime64[D]', 'amount': np.float64,
+            'category': object, 'employee_id': np.int64, 'original_currency': object,
+            'amount_company_currency': np.float64,
+        }
+        return {
+            name: np.concatenate(parts) if parts else np.array([], dtype=empty[name])
+            for name, parts in chunks.items()
+        }
+    
+    def to_company_currency(self, columns, company_currency):
+        """
+        Convert amounts at the rate in effect on each expense date
+        
+        Stored amount_company_currency values are used as-is. For the rest,
+        historical rates come from the in-memory rate index (one searchsorted
+        per currency); rows without a stored rate use one live rate per currency.
+        
+        Returns:
+            Tuple of (converted amounts, boolean mask of rows that could be converted)
+        """
+        # Rows converted at write time already carry the company-currency amount
+        converted = columns['amount_company_currency'].copy()
+        pending = np.isnan(converted)
+        if not pending.any():
+            return converted, ~pending
+        
+        currencies, inverse = factorize(columns['original_currency'])
+        ordinals = columns['expense_date'].astype(np.int64) + EPOCH_ORDINAL
+        inverse = np.where(pending, inverse, -1)
+        
+        # Live quotes are units of each currency per one unit of company currency
+        quotes = None
+        for code_index, currency in enumerate(currencies):
+            rows = inverse == code_index
+            if currency == company_currency:
+                converted[rows] = columns['amount'][rows]
+                continue
+            
+            try:
+                rates = rate_history.rates_on(currency, company_currency, ordinals[rows])
+            except Exception as e:
+                print(f"Error reading rate history: {e}")
+                rates = np.full(int(rows.sum()), np.nan)
+            
+            missing = np.isnan(rates)
+            if missing.any():
+                if quotes is None:
+                    quotes = self.currency_service.get_exchange_rates(company_currency)
+                live = quotes.get(currency)
+                rates[missing] = 1.0 / live if live else np.nan
+            converted[rows] = columns['amount'][rows] * rates
+        
+        return converted, ~np.isnan(converted)
+    
+    def _fingerprint(self, company_id):
+        """
+        Cheap aggregate that changes whenever a company's expenses change
+        """
+        return tuple(db.session.execute(
+            select(db.func.count(Expense.id), db.func.max(Expense.id), db.func.max(Expense.updated_at))
+            .where(Expense.company_id == company_id)
+        ).one())
+    
+    def _cached(self, company, kind, params, compute):
+        key = (company.id, kind, params)
+        fingerprint = self._fingerprint(company.id)
+        
+        with self._lock:
+            entry = self._cache.get(key)
+            hit = bool(entry and entry[0] == fingerprint)
+            record_cache_lookup('analytics', hit)
+            if hit:
+                self._cache.move_to_end(key)
+                return entry[1]
+        
+        columns = self.load_columns(company.id)
+        amounts, valid = self.to_company_currency(columns, company.currency)
+        value = compute({name: values[valid] for name, values in columns.items()}, amounts[valid])
+        value['unconverted_rows'] = int((~valid).sum())
+        value['currency'] = company.currency
+        
+        with self._lock:
+            self._cache[key] = (fingerprint, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return value
+    
+    def invalidate(self, company_id):
+        """
+        Drop every cached result for a company in this worker
+        """
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == company_id]:
+                del self._cache[key]
+    
+    def spend_trends(self, company, windows=(30, 90), last_days=365):
+        return self._cached(company, 'trends', (windows, last_days), lambda columns, amounts: rolling_spend(
+            columns['expense_date'], amounts, windows=windows, last_days=last_days
+        ))
+    
+    def outliers(self, company, threshold=3.0, min_samples=5, limit=100):
+        def compute(columns, amounts):
+            rows, z_scores, means, stds = employee_outliers(
+                columns['employee_id'], amounts, threshold=threshold, min_samples=min_samples
+            )
+            return {
+                'total': int(len(rows)),
+                'outliers': [
+                    {
+                        'expense_id': int(columns['id'][row]),
+                        'employee_id': int(columns['employee_id'][row]),
+                        'expense_date': str(columns['expense_date'][row]),
+                        'category': columns['category'][row],
+                        'amount': round(float(amounts[row]), 2),
+                        'employee_mean': round(float(mean), 2),
+                        'employee_std': round(float(std), 2),
+                        'z_score': round(float(z), 2),
+                    }
+                    for row, z, mean, std in zip(rows[:limit], z_scores[:limit], means[:limit], stds[:limit])
+                ],
+            }
+        return self._cached(company, 'outliers', (threshold, min_samples, limit), compute)
+    
+    def category_mix(self, company):
+        return self._cached(company, 'category_mix', (), lambda columns, amounts: category_mix(
+            columns['expense_date'], columns['category'], amounts
+        ))
@@ -0,0 +1,265 @@
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from database import db
+from models import ApprovalStep, ArchivedExpense, Expense, User
+from services.change_log import record_changes
+
+CLOSED_STATUSES = ('approved', 'rejected')
+EXPENSES_FILE = 'expenses.parquet'
+STEPS_FILE = 'approval_steps.parquet'
+
+# Denormalized names stored next to the rows, so archived records still
+# render after the users are renamed or removed
+EXPENSE_EXTRAS = ('employee_name',)
+STEP_EXTRAS = ('approver_name', 'approver_email')
+
+# Rows per IN (...) list when selecting or deleting by id
+ID_CHUNK = 1000
+
+
+def _chunks(values, size=ID_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _arrow_schema(table, extras):
+    """
+    Parquet schema mirroring a SQLAlchemy table (Numeric stays exact as decimal)
+    """
+    import pyarrow as pa
+    
+    fields = []
+    for column in table.columns:
+        python_type = column.type.python_type
+        if python_type is int:
+            arrow_type = pa.int64()
+        elif python_type is Decimal:
+            arrow_type = pa.decimal128(column.type.precision, column.type.scale)
+        elif python_type is datetime:
+            arrow_type = pa.timestamp('us')
+        elif python_type is date:
+            arrow_type = pa.date32()
+        elif python_type is bool:
+            arrow_type = pa.bool_()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    fields.extend(pa.field(name, pa.string()) for name in extras)
+    return pa.schema(fields)
+
+
+class ArchiveService:
+    """
+    Moves closed expenses (and their approval steps) older than N years into
+    per-company, per-month Parquet files:
+        
+        ARCHIVE_DIR/company_<id>/<YYYY-MM>/expenses.parquet
+        ARCHIVE_DIR/company_<id>/<YYYY-MM>/approval_steps.parquet
+    
+    Each archived expense leaves an ArchivedExpense tombstone (id, company,
+    employee, date, directory) so single reads and exports can go through to
+    the files. pyarrow is imported only when the archive is used.
+    
+    Archived expenses and steps get an 'archived' change_events entry.
+    
+    Rollups are left untouched, so dashboards keep their historical totals;
+    `flask rollups rebuild` adds the archived rows back from the files
+    (iter_archived).
+    """
+    
+    def archive_dir(self):
+        return current_app.config.get('ARCHIVE_DIR')
+    
+    def _path(self, relative, name):
+        return os.path.join(self.archive_dir(), relative, name)
+    
+    # ----- Writing -----
+    
+    def _write(self, path, rows, schema, expense_column, expense_ids):
+        """
+        Merge rows into a Parquet file, replacing rows of the same expenses
+        already there (so re-running after a failed commit is harmless), and
+        swap the file in atomically
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        
+        table = pa.Table.from_pylist(rows, schema=schema)
+        if os.path.exists(path):
+            existing = pq.read_table(path, schema=schema)
+            replaced = pc.is_in(existing[expense_column], value_set=pa.array(expense_ids, type=pa.int64()))
+            table = pa.concat_tables([existing.filter(pc.invert(replaced)), table])
+        # Sorted by expense id so row-group statistics make id lookups cheap
+        table = table.sort_by([(expense_column, 'ascending'), ('id', 'ascending')])
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.tmp"
+        pq.write_table(table, temporary, compression=current_app.config.get('ARCHIVE_COMPRESSION', 'zstd'))
+        os.replace(temporary, path)
+    
+    def _archive_month(self, company_id, month, expense_rows, step_rows):
+        relative = f"company_{company_id}/{month.strftime('%Y-%m')}"
+        expense_ids = [row['id'] for row in expense_rows]
+        
+        self._write(self._path(relative, STEPS_FILE), step_rows,
+                    _arrow_schema(ApprovalStep.__table__, STEP_EXTRAS), 'expense_id', expense_ids)
+        self._write(self._path(relative, EXPENSES_FILE), expense_rows,
+                    _arrow_schema(Expense.__table__, EXPENSE_EXTRAS), 'id', expense_ids)
+        
+        # Files are durable; now swap the hot rows for tombstones in one transaction
+        db.session.execute(insert(ArchivedExpense), [
+            {'id': row['id'], 'company_id': company_id, 'employee_id': row['employee_id'],
+             'expense_date': row['expense_date'], 'archive_path': relative}
+            for row in expense_rows
+        ])
+        for chunk in _chunks(expense_ids):
+            db.session.execute(delete(ApprovalStep).where(ApprovalStep.expense_id.in_(chunk)))
+            db.session.execute(delete(Expense).where(Expense.id.in_(chunk)))
+        
+        # The deletes bypass the change-log flush hook; tell /api/changes readers
+        owners = {row['id']: row['employee_id'] for row in expense_rows}
+        record_changes([
+            {'company_id': company_id, 'entity': 'approval_step', 'entity_id': row['id'],
+             'expense_id': row['expense_id'], 'employee_id': owners[row['expense_id']],
+             'approver_id': row['approver_id'], 'op': 'archived'}
+            for row in step_rows
+        ] + [
+            {'company_id': company_id, 'entity': 'expense', 'entity_id': row['id'], 'expense_id': row['id'],
+             'employee_id': row['employee_id'], 'op': 'archived'}
+            for row in expense_rows
+        ])
+        db.session.commit()
+    
+    def archive(self, older_than_years, company_id=None, dry_run=False, log=None):
+        """
+        Archive approved/rejected expenses dated more than `older_than_years` ago
+        
+        Works one company-month at a time so every Parquet file is written
+        once per run and each month commits in its own transaction.
+        
+        Returns:
+            Tuple of (expenses archived, months written)
+        """
+        today = date.today()
+        cutoff = today.replace(year=today.year - older_than_years, day=1)
+        closed = [Expense.status.in_(CLOSED_STATUSES), Expense.expense_date < cutoff]
+        if company_id is not None:
+            closed.append(Expense.company_id == company_id)
+        
+        spans = db.session.execute(
+            select(Expense.company_id, db.func.min(Expense.expense_date))
+            .where(*closed).group_by(Expense.company_id).order_by(Expense.company_id)
+        ).all()
+        
+        archived = months = 0
+        for span_company_id, oldest in spans:
+            month = oldest.replace(day=1)
+            while month < cutoff:
+                next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+                rows = db.session.execute(
+                    select(Expense.__table__, User.full_name.label('employee_name'))
+                    .join(User, User.id == Expense.employee_id, isouter=True)
+                    .where(*closed, Expense.company_id == span_company_id,
+                           Expense.expense_date >= month, Expense.expense_date < next_month)
+                    .order_by(Expense.id)
+                ).mappings().all()
+                
+                if rows:
+                    expense_rows = [dict(row) for row in rows]
+                    step_rows = []
+                    for chunk in _chunks([row['id'] for row in expense_rows]):
+                        step_rows.extend(dict(row) for row in db.session.execute(
+                            select(ApprovalStep.__table__,
+                                   User.full_name.label('approver_name'), User.email.label('approver_email'))
+                            .join(User, User.id == ApprovalStep.approver_id, isouter=True)
+                            .where(ApprovalStep.expense_id.in_(chunk))
+                            .order_by(ApprovalStep.expense_id, ApprovalStep.step_order)
+                        ).mappings())
+                    
+                    if not dry_run:
+                        self._archive_month(span_company_id, month, expense_rows, step_rows)
+                    archived += len(expense_rows)
+                    months += 1
+                    if log:
+                        log(f"  company {span_company_id} {month.strftime('%Y-%m')}: "
+                            f"{len(expense_rows)} expenses, {len(step_rows)} steps")
+                month = next_month
+        
+        return archived, months
+    
+    # ----- Reading -----
+    
+    def read_expenses(self, relative, expense_ids=None, include_steps=False):
+        """
+        Read archived expenses from one company-month directory
+        
+        Returns:
+            List of dictionaries in the same shape as Expense.to_dict(), plus
+            'archived': True
+        """
+        import pyarrow.parquet as pq
+        
+        path = self._path(relative, EXPENSES_FILE)
+        if not os.path.exists(path):
+            return []
+        filters = [('id', 'in', list(expense_ids))] if expense_ids is not None else None
+        records = pq.read_table(path, filters=filters).to_pylist()
+        
+        steps = {}
+        if include_steps and records:
+            steps_path = self._path(relative, STEPS_FILE)
+            if os.path.exists(steps_path):
+                ids = [record['id'] for record in records]
+                for record in pq.read_table(steps_path, filters=[('expense_id', 'in', ids)]).to_pylist():
+                    steps.setdefault(record['expense_id'], []).append(record)
+        
+        results = []
+        for record in records:
+            extras = {name: record.pop(name, None) for name in EXPENSE_EXTRAS}
+            # Transient model instances (never added to a session) reuse to_dict()
+            data = Expense(**record).to_dict()
+            data.update(extras)
+            data['archived'] = True
+            if include_steps:
+                data['approval_steps'] = []
+                for step in sorted(steps.get(record['id'], []), key=lambda item: item['step_order']):
+                    step_extras = {name: step.pop(name, None) for name in STEP_EXTRAS}
+                    step_data = ApprovalStep(**step).to_dict()
+                    step_data.update(step_extras)
+                    data['approval_steps'].append(step_data)
+            results.append(data)
+        return results
+    
+    def iter_archived(self, company_id, columns):
+        """
+        Every archived expense of a company, read month by month from the
+        Parquet files the tombstones point at
+        
+        Raises:
+            FileNotFoundError: A tombstoned month's file is missing
+        """
+        paths = db.session.execute(
+            select(ArchivedExpense.archive_path).where(ArchivedExpense.company_id == company_id)
+            .distinct().order_by(ArchivedExpense.archive_path)
+        ).scalars().all()
+        if not paths:
+            return
+        
+        import pyarrow.parquet as pq
+        
+        for relative in paths:
+            path = self._path(relative, EXPENSES_FILE)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'Archived expenses missing: {path}')
+            yield from pq.read_table(path, columns=list(columns)).to_pylist()
+    
+    def load_expense(self, tombstone):
+        """
+        Full archived expense (with approval steps) for an ArchivedExpense row
+        """
+        found = self.read_expenses(tombstone.archive_path, [tombstone.id], include_steps=True)
+        return found[0] if found else None
@@ -0,0 +1,278 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import current_app, has_app_context, has_request_context
+from sqlalchemy import delete, event, func, insert, inspect, or_, select
+from sqlalchemy.orm import Session
+from database import db
+from models import ApprovalStep, ChangeEvent, Expense
+
+ENTITIES = ((Expense, 'expense'), (ApprovalStep, 'approval_step'))
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _row_changes(obj, created):
+    """
+    Column values set on a new object, or the columns changed on a dirty one
+    """
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        if created:
+            # Server defaults are expired after the flush; reading them would query
+            if attr.key in state.dict:
+                changes[attr.key] = _json_value(state.dict[attr.key])
+            continue
+        history = state.attrs[attr.key].history
+        if history.added and history.added[0] not in history.deleted:
+            changes[attr.key] = _json_value(history.added[0])
+    return changes
+
+
+def _current_user_id():
+    if not has_request_context():
+        return None
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        return get_jwt_identity()
+    except RuntimeError:
+        return None  # JWT not verified for this request
+
+
+def collect_changes(session):
+    """
+    Expense and approval-step mutations in the flush that just ran
+    
+    Returns:
+        List of change_events rows (dictionaries), expenses first
+    """
+    touched = []
+    for obj, op in [(obj, 'create') for obj in session.new] + \
+                   [(obj, 'update') for obj in session.dirty] + \
+                   [(obj, 'delete') for obj in session.deleted]:
+        for model, entity in ENTITIES:
+            if isinstance(obj, model):
+                touched.append((entity, obj, op))
+    if not touched:
+        return []
+    
+    # Owner and company of each step's expense: from the session, else one query
+    owners = {obj.id: (obj.company_id, obj.employee_id) for entity, obj, _ in touched if entity == 'expense'}
+    missing = {obj.expense_id for entity, obj, _ in touched if entity == 'approval_step'} - set(owners)
+    for expense_id in list(missing):
+        expense = session.identity_map.get(session.identity_key(Expense, expense_id))
+        if expense is not None:
+            owners[expense_id] = (expense.company_id, expense.employee_id)
+            missing.discard(expense_id)
+    if missing:
+        owners.update({
+            expense_id: (company_id, employee_id) for expense_id, company_id, employee_id in
+            session.connection().execute(
+                select(Expense.id, Expense.company_id, Expense.employee_id).where(Expense.id.in_(missing))
+            )
+        })
+    
+    now = datetime.utcnow()
+    actor_id = _current_user_id()
+    rows = []
+    for entity, obj, op in sorted(touched, key=lambda item: (item[0] != 'expense', item[1].id)):
+        changes = None
+        if op != 'delete':
+            changes = _row_changes(obj, created=op == 'create')
+            if not changes:
+                continue
+        expense_id = obj.id if entity == 'expense' else obj.expense_id
+        if expense_id not in owners:
+            continue
+        company_id, employee_id = owners[expense_id]
+        rows.append({
+            'company_id': company_id,
+            'entity': entity,
+            'entity_id': obj.id,
+            'expense_id': expense_id,
+            'employee_id': employee_id,
+            'approver_id': obj.approver_id if entity == 'approval_step' else None,
+            'actor_id': actor_id,
+            'op': op,
+            'changes': changes,
+            'created_at': now,
+        })
+    return rows
+
+
+def _log_enabled():
+    return not has_app_context() or current_app.config.get('CHANGE_LOG_ENABLED', True)
+
+
+def _write_change_events(session, flush_context):
+    """
+    after_flush hook: append the flush's expense/step mutations to
+    change_events in the same transaction (ids are assigned by then)
+    """
+    if not _log_enabled():
+        return
+    
+    rows = collect_changes(session)
+    if rows:
+        session.connection().execute(insert(ChangeEvent.__table__), rows)
+
+
+def record_changes(rows):
+    """
+    Append change_events for a bulk statement (which bypasses the flush
+    hook) in the caller's transaction
+    
+    Args:
+        rows: Dictionaries with company_id, entity, entity_id, expense_id,
+            employee_id and op, optionally approver_id and changes
+    """
+    if not rows or not _log_enabled():
+        return
+    now = datetime.utcnow()
+    actor_id = _current_user_id()
+    db.session.execute(insert(ChangeEvent.__table__), [{
+        'approver_id': None,
+        'actor_id': actor_id,
+        'created_at': now,
+        **row,
+        'changes': {key: _json_value(value) for key, value in row['changes'].items()}
+        if row.get('changes') else None,
+    } for row in rows])
+
+
+def install_change_log_listener():
+    """
+    Register the change-log hook on every ORM session (idempotent)
+    """
+    if not event.contains(Session, 'after_flush', _write_change_events):
+        event.listen(Session, 'after_flush', _write_change_events)
+
+
+class ChangeLogService:
+    """
+    Change feed over the change_events log.
+    
+    Every flush that touches expenses or approval steps appends one row per
+    changed object in the same transaction, so the log has an entry exactly
+    for each committed change. Ids are handed out in insert order, which can
+    differ from commit order under concurrent writers: an id can become
+    visible after a higher one. The feed therefore stops at the first event
+    younger than CHANGE_FEED_SETTLE_SECONDS, which holds as long as write
+    transactions are shorter than that. Bulk statements (archiving, the SLA
+    and company-amount backfills) bypass the ORM flush and log their rows
+    with record_changes().
+    """
+    
+    def _config(self, key, default):
+        return current_app.config.get(key, default)
+    
+    def feed(self, company_id, since=0, limit=500, employee_ids=None, approver_id=None):
+        """
+        Events after a cursor, oldest first
+        
+        Args:
+            company_id: Company of the reader
+            since: Cursor (last seq the client has applied)
+            limit: Maximum events returned
+            employee_ids: Only expenses of these employees (None = all)
+            approver_id: Also approval steps held by this user
+        
+        Returns:
+            Tuple of (events, next_cursor, has_more)
+        """
+        query = ChangeEvent.query.filter(ChangeEvent.company_id == company_id, ChangeEvent.id > since)
+        if employee_ids is not None:
+            scope = ChangeEvent.employee_id.in_(employee_ids)
+            if approver_id is not None:
+                scope = or_(scope, ChangeEvent.approver_id == approver_id)
+            query = query.filter(scope)
+        events = query.order_by(ChangeEvent.id).limit(limit + 1).all()
+        
+        settled_before = datetime.utcnow() - timedelta(seconds=self._config('CHANGE_FEED_SETTLE_SECONDS', 5))
+        for index, change in enumerate(events):
+            if change.created_at > settled_before:
+                events = events[:index]
+                # Unsettled events exist; the client polls again shortly
+                return events, (events[-1].id if events else since), False
+        
+        has_more = len(events) > limit
+        events = events[:limit]
+        return events, (events[-1].id if events else since), has_more
+    
+    # ----- Compaction -----
+    
+    @staticmethod
+    def _merge(rows):
+        """
+        Fold one entity's events into its last one: a delete or archived
+        stays as it is, anything else becomes a snapshot of every column the
+        rows set
+        """
+        last = rows[-1]
+        if last.op in ('delete', 'archived'):
+            return last.op, None
+        changes = {}
+        for row in rows:
+            changes.update(row.changes or {})
+        return 'snapshot', changes
+    
+    def compact(self, older_than_days=None, batch_size=500, log=None):
+        """
+        Fold every entity's events older than the cutoff into a single
+        snapshot row that keeps the id of its latest event, so cursors in
+        the compacted range still receive the entity's current fields
+        
+        Returns:
+            Dictionary with the number of 'entities' compacted and 'removed' rows
+        """
+        if older_than_days is None:
+            older_than_days = self._config('CHANGE_LOG_COMPACT_AFTER_DAYS', 90)
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        stats = {'entities': 0, 'removed': 0}
+        
+        horizon = db.session.execute(
+            select(func.max(ChangeEvent.id)).where(ChangeEvent.created_at < cutoff)
+        ).scalar()
+        if horizon is None:
+            return stats
+        
+        while True:
+            groups = db.session.execute(
+                select(ChangeEvent.entity, ChangeEvent.entity_id)
+                .where(ChangeEvent.id <= horizon)
+                .group_by(ChangeEvent.entity, ChangeEvent.entity_id)
+                .having(func.count() > 1)
+                .limit(batch_size)
+            ).all()
+            if not groups:
+                break
+            
+            removed = []
+            for _, entity in ENTITIES:
+                entity_ids = [entity_id for group_entity, entity_id in groups if group_entity == entity]
+                if not entity_ids:
+                    continue
+                by_entity = {}
+                for row in ChangeEvent.query.filter(
+                    ChangeEvent.entity == entity,
+                    ChangeEvent.entity_id.in_(entity_ids),
+                    ChangeEvent.id <= horizon
+                ).order_by(ChangeEvent.entity_id, ChangeEvent.id):
+                    by_entity.setdefault(row.entity_id, []).append(row)
+                for rows in by_entity.values():
+                    rows[-1].op, rows[-1].changes = self._merge(rows)
+                    removed.extend(row.id for row in rows[:-1])
+            
+            db.session.execute(delete(ChangeEvent).where(ChangeEvent.id.in_(removed)))
+            db.session.commit()
+            stats['entities'] += len(groups)
+            stats['removed'] += len(removed)
+            if log:
+                log(f"  {stats['entities']} entities compacted, {stats['removed']} events removed")
+        return stats
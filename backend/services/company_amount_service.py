@@ -0,0 +1,112 @@
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import select, update
+from database import db
+from models import Company, Expense
+from services.change_log import record_changes
+from services.currency_service import CurrencyService
+from services.rollup_service import RollupService
+
+CENTS = Decimal('0.01')
+
+
+class CompanyAmountService:
+    """
+    Maintains Expense.amount_company_currency and Expense.exchange_rate.
+    
+    Write paths call apply() whenever amount, currency or expense_date change;
+    backfill() fills rows written before the columns existed (or whose rate
+    was unavailable at the time) in keyset-paginated batches, moving the
+    rollups in the same transaction.
+    """
+    
+    def __init__(self, currency_service=None):
+        self.currency_service = currency_service or CurrencyService()
+    
+    def compute(self, amount, original_currency, company_currency, expense_date):
+        """
+        Returns:
+            Tuple of (rate, company-currency amount rounded to cents), or
+            (None, None) when no rate is available
+        """
+        rate = self.currency_service.get_rate(original_currency, company_currency, expense_date)
+        if rate is None:
+            return None, None
+        rate = Decimal(str(rate))
+        return rate, (Decimal(str(amount)) * rate).quantize(CENTS, rounding=ROUND_HALF_UP)
+    
+    def apply(self, expense, company_currency):
+        """
+        Recompute the stored company-currency amount of an expense in place
+        """
+        expense.exchange_rate, expense.amount_company_currency = self.compute(
+            expense.amount, expense.original_currency, company_currency, expense.expense_date
+        )
+    
+    def backfill(self, company_id=None, batch_size=1000, recompute=False, log=None):
+        """
+        Fill amount_company_currency for existing expenses
+        
+        Walks the table by primary key (WHERE id > last ORDER BY id LIMIT n),
+        so every batch is an index range scan regardless of table size, and
+        commits after each batch to keep transactions short. Each batch also
+        moves the expense rollups from the stored amount (None counts as
+        unconverted) to the new one.
+        
+        Args:
+            company_id: Only process this company
+            batch_size: Rows per batch / transaction
+            recompute: Also recompute rows that already have a value
+            log: Optional callable receiving progress messages
+        
+        Returns:
+            Tuple of (rows updated, rows left unconverted)
+        """
+        rollup_service = RollupService()
+        updated = skipped = 0
+        last_id = 0
+        while True:
+            stmt = select(
+                Expense.id, Expense.amount, Expense.original_currency, Expense.expense_date, Company.currency,
+                Expense.company_id, Expense.employee_id, Expense.category, Expense.status,
+                Expense.amount_company_currency
+            ).join(Company, Company.id == Expense.company_id).where(Expense.id > last_id)
+            if company_id is not None:
+                stmt = stmt.where(Expense.company_id == company_id)
+            if not recompute:
+                stmt = stmt.where(Expense.amount_company_currency.is_(None))
+            rows = db.session.execute(stmt.order_by(Expense.id).limit(batch_size)).all()
+            if not rows:
+                break
+            
+            changes = []
+            logged = []
+            rollup_changes = []
+            for expense_id, amount, original_currency, expense_date, company_currency, expense_company_id, \
+                    employee_id, category, status, stored in rows:
+                rate, converted = self.compute(amount, original_currency, company_currency, expense_date)
+                if rate is None:
+                    skipped += 1
+                    continue
+                changes.append({'id': expense_id, 'exchange_rate': rate, 'amount_company_currency': converted})
+                key = {'company_id': expense_company_id, 'month': rollup_service.month_of(expense_date),
+                       'category': category, 'employee_id': employee_id, 'status': status}
+                previous = Decimal(stored).quantize(CENTS, rounding=ROUND_HALF_UP) if stored is not None else None
+                rollup_changes.append(({'key': key, 'amount': previous}, {'key': key, 'amount': converted}))
+                logged.append({'company_id': expense_company_id, 'entity': 'expense', 'entity_id': expense_id,
+                               'expense_id': expense_id, 'employee_id': employee_id, 'op': 'update',
+                               'changes': {'exchange_rate': rate, 'amount_company_currency': converted}})
+            
+            if changes:
+                # ORM bulk UPDATE by primary key (one executemany per batch)
+                db.session.execute(update(Expense), changes)
+                # Not seen by the change-log flush hook
+                record_changes(logged)
+                rollup_service.apply_changes(rollup_changes)
+            db.session.commit()
+            
+            updated += len(changes)
+            last_id = rows[-1][0]
+            if log:
+                log(f"  up to id {last_id}: {updated} updated, {skipped} without a rate")
+        
+        return updated, skipped
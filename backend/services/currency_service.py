@@ -1,5 +1,7 @@
-import requests
+import time
 from flask import current_app
+from services.rate_history import rate_history
+from utils.metrics import record_cache_lookup, time_http_call
 
 class CurrencyService:
     """
@@ -9,6 +11,8 @@ class CurrencyService:
     def __init__(self):
         self.base_url = "https://api.exchangerate-api.com/v4/latest/"
         self.cache = {}  # Simple cache for rates
+        self.failed_at = {}  # base currency -> time of the last failed fetch
+        self.retry_after = 60  # seconds before retrying a failed base currency
     
     def get_exchange_rates(self, base_currency):
         """
@@ -16,12 +20,22 @@ class CurrencyService:
         """
         try:
             # Check cache first
-            if base_currency in self.cache:
+            hit = base_currency in self.cache
+            record_cache_lookup('exchange_rates', hit)
+            if hit:
                 return self.cache[base_currency]
             
-            # Fetch from API
-            response = requests.get(f"{self.base_url}{base_currency}", timeout=5)
-            response.raise_for_status()
+            # Don't hit the API again for every row while it is failing
+            failed_at = self.failed_at.get(base_currency)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_after:
+                return {}
+            
+            # Fetch from API (requests is imported on first use to keep startup light)
+            import requests
+            
+            with time_http_call('exchangerate'):
+                response = requests.get(f"{self.base_url}{base_currency}", timeout=5)
+                response.raise_for_status()
             
             data = response.json()
             rates = data.get('rates', {})
@@ -32,9 +46,34 @@ class CurrencyService:
             return rates
         except Exception as e:
             print(f"Error fetching exchange rates: {e}")
+            self.failed_at[base_currency] = time.monotonic()
             return {}
     
-    def convert(self, amount, from_currency, to_currency):
+    def get_rate(self, from_currency, to_currency, on_date=None):
+        """
+        Rate for converting from_currency -> to_currency
+        
+        Uses the historical rate in effect on `on_date` when one is stored,
+        otherwise today's live rate.
+        
+        Returns:
+            Float rate or None if no rate is available
+        """
+        if from_currency == to_currency:
+            return 1.0
+        
+        if on_date is not None:
+            try:
+                rate = rate_history.rate_on(from_currency, to_currency, on_date)
+                if rate is not None:
+                    return rate
+            except Exception as e:
+                print(f"Error reading rate history: {e}")
+        
+        rates = self.get_exchange_rates(from_currency)
+        return rates.get(to_currency) if rates else None
+    
+    def convert(self, amount, from_currency, to_currency, on_date=None):
         """
         Convert amount from one currency to another
         
@@ -42,6 +81,8 @@ class CurrencyService:
             amount: Amount to convert
             from_currency: Source currency code (e.g., 'USD')
             to_currency: Target currency code (e.g., 'INR')
+            on_date: Use the rate in effect on this date (e.g. the expense
+                     date); falls back to today's rate when none is stored
         
         Returns:
             Converted amount or None if conversion fails
@@ -51,14 +92,11 @@ class CurrencyService:
             if from_currency == to_currency:
                 return float(amount)
             
-            # Get exchange rates for base currency
-            rates = self.get_exchange_rates(from_currency)
-            
-            if not rates or to_currency not in rates:
+            rate = self.get_rate(from_currency, to_currency, on_date)
+            if rate is None:
                 return None
             
             # Convert
-            rate = rates[to_currency]
             converted_amount = float(amount) * rate
             
             return round(converted_amount, 2)
@@ -82,4 +120,5 @@ class CurrencyService:
         """
         Clear the exchange rate cache
         """
-        self.cache = {}
\ No newline at end of file
+        self.cache = {}
+        self.failed_at = {}
\ No newline at end of file
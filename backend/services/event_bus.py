@@ -0,0 +1,281 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+PENDING_EVENTS_KEY = 'event_bus_pending'
+
+
+class Subscription:
+    """
+    One open stream: a bounded queue of events for a single user
+    """
+    
+    def __init__(self, user_id, maxsize=100):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        # Set when events were dropped because the client fell behind
+        self.overflowed = False
+    
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+    
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBackend:
+    """
+    Delivers events to subscribers in this process only (single worker / dev).
+    
+    Ids come from a counter that starts at the process's start time in
+    nanoseconds, so they keep increasing across restarts; ids are assigned
+    and delivered under one lock, so subscribers see them in order.
+    """
+    
+    name = 'local'
+    
+    def __init__(self, bus):
+        self.bus = bus
+        self._next_id = time.time_ns()
+        self._lock = threading.Lock()
+    
+    def publish(self, events):
+        with self._lock:
+            for item in events:
+                self._next_id += 1
+                item['id'] = self._next_id
+                self.bus.deliver(item)
+    
+    def ensure_listening(self):
+        pass
+
+
+class PostgresBackend:
+    """
+    Fans events out to every worker with LISTEN/NOTIFY.
+    
+    Publishing sends one pg_notify per event; every process (including the
+    publisher) receives it on a dedicated LISTEN connection watched by a
+    background thread, started lazily in the worker on its first subscriber.
+    
+    Ids come from a database sequence. Publishers take a transaction-level
+    advisory lock before drawing them, and PostgreSQL delivers notifications
+    in commit order, so every listener receives ids in increasing order and
+    resuming from Last-Event-ID cannot skip an event.
+    """
+    
+    name = 'postgres'
+    channel = 'expense_events'
+    sequence = 'expense_event_ids'
+    # pg_advisory_xact_lock key serializing publishers ("expevent")
+    lock_key = 0x6578706576656E74
+    
+    def __init__(self, bus, engine):
+        self.bus = bus
+        self.engine = engine
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def publish(self, events):
+        from sqlalchemy import text
+        
+        with self.engine.begin() as connection:
+            connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {self.sequence}"))
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': self.lock_key})
+            ids = connection.execute(text(f"SELECT nextval('{self.sequence}') FROM generate_series(1, :count)"),
+                                     {'count': len(events)}).scalars().all()
+            for item, event_id in zip(events, ids):
+                item['id'] = event_id
+                connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                   {'channel': self.channel, 'payload': json.dumps(item)})
+    
+    def ensure_listening(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='event-bus-listener', daemon=True)
+                self._thread.start()
+    
+    def _listen(self):
+        import select
+        
+        while True:
+            raw = None
+            try:
+                raw = self.engine.raw_connection()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                # Whatever was published while not listening never arrives
+                self.bus.mark_gap()
+                while True:
+                    if select.select([connection], [], [], 5.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self.bus.deliver(json.loads(notification.payload))
+            except Exception as e:
+                print(f"Error in event listener, reconnecting: {e}")
+                time.sleep(1)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.invalidate()
+                    except Exception:
+                        pass
+
+
+class EventBus:
+    """
+    In-process pub/sub for per-user stream events.
+    
+    Write paths never call this directly: status transitions are captured in
+    before_flush and published after the transaction commits, so subscribers
+    never see a change that was rolled back. A ring buffer of recent events
+    lets reconnecting clients resume from their Last-Event-ID.
+    """
+    
+    def __init__(self, buffer_size=1000, queue_size=100):
+        self.buffer_size = buffer_size
+        self.queue_size = queue_size
+        self.backend = LocalBackend(self)
+        self._subscribers = {}
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+    
+    def configure(self, backend=None, buffer_size=None, queue_size=None):
+        if backend is not None:
+            self.backend = backend
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
+            self._buffer = deque(self._buffer, maxlen=buffer_size)
+        if queue_size is not None:
+            self.queue_size = queue_size
+    
+    def make_event(self, user_id, event_type, data):
+        # The backend assigns the id when it publishes, in delivery order
+        return {'id': None, 'user_id': user_id, 'type': event_type, 'data': data}
+    
+    def publish(self, events):
+        if events:
+            self.backend.publish(events)
+    
+    def deliver(self, item):
+        """
+        Hand an event to this process's subscribers and the replay buffer
+        """
+        with self._lock:
+            self._buffer.append(item)
+            subscribers = list(self._subscribers.get(item['user_id'], ()))
+        for subscription in subscribers:
+            subscription.put(item)
+    
+    def subscribe(self, user_id):
+        self.backend.ensure_listening()
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+    
+    def replay(self, user_id, last_event_id):
+        """
+        Buffered events for a user newer than last_event_id
+        
+        Ids are consecutive per backend, so the buffer covers everything
+        after last_event_id only if it starts no later than the next id.
+        
+        Returns:
+            (events, complete) where complete is False when events after
+            last_event_id may never have reached this process's buffer (it
+            started listening later, lost its connection, or dropped them) and
+            the client should refetch instead
+        """
+        with self._lock:
+            buffered = list(self._buffer)
+        complete = bool(buffered) and buffered[0]['id'] <= last_event_id + 1
+        return [item for item in buffered if item['user_id'] == user_id and item['id'] > last_event_id], complete
+    
+    def mark_gap(self):
+        """
+        Events may have been missed (the listener (re)connected): forget the
+        replay buffer and have every open stream tell its client to resync
+        """
+        with self._lock:
+            self._buffer.clear()
+            subscriptions = [subscription for subscribers in self._subscribers.values()
+                             for subscription in subscribers]
+        for subscription in subscriptions:
+            subscription.overflowed = True
+    
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+event_bus = EventBus()
+
+
+def _capture_events(session, flush_context, instances):
+    from services.notification_service import collect_transitions
+    
+    transitions = collect_transitions(session)
+    if transitions:
+        pending = session.info.setdefault(PENDING_EVENTS_KEY, [])
+        for transition in transitions:
+            pending.append((transition['recipient_id'], transition['event_type'],
+                            {'expense_id': transition['expense_id'], 'status': transition['status']}))
+
+
+def _publish_after_commit(session):
+    pending = session.info.pop(PENDING_EVENTS_KEY, None)
+    if not pending:
+        return
+    try:
+        event_bus.publish([event_bus.make_event(*item) for item in pending])
+    except Exception as e:
+        # The write already committed; a lost live event only delays the UI
+        print(f"Warning: could not publish stream events: {e}")
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+def init_event_bus(app):
+    """
+    Configure the shared event bus and hook it into ORM transactions
+    """
+    backend = None
+    if app.config.get('EVENT_BACKEND') == 'postgres':
+        from database import db
+        
+        with app.app_context():
+            backend = PostgresBackend(event_bus, db.engine)
+    event_bus.configure(backend=backend,
+                        buffer_size=app.config.get('EVENT_BUFFER_SIZE', 1000),
+                        queue_size=app.config.get('STREAM_QUEUE_SIZE', 100))
+    app.extensions['event_bus'] = event_bus
+    
+    if not event.contains(Session, 'before_flush', _capture_events):
+        event.listen(Session, 'before_flush', _capture_events)
+        event.listen(Session, 'after_commit', _publish_after_commit)
+        event.listen(Session, 'after_soft_rollback', _discard_after_rollback)
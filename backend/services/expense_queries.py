@@ -0,0 +1,13 @@
+from sqlalchemy.orm import joinedload, selectinload
+from models import ApprovalStep, Expense
+
+
+def load_expense_with_approvals(expense_id):
+    """
+    Load an expense with its employee, approval steps and approvers in two
+    queries (refreshing it if it is already in the session, e.g. after commit)
+    """
+    return Expense.query.options(
+        joinedload(Expense.employee),
+        selectinload(Expense.approval_steps).joinedload(ApprovalStep.approver)
+    ).populate_existing().get(expense_id)
@@ -0,0 +1,299 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+from database import db
+from models import ApprovalInboxCounter, ApprovalInboxItem, ApprovalStep, Company, Expense, User
+from utils.db_helpers import upsert_increment
+
+# Item columns copied from the expense (compared by reconcile)
+EXPENSE_FIELDS = ('employee_id', 'amount', 'original_currency', 'amount_company_currency', 'category',
+                  'description', 'expense_date')
+
+
+class InboxService:
+    """
+    Maintains approval_inbox_items and approval_inbox_counters.
+    
+    Write paths report step transitions inside their own transaction:
+        
+        inbox_service.add_steps(expense, steps)    # steps became pending
+        inbox_service.remove_steps([step.id])      # a step was acted on
+        inbox_service.remove_expense(expense.id)   # expense decided or deleted
+        inbox_service.refresh_expense(expense)     # expense fields edited
+    
+    Counters move only by the item rows a statement actually inserted or
+    deleted (ON CONFLICT DO NOTHING / DELETE ... RETURNING), so two
+    transactions removing the same item can't both decrement it.
+    `flask inbox reconcile` repairs any drift.
+    """
+    
+    def __init__(self, due_hours=None):
+        self.due_hours = due_hours
+    
+    def _due_after(self):
+        # Only for steps without an SLA due time (created before SLAs)
+        return timedelta(hours=self.due_hours or current_app.config.get('APPROVAL_DUE_HOURS', 72))
+    
+    # ----- Row-level helpers -----
+    
+    @staticmethod
+    def _dialect():
+        return db.session.get_bind().dialect.name
+    
+    def _insert_items(self, rows):
+        """
+        Insert items that don't exist yet
+        
+        Returns:
+            (approver_id, due_at) of each inserted row
+        """
+        table = ApprovalInboxItem.__table__
+        if self._dialect() in ('postgresql', 'sqlite'):
+            if self._dialect() == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=['step_id'])
+            return db.session.execute(stmt.returning(table.c.approver_id, table.c.due_at), rows).all()
+        
+        existing = set(db.session.execute(
+            select(table.c.step_id).where(table.c.step_id.in_([row['step_id'] for row in rows]))
+        ).scalars())
+        rows = [row for row in rows if row['step_id'] not in existing]
+        if rows:
+            db.session.execute(insert(table), rows)
+        return [(row['approver_id'], row['due_at']) for row in rows]
+    
+    def _delete_items(self, condition):
+        """
+        Returns:
+            (approver_id, due_at) of each deleted row
+        """
+        table = ApprovalInboxItem.__table__
+        if self._dialect() in ('postgresql', 'sqlite'):
+            return db.session.execute(
+                delete(table).where(condition).returning(table.c.approver_id, table.c.due_at)
+            ).all()
+        
+        rows = db.session.execute(select(table.c.approver_id, table.c.due_at).where(condition)).all()
+        if rows:
+            db.session.execute(delete(table).where(condition))
+        return rows
+    
+    @staticmethod
+    def _count(rows, sign):
+        for (approver_id, due_date), count in Counter((row[0], row[1].date()) for row in rows).items():
+            upsert_increment(ApprovalInboxCounter, {'approver_id': approver_id, 'due_date': due_date},
+                             {'pending_count': sign * count})
+    
+    def _item(self, expense, step, employee_name, pending_since):
+        item = {field: getattr(expense, field) for field in EXPENSE_FIELDS}
+        item.update({
+            'step_id': step.id,
+            'approver_id': step.approver_id,
+            'company_id': expense.company_id,
+            'expense_id': expense.id,
+            'step_order': step.step_order,
+            'employee_name': employee_name,
+            'pending_since': pending_since,
+            'due_at': step.due_at or pending_since + self._due_after(),
+        })
+        return item
+    
+    # ----- Transitions -----
+    
+    def add_steps(self, expense, steps):
+        """
+        Put newly pending steps of a pending expense in their approvers' inboxes
+        """
+        steps = [step for step in steps if step.status == 'pending']
+        if not steps or expense.status != 'pending':
+            return 0
+        if any(step.id is None for step in steps):
+            db.session.flush()
+        
+        now = datetime.utcnow()
+        employee_name = expense.employee.full_name if expense.employee else None
+        inserted = self._insert_items([self._item(expense, step, employee_name, now) for step in steps])
+        self._count(inserted, 1)
+        return len(inserted)
+    
+    def remove_steps(self, step_ids):
+        """
+        Take acted-on steps out of the inbox
+        """
+        if not step_ids:
+            return 0
+        deleted = self._delete_items(ApprovalInboxItem.step_id.in_(list(step_ids)))
+        self._count(deleted, -1)
+        return len(deleted)
+    
+    def remove_expense(self, expense_id):
+        """
+        Take every step of a decided or deleted expense out of the inbox
+        """
+        deleted = self._delete_items(ApprovalInboxItem.expense_id == expense_id)
+        self._count(deleted, -1)
+        return len(deleted)
+    
+    def refresh_expense(self, expense):
+        """
+        Copy edited expense fields onto its inbox items
+        """
+        db.session.execute(
+            update(ApprovalInboxItem).where(ApprovalInboxItem.expense_id == expense.id)
+            .values({field: getattr(expense, field) for field in EXPENSE_FIELDS})
+        )
+    
+    def rename_employee(self, user):
+        db.session.execute(
+            update(ApprovalInboxItem).where(ApprovalInboxItem.employee_id == user.id)
+            .values(employee_name=user.full_name)
+        )
+    
+    # ----- Reads -----
+    
+    def counts(self, approver_id, today=None):
+        """
+        Returns:
+            Dictionary with pending, overdue (due before today) and due_today
+        """
+        today = today or datetime.utcnow().date()
+        counts = {'pending': 0, 'overdue': 0, 'due_today': 0}
+        for due_date, count in db.session.execute(
+            select(ApprovalInboxCounter.due_date, ApprovalInboxCounter.pending_count)
+            .where(ApprovalInboxCounter.approver_id == approver_id)
+        ):
+            counts['pending'] += count
+            if due_date < today:
+                counts['overdue'] += count
+            elif due_date == today:
+                counts['due_today'] += count
+        return counts
+    
+    def items(self, approver_id, limit, offset=0, overdue_only=False):
+        """
+        An approver's inbox, most urgent first
+        """
+        query = select(ApprovalInboxItem).where(ApprovalInboxItem.approver_id == approver_id)
+        if overdue_only:
+            query = query.where(ApprovalInboxItem.due_at < datetime.combine(datetime.utcnow().date(),
+                                                                            datetime.min.time()))
+        query = query.order_by(ApprovalInboxItem.due_at, ApprovalInboxItem.step_id).limit(limit).offset(offset)
+        return db.session.execute(query).scalars().all()
+    
+    # ----- Reconciliation -----
+    
+    def _expected_items(self, company_id, existing):
+        """
+        Inbox items a company should have, derived from approval_steps
+        """
+        steps = db.session.query(ApprovalStep).join(Expense, Expense.id == ApprovalStep.expense_id).filter(
+            Expense.company_id == company_id, Expense.status == 'pending'
+        ).all()
+        
+        # A step has been pending since it was created or since the step before it was acted on
+        actions = defaultdict(list)
+        for step in steps:
+            if step.action_taken_at is not None:
+                actions[step.expense_id].append((step.step_order, step.action_taken_at))
+        
+        pending = [step for step in steps if step.status == 'pending']
+        expenses = {expense.id: expense for expense in Expense.query.filter(
+            Expense.id.in_({step.expense_id for step in pending})
+        )} if pending else {}
+        names = dict(db.session.execute(
+            select(User.id, User.full_name).where(User.company_id == company_id)
+        ).all())
+        
+        expected = {}
+        for step in pending:
+            expense = expenses[step.expense_id]
+            if step.id in existing:
+                pending_since = existing[step.id]['pending_since']
+            else:
+                earlier = [at for order, at in actions[step.expense_id] if order < step.step_order]
+                pending_since = max(earlier + [step.created_at or datetime.utcnow()])
+            item = self._item(expense, step, names.get(expense.employee_id), pending_since)
+            if step.id in existing and step.due_at is None:
+                item['due_at'] = existing[step.id]['due_at']
+            expected[step.id] = item
+        return expected
+    
+    def reconcile(self, company_id=None, dry_run=False, log=None):
+        """
+        Rebuild inbox items and counters from approval_steps where they drifted
+        
+        Returns:
+            Dictionary of items added, removed and updated, and counter rows fixed
+        """
+        totals = Counter()
+        companies = Company.query
+        if company_id is not None:
+            companies = companies.filter_by(id=company_id)
+        
+        for company in companies.all():
+            columns = [column.name for column in ApprovalInboxItem.__table__.columns]
+            existing = {row['step_id']: dict(row) for row in db.session.execute(
+                select(ApprovalInboxItem.__table__).where(ApprovalInboxItem.company_id == company.id)
+            ).mappings()}
+            expected = self._expected_items(company.id, existing)
+            
+            stale = [step_id for step_id in existing if step_id not in expected]
+            missing = [item for step_id, item in expected.items() if step_id not in existing]
+            changed = [item for step_id, item in expected.items()
+                       if step_id in existing and any(existing[step_id][column] != item[column] for column in columns)]
+            
+            if stale:
+                db.session.execute(delete(ApprovalInboxItem).where(ApprovalInboxItem.step_id.in_(stale)))
+            if missing:
+                db.session.execute(insert(ApprovalInboxItem), missing)
+            if changed:
+                db.session.execute(update(ApprovalInboxItem), changed)
+            
+            # Counters of every approver involved, recounted from the items
+            approvers = {item['approver_id'] for item in existing.values()} | {
+                item['approver_id'] for item in expected.values()}
+            fixed = self._recount(approvers) if approvers else 0
+            
+            totals.update({'added': len(missing), 'removed': len(stale), 'updated': len(changed),
+                           'counters_fixed': fixed})
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+            if log and (missing or stale or changed or fixed):
+                log(f"  company {company.id}: +{len(missing)} -{len(stale)} ~{len(changed)} items, "
+                    f"{fixed} counters fixed")
+        
+        return {key: totals[key] for key in ('added', 'removed', 'updated', 'counters_fixed')}
+    
+    @staticmethod
+    def _recount(approver_ids):
+        """
+        Rewrite the counters of these approvers from their items
+        
+        Returns:
+            Number of counter rows that were wrong
+        """
+        approver_ids = list(approver_ids)
+        actual = Counter()
+        for approver_id, due_at in db.session.execute(
+            select(ApprovalInboxItem.approver_id, ApprovalInboxItem.due_at)
+            .where(ApprovalInboxItem.approver_id.in_(approver_ids))
+        ):
+            actual[(approver_id, due_at.date())] += 1
+        stored = {(approver_id, due_date): count for approver_id, due_date, count in db.session.execute(
+            select(ApprovalInboxCounter.approver_id, ApprovalInboxCounter.due_date, ApprovalInboxCounter.pending_count)
+            .where(ApprovalInboxCounter.approver_id.in_(approver_ids))
+        )}
+        wrong = sum(1 for key in set(actual) | set(stored) if actual.get(key, 0) != stored.get(key, 0))
+        
+        db.session.execute(delete(ApprovalInboxCounter).where(ApprovalInboxCounter.approver_id.in_(approver_ids)))
+        if actual:
+            db.session.execute(insert(ApprovalInboxCounter), [
+                {'approver_id': approver_id, 'due_date': due_date, 'pending_count': count}
+                for (approver_id, due_date), count in actual.items()
+            ])
+        return wrong
@@ -0,0 +1,311 @@
+import random
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from database import db
+from models import ApprovalStep, Expense, NotificationOutbox, User
+
+EVENT_SUBJECTS = {
+    'approval_requested': 'Expense waiting for your approval',
+    'expense_approved': 'Your expense was approved',
+    'expense_rejected': 'Your expense was rejected',
+}
+
+
+def _status_changed_to(obj, statuses):
+    history = inspect(obj).attrs.status.history
+    return bool(history.added) and history.added[0] in statuses and history.added[0] not in history.deleted
+
+
+def _expense_payload(expense):
+    return {
+        'amount': float(expense.amount) if expense.amount is not None else None,
+        'currency': expense.original_currency,
+        'category': expense.category,
+        'description': expense.description,
+        'expense_date': expense.expense_date.isoformat() if expense.expense_date else None,
+    }
+
+
+def collect_transitions(session):
+    """
+    Approval-relevant status changes pending in this flush
+    
+    Returns:
+        List of dictionaries with recipient_id, event_type, expense_id, status
+        and payload: a step that became pending (for its approver) or an
+        expense that was approved/rejected (for its owner)
+    """
+    expenses = {}
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Expense) and obj.id is not None:
+            expenses[obj.id] = obj
+    
+    transitions = []
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, ApprovalStep):
+            became_pending = obj.status == 'pending' if obj in session.new else _status_changed_to(obj, ('pending',))
+            # An escalated step is new to its approver
+            reassigned = obj.status == 'pending' and obj not in session.new and \
+                bool(inspect(obj).attrs.approver_id.history.deleted)
+            if not (became_pending or reassigned):
+                continue
+            # Identity-map lookup; the expense is almost always already loaded
+            expense = expenses.get(obj.expense_id) or session.get(Expense, obj.expense_id)
+            payload = dict(_expense_payload(expense), step_order=obj.step_order) if expense else {}
+            transitions.append({'recipient_id': obj.approver_id, 'event_type': 'approval_requested',
+                                'expense_id': obj.expense_id, 'status': 'pending', 'payload': payload})
+        
+        elif isinstance(obj, Expense) and obj not in session.new and _status_changed_to(obj, ('approved', 'rejected')):
+            transitions.append({'recipient_id': obj.employee_id, 'event_type': f'expense_{obj.status}',
+                                'expense_id': obj.id, 'status': obj.status, 'payload': _expense_payload(obj)})
+    return transitions
+
+
+def _queue_outbox_rows(session, flush_context, instances):
+    """
+    before_flush hook: turn step/expense status transitions into outbox rows
+    that are written in the same transaction
+    """
+    if has_app_context() and not current_app.config.get('NOTIFICATIONS_ENABLED', True):
+        return
+    
+    for transition in collect_transitions(session):
+        session.add(NotificationOutbox(recipient_id=transition['recipient_id'],
+                                       event_type=transition['event_type'],
+                                       expense_id=transition['expense_id'],
+                                       payload=transition['payload']))
+
+
+def install_outbox_listener():
+    """
+    Register the outbox hook on every ORM session (idempotent)
+    """
+    if not event.contains(Session, 'before_flush', _queue_outbox_rows):
+        event.listen(Session, 'before_flush', _queue_outbox_rows)
+
+
+class NotificationDispatcher:
+    """
+    Drains the notification outbox.
+    
+    Each batch claims due rows (FOR UPDATE SKIP LOCKED on PostgreSQL, so several
+    dispatchers can run side by side), groups them into one digest per
+    recipient, sends all digests over a single SMTP connection and records the
+    outcome. Failed rows are retried with exponential backoff until
+    NOTIFICATION_MAX_ATTEMPTS is reached.
+    
+    For local testing run an SMTP sink such as
+        python -m aiosmtpd -n -l localhost:8025
+    with MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=False.
+    """
+    
+    def __init__(self, config=None):
+        config = config or current_app.config
+        self.host = config.get('MAIL_SERVER')
+        self.port = config.get('MAIL_PORT')
+        self.use_tls = config.get('MAIL_USE_TLS')
+        self.username = config.get('MAIL_USERNAME')
+        self.password = config.get('MAIL_PASSWORD')
+        self.sender = config.get('MAIL_DEFAULT_SENDER')
+        self.timeout = config.get('MAIL_TIMEOUT', 10)
+        self.batch_size = config.get('NOTIFICATION_BATCH_SIZE', 200)
+        self.max_attempts = config.get('NOTIFICATION_MAX_ATTEMPTS', 5)
+        self.retry_base = config.get('NOTIFICATION_RETRY_BASE_SECONDS', 30)
+        self.retry_max = config.get('NOTIFICATION_RETRY_MAX_SECONDS', 3600)
+    
+    # ----- SMTP -----
+    
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+    
+    def _send(self, connection, message):
+        try:
+            connection.send_message(message)
+            return connection
+        except smtplib.SMTPServerDisconnected:
+            # Pooled connection went away between digests; reconnect once
+            connection = self._connect()
+            connection.send_message(message)
+            return connection
+    
+    # ----- Digests -----
+    
+    @staticmethod
+    def _describe(row, employees):
+        payload = row.payload or {}
+        amount = f"{payload.get('amount')} {payload.get('currency')}" if payload.get('amount') is not None else ''
+        what = f"expense #{row.expense_id} ({payload.get('category', '')} {amount})".replace('  ', ' ')
+        if row.event_type == 'approval_requested':
+            submitted_by = employees.get(row.expense_id)
+            by = f" from {submitted_by}" if submitted_by else ''
+            return f"- Approval needed: {what}{by}"
+        return f"- {what} was {row.event_type.replace('expense_', '')}"
+    
+    def build_digest(self, recipient, rows, employees):
+        """
+        One e-mail covering all of a recipient's pending notifications
+        """
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = recipient.email
+        if len(rows) == 1:
+            message['Subject'] = EVENT_SUBJECTS.get(rows[0].event_type, 'Expense update')
+        else:
+            message['Subject'] = f'{len(rows)} expense updates'
+        
+        lines = [f'Hi {recipient.full_name},', '']
+        lines += [self._describe(row, employees) for row in rows]
+        lines += ['', 'Open the Expense Management app to review.']
+        message.set_content('\n'.join(lines))
+        return message
+    
+    # ----- Batches -----
+    
+    def _claim(self, now):
+        query = NotificationOutbox.query.filter(
+            NotificationOutbox.status == 'pending',
+            NotificationOutbox.next_attempt_at <= now
+        ).order_by(NotificationOutbox.id).limit(self.batch_size)
+        return query.with_for_update(skip_locked=True).all()
+    
+    def _schedule_retry(self, row, error, now):
+        row.attempts += 1
+        row.last_error = str(error)[:1000]
+        if row.attempts >= self.max_attempts:
+            row.status = 'failed'
+            return
+        delay = min(self.retry_max, self.retry_base * 2 ** (row.attempts - 1))
+        row.next_attempt_at = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+    
+    def dispatch_batch(self):
+        """
+        Send one batch of due notifications
+        
+        Returns:
+            Dictionary with counts of 'claimed', 'sent', 'retried', 'failed' rows and 'digests'
+        """
+        now = datetime.utcnow()
+        stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'digests': 0}
+        try:
+            rows = self._claim(now)
+            stats['claimed'] = len(rows)
+            if not rows:
+                db.session.commit()
+                return stats
+            
+            by_recipient = {}
+            for row in rows:
+                by_recipient.setdefault(row.recipient_id, []).append(row)
+            
+            recipients = {user.id: user for user in User.query.filter(User.id.in_(by_recipient)).all()}
+            expense_ids = {row.expense_id for row in rows if row.event_type == 'approval_requested'}
+            employees = dict(
+                db.session.query(Expense.id, User.full_name)
+                .join(User, User.id == Expense.employee_id)
+                .filter(Expense.id.in_(expense_ids)).all()
+            ) if expense_ids else {}
+            
+            try:
+                connection = self._connect()
+            except (OSError, smtplib.SMTPException) as e:
+                print(f"Warning: SMTP connection failed: {e}")
+                connection = None
+                for row in rows:
+                    self._schedule_retry(row, e, now)
+            
+            if connection is not None:
+                try:
+                    for recipient_id, recipient_rows in by_recipient.items():
+                        recipient = recipients.get(recipient_id)
+                        if recipient is None:
+                            for row in recipient_rows:
+                                row.status, row.last_error = 'failed', 'Recipient no longer exists'
+                            continue
+                        try:
+                            connection = self._send(connection, self.build_digest(recipient, recipient_rows, employees))
+                            stats['digests'] += 1
+                            for row in recipient_rows:
+                                row.status, row.sent_at = 'sent', now
+                                row.attempts += 1
+                        except (OSError, smtplib.SMTPException) as e:
+                            for row in recipient_rows:
+                                self._schedule_retry(row, e, now)
+                finally:
+                    try:
+                        connection.quit()
+                    except (OSError, smtplib.SMTPException):
+                        pass
+            
+            for row in rows:
+                if row.status == 'sent':
+                    stats['sent'] += 1
+                elif row.status == 'failed':
+                    stats['failed'] += 1
+                else:
+                    stats['retried'] += 1
+            
+            db.session.commit()
+            return stats
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    def dispatch_pending(self, max_batches=None):
+        """
+        Send batches until nothing is due
+        
+        Returns:
+            Totals across all batches
+        """
+        totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'digests': 0}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            stats = self.dispatch_batch()
+            batches += 1
+            for key in totals:
+                totals[key] += stats[key]
+            # Stop when the queue is drained or nothing could be delivered
+            if stats['claimed'] < self.batch_size or stats['sent'] == 0:
+                break
+        return totals
+    
+    def run_forever(self, interval=5.0):
+        """
+        Poll the outbox until interrupted
+        """
+        while True:
+            try:
+                totals = self.dispatch_pending()
+            except Exception as e:
+                print(f"Error dispatching notifications: {e}")
+                totals = {'claimed': 0}
+            if totals['claimed']:
+                print(f"Notifications: {totals['sent']} sent in {totals['digests']} digests, "
+                      f"{totals['retried']} retrying, {totals['failed']} failed")
+            time.sleep(interval)
+    
+    @staticmethod
+    def prune(older_than_days=30):
+        """
+        Delete delivered notifications older than the cutoff
+        
+        Returns:
+            Number of rows deleted
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        deleted = NotificationOutbox.query.filter(
+            NotificationOutbox.status == 'sent',
+            NotificationOutbox.sent_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
@@ -0,0 +1,148 @@
+import json
+import threading
+from collections import OrderedDict
+from sqlalchemy import func, select, update
+from database import db
+from models import Company, User
+from utils.metrics import record_cache_lookup
+
+
+class OrgChartService:
+    """
+    Reporting tree and user search for a company.
+    
+    The tree is built from one (id, manager_id, full_name, role) query in
+    O(n) and cached as serialized JSON per company, keyed by
+    Company.org_version. Every write to a company's users calls
+    bump_version() in its transaction, so a stale tree is never served and
+    no worker needs to be told to drop its copy.
+    """
+    
+    def __init__(self, max_cache_entries=256):
+        self.max_cache_entries = max_cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def bump_version(company_id):
+        """
+        Invalidate the company's cached tree; the caller commits
+        """
+        db.session.execute(
+            update(Company).where(Company.id == company_id).values(org_version=Company.org_version + 1)
+        )
+    
+    # ----- Tree -----
+    
+    @staticmethod
+    def build_tree(rows):
+        """
+        Nest (id, manager_id, full_name, role) rows under their managers
+        
+        Children keep the order of the rows. Users whose manager is outside
+        the rows are roots, and so is one user of every reporting cycle, so
+        each user appears exactly once.
+        
+        Returns:
+            List of root nodes
+        """
+        nodes = {}
+        for user_id, manager_id, full_name, role in rows:
+            nodes[user_id] = {'id': user_id, 'manager_id': manager_id, 'full_name': full_name, 'role': role,
+                              'children': []}
+        
+        roots = []
+        for node in nodes.values():
+            parent = nodes.get(node['manager_id'])
+            if parent is None or parent is node:
+                roots.append(node)
+            else:
+                parent['children'].append(node)
+        
+        # Cycles are unreachable from the roots; cut each at its first user
+        reached = set()
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            reached.add(node['id'])
+            stack.extend(node['children'])
+        if len(reached) < len(nodes):
+            for node in nodes.values():
+                if node['id'] in reached:
+                    continue
+                nodes[node['manager_id']]['children'].remove(node)
+                roots.append(node)
+                stack = [node]
+                while stack:
+                    current = stack.pop()
+                    reached.add(current['id'])
+                    stack.extend(current['children'])
+        return roots
+    
+    def tree_json(self, company_id, version):
+        """
+        Serialized tree of a company at the given org_version
+        
+        Returns:
+            JSON bytes
+        """
+        key = company_id
+        with self._lock:
+            entry = self._cache.get(key)
+            hit = bool(entry and entry[0] == version)
+            record_cache_lookup('org_chart', hit)
+            if hit:
+                self._cache.move_to_end(key)
+                return entry[1]
+        
+        rows = db.session.execute(
+            select(User.id, User.manager_id, User.full_name, User.role)
+            .where(User.company_id == company_id).order_by(User.full_name, User.id)
+        ).all()
+        payload = json.dumps({
+            'company_id': company_id,
+            'version': version,
+            'size': len(rows),
+            'roots': self.build_tree(rows),
+        }, separators=(',', ':')).encode()
+        
+        with self._lock:
+            # Keep the newer tree if another request built one meanwhile
+            entry = self._cache.get(key)
+            if entry is None or entry[0] <= version:
+                self._cache[key] = (version, payload)
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return payload
+    
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+    
+    # ----- Search -----
+    
+    @staticmethod
+    def search(company_id, prefix='', roles=None, limit=20, offset=0):
+        """
+        Users whose name or e-mail starts with the prefix (case-insensitive),
+        by name; uses the lower(full_name) / lower(email) indexes
+        
+        Returns:
+            Tuple of (users, has_more)
+        """
+        query = select(User).where(User.company_id == company_id)
+        prefix = prefix.strip().lower()
+        if prefix:
+            pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            query = query.where(db.or_(
+                func.lower(User.full_name).like(pattern, escape='\\'),
+                func.lower(User.email).like(pattern, escape='\\'),
+            ))
+        if roles:
+            query = query.where(User.role.in_(roles))
+        
+        users = db.session.execute(
+            query.order_by(func.lower(User.full_name), User.id).limit(limit + 1).offset(offset)
+        ).scalars().all()
+        return users[:limit], len(users) > limit
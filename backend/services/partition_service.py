@@ -0,0 +1,278 @@
+from datetime import date, datetime
+from sqlalchemy import text
+from sqlalchemy.schema import AddConstraint
+from database import db
+
+# Tables that can be partitioned, with the hash key used by the 'hash'
+# strategy. approval_steps has no company_id, so it is hashed by expense_id.
+PARTITIONED_TABLES = {
+    'expenses': 'company_id',
+    'approval_steps': 'expense_id',
+}
+
+
+def month_start(day, offset=0):
+    """
+    First day of the month `offset` months after the month containing `day`
+    """
+    index = day.year * 12 + (day.month - 1) + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class PartitionService:
+    """
+    Optional PostgreSQL declarative partitioning of expenses and approval_steps.
+    
+    Two layouts are supported:
+        
+        month   RANGE partitions on created_at, one per calendar month
+                (<table>_pYYYY_MM) plus a <table>_default catch-all. Queries
+                that filter on created_at only scan the matching months, and
+                archived months can be detached.
+        hash    HASH partitions (<table>_hN) on company_id for expenses and
+                expense_id for approval_steps, spreading tenants evenly.
+    
+    convert() rewrites an existing table into the partitioned layout in one
+    transaction; maintain() is meant to run daily (`flask partitions maintain`)
+    to create upcoming month partitions and apply the retention policy.
+    
+    PostgreSQL requires the partition key in every unique constraint, so the
+    primary keys become (id, <key>) and foreign keys *to* a partitioned
+    expenses table are dropped; the ORM relationships don't depend on them.
+    """
+    
+    def __init__(self, session=None):
+        self.session = session or db.session
+    
+    # ----- Introspection -----
+    
+    def _require_postgres(self):
+        dialect = self.session.get_bind().dialect.name
+        if dialect != 'postgresql':
+            raise RuntimeError(f'Partitioning needs PostgreSQL (database is {dialect})')
+    
+    def strategy(self, table):
+        """
+        Returns:
+            'month', 'hash', or None when the table is not partitioned
+        """
+        kind = self.session.execute(text(
+            "SELECT pt.partstrat FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+        ), {'table': table}).scalar()
+        return {'r': 'month', 'h': 'hash'}.get(kind)
+    
+    def partitions(self, table):
+        """
+        List the partitions of a table with their bounds and estimated rows
+        """
+        rows = self.session.execute(text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples "
+            "FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :table AND pg_table_is_visible(parent.oid) "
+            "ORDER BY child.relname"
+        ), {'table': table}).all()
+        return [
+            {'name': name, 'bounds': bounds, 'rows': max(int(estimate), 0)}
+            for name, bounds, estimate in rows
+        ]
+    
+    # ----- Conversion -----
+    
+    def _drop_foreign_keys_to(self, table, log):
+        rows = self.session.execute(text(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = CAST(:table AS regclass)"
+        ), {'table': table}).all()
+        for name, referencing in rows:
+            self.session.execute(text(f'ALTER TABLE {referencing} DROP CONSTRAINT "{name}"'))
+            if log:
+                log(f"  dropped foreign key {referencing}.{name} (unsupported with partitioned {table})")
+    
+    def _month_partition(self, table, start):
+        name = f"{table}_p{start.year:04d}_{start.month:02d}"
+        end = month_start(start, 1)
+        self.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        return name
+    
+    def convert(self, strategy='month', hash_modulus=8, months_ahead=3, keep_legacy=False, log=None):
+        """
+        Rewrite expenses and approval_steps as partitioned tables
+        
+        The existing table is renamed to <table>_legacy, a partitioned table
+        with the same columns takes its name, the rows are copied across and
+        indexes, foreign keys and the id sequence are moved over. Everything
+        runs in one transaction, so a failure leaves the original tables.
+        
+        Args:
+            strategy: 'month' (range on created_at) or 'hash'
+            hash_modulus: Number of hash partitions
+            months_ahead: Month partitions created beyond the current month
+            keep_legacy: Keep <table>_legacy instead of dropping it
+            log: Optional callable receiving progress messages
+        
+        Returns:
+            List of tables converted (already partitioned tables are skipped)
+        """
+        if strategy not in ('month', 'hash'):
+            raise ValueError("strategy must be 'month' or 'hash'")
+        self._require_postgres()
+        
+        tables = [table for table in PARTITIONED_TABLES if self.strategy(table) is None]
+        if 'expenses' in tables:
+            self._drop_foreign_keys_to('expenses', log)
+        
+        for table_name in tables:
+            table = db.metadata.tables[table_name]
+            legacy = f"{table_name}_legacy"
+            key = 'created_at' if strategy == 'month' else PARTITIONED_TABLES[table_name]
+            sequence = self.session.execute(
+                text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': table_name}
+            ).scalar()
+            
+            self.session.execute(text(f"ALTER TABLE {table_name} RENAME TO {legacy}"))
+            # Free the index names (including <table>_pkey) for the new table
+            index_names = self.session.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {'table': legacy}
+            ).scalars().all()
+            for index_name in index_names:
+                self.session.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:55]}_legacy"'))
+            if strategy == 'month':
+                # Range keys can't be NULL outside the default partition
+                self.session.execute(text(f"UPDATE {legacy} SET created_at = now() WHERE created_at IS NULL"))
+            
+            method = f"RANGE ({key})" if strategy == 'month' else f"HASH ({key})"
+            self.session.execute(text(
+                f"CREATE TABLE {table_name} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY {method}"
+            ))
+            self.session.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {key} SET NOT NULL"))
+            self.session.execute(text(f"ALTER TABLE {table_name} ADD PRIMARY KEY (id, {key})"))
+            
+            if strategy == 'month':
+                oldest = self.session.execute(text(f"SELECT min(created_at) FROM {legacy}")).scalar()
+                current = month_start(date.today())
+                start = month_start(oldest.date()) if oldest else current
+                while start <= month_start(current, months_ahead):
+                    self._month_partition(table_name, start)
+                    start = month_start(start, 1)
+                self.session.execute(text(f"CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT"))
+            else:
+                for remainder in range(hash_modulus):
+                    self.session.execute(text(
+                        f"CREATE TABLE {table_name}_h{remainder} PARTITION OF {table_name} "
+                        f"FOR VALUES WITH (MODULUS {hash_modulus}, REMAINDER {remainder})"
+                    ))
+            
+            copied = self.session.execute(text(f"INSERT INTO {table_name} SELECT * FROM {legacy}")).rowcount
+            
+            # Indexes on the parent cascade to every partition, current and future
+            connection = self.session.connection()
+            for index in table.indexes:
+                index.create(connection)
+            for constraint in table.foreign_key_constraints:
+                if constraint.referred_table.name not in PARTITIONED_TABLES:
+                    connection.execute(AddConstraint(constraint))
+            
+            if sequence:
+                self.session.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table_name}.id"))
+            if not keep_legacy:
+                self.session.execute(text(f"DROP TABLE {legacy}"))
+            if log:
+                log(f"  {table_name}: partitioned by {strategy}, {copied} rows copied")
+        
+        self.session.commit()
+        return tables
+    
+    # ----- Maintenance -----
+    
+    def ensure_future_partitions(self, months_ahead=3, log=None):
+        """
+        Create month partitions up to `months_ahead` months from now
+        
+        Returns:
+            Names of the partitions that did not exist before
+        """
+        self._require_postgres()
+        created = []
+        current = month_start(date.today())
+        for table_name in PARTITIONED_TABLES:
+            if self.strategy(table_name) != 'month':
+                continue
+            existing = {partition['name'] for partition in self.partitions(table_name)}
+            for offset in range(months_ahead + 1):
+                name = self._month_partition(table_name, month_start(current, offset))
+                if name not in existing:
+                    created.append(name)
+                    if log:
+                        log(f"  created partition {name}")
+        self.session.commit()
+        return created
+    
+    def _has_rows(self, partition_name):
+        return self.session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {partition_name})")).scalar()
+    
+    def apply_retention(self, retain_months, log=None):
+        """
+        Detach month partitions that end before the retention window
+        
+        A month is detached only once its expenses and approval_steps
+        partitions are both empty, i.e. every row was moved to cold storage by
+        ArchiveService (`flask archive run`), which leaves the tombstones,
+        change events and rollups that reads depend on. Months still holding
+        rows (pending expenses, closed ones not yet archived, or steps of
+        newer expenses) are skipped. The two tables' partitions for a month
+        are detached together.
+        
+        Detached partitions stay in the database as ordinary tables (same
+        name) so they can be dropped separately; they no longer appear in
+        queries against the parent.
+        
+        Returns:
+            Names of the detached partitions
+        """
+        self._require_postgres()
+        if any(self.strategy(table_name) != 'month' for table_name in PARTITIONED_TABLES):
+            return []
+        
+        cutoff = month_start(date.today(), -retain_months)
+        months = {}
+        for table_name in PARTITIONED_TABLES:
+            for partition in self.partitions(table_name):
+                suffix = partition['name'][len(table_name) + 2:]
+                try:
+                    start = datetime.strptime(suffix, '%Y_%m').date()
+                except ValueError:
+                    continue  # default partition
+                if month_start(start, 1) <= cutoff:
+                    months.setdefault(start, {})[table_name] = partition['name']
+        
+        detached = []
+        for start in sorted(months):
+            names = months[start]
+            occupied = [name for name in names.values() if self._has_rows(name)]
+            if occupied:
+                if log:
+                    log(f"  kept {start:%Y-%m}: {', '.join(occupied)} still hold rows (archive them first)")
+                continue
+            for table_name, name in names.items():
+                self.session.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+                detached.append(name)
+                if log:
+                    log(f"  detached partition {name}")
+        self.session.commit()
+        return detached
+    
+    def maintain(self, months_ahead=3, retain_months=None, log=None):
+        """
+        Daily maintenance: create upcoming partitions, then apply retention
+        """
+        created = self.ensure_future_partitions(months_ahead, log=log)
+        detached = self.apply_retention(retain_months, log=log) if retain_months else []
+        return created, detached
@@ -0,0 +1,177 @@
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from database import db
+from models import ExchangeRate
+
+
+class RateHistory:
+    """
+    In-memory index of the exchange_rates table.
+    
+    Each (base, quote) pair keeps a sorted array of date ordinals and a
+    parallel array of rates, so the rate in effect on a day is a bisect away:
+    O(log n) and no database query per conversion. Pairs that were not loaded
+    directly are derived from the inverse pair or through PIVOT_CURRENCY.
+    
+    The index reloads itself when the table changes (checked at most every
+    `ttl` seconds with one cheap aggregate query). Upserts keep count and
+    max(id) unchanged when they only overwrite rates, so the check also
+    reads max(updated_at), which every load sets.
+    """
+    
+    def __init__(self, ttl=300, max_age_days=7, pivot_currency='USD'):
+        self.ttl = ttl
+        self.max_age_days = max_age_days
+        self.pivot_currency = pivot_currency
+        self._series = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    # ----- Loading -----
+    
+    def _table_version(self):
+        return tuple(db.session.query(
+            db.func.count(ExchangeRate.id), db.func.max(ExchangeRate.id), db.func.max(ExchangeRate.updated_at)
+        ).one())
+    
+    def load(self):
+        """
+        Rebuild the index from the database in one ordered scan
+        """
+        series = {}
+        rows = db.session.query(
+            ExchangeRate.base_currency, ExchangeRate.quote_currency, ExchangeRate.rate_date, ExchangeRate.rate
+        ).order_by(ExchangeRate.base_currency, ExchangeRate.quote_currency, ExchangeRate.rate_date)
+        for base, quote, rate_date, rate in rows.execution_options(yield_per=50000):
+            dates, rates = series.setdefault((base, quote), ([], []))
+            dates.append(rate_date.toordinal())
+            rates.append(float(rate))
+        self._series = series
+        return len(series)
+    
+    def refresh(self, force=False):
+        """
+        Reload when the table changed since the last load
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.ttl:
+            return
+        with self._lock:
+            if not force and now - self._checked_at < self.ttl:
+                return
+            # Whatever happens, don't re-check before the next interval
+            self._checked_at = now
+            version = self._table_version()
+            if force or version != self._version:
+                self.load()
+                self._version = version
+    
+    def invalidate(self):
+        self._checked_at = 0.0
+        self._version = None
+    
+    # ----- Lookups -----
+    
+    def _direct(self, base, quote, ordinal):
+        entry = self._series.get((base, quote))
+        if entry is None:
+            return None
+        dates, rates = entry
+        index = bisect_right(dates, ordinal) - 1
+        if index < 0:
+            return None
+        if self.max_age_days is not None and ordinal - dates[index] > self.max_age_days:
+            return None
+        return rates[index]
+    
+    def _pair(self, base, quote, ordinal):
+        rate = self._direct(base, quote, ordinal)
+        if rate is not None:
+            return rate
+        inverse = self._direct(quote, base, ordinal)
+        if inverse:
+            return 1.0 / inverse
+        return None
+    
+    def rate_on(self, base, quote, day):
+        """
+        Rate in effect on `day` for converting base -> quote
+        
+        Returns:
+            Float rate, or None when no rate within max_age_days is known
+        """
+        if base == quote:
+            return 1.0
+        self.refresh()
+        ordinal = day.toordinal() if isinstance(day, date) else int(day)
+        
+        rate = self._pair(base, quote, ordinal)
+        if rate is not None:
+            return rate
+        
+        pivot = self.pivot_currency
+        if pivot and pivot not in (base, quote):
+            to_pivot = self._pair(base, pivot, ordinal)
+            from_pivot = self._pair(pivot, quote, ordinal)
+            if to_pivot is not None and from_pivot is not None:
+                return to_pivot * from_pivot
+        return None
+    
+    def rates_on(self, base, quote, ordinals):
+        """
+        Vectorized rate_on for a NumPy array of date ordinals
+        
+        Returns:
+            Float array with NaN where no rate is known
+        """
+        import numpy as np
+        
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if base == quote:
+            return np.ones(len(ordinals))
+        self.refresh()
+        
+        def direct(pair_base, pair_quote):
+            entry = self._series.get((pair_base, pair_quote))
+            result = np.full(len(ordinals), np.nan)
+            if entry is None:
+                return result
+            dates = np.asarray(entry[0], dtype=np.int64)
+            rates = np.asarray(entry[1], dtype=np.float64)
+            index = np.searchsorted(dates, ordinals, side='right') - 1
+            found = index >= 0
+            if self.max_age_days is not None:
+                found &= (ordinals - dates[np.maximum(index, 0)]) <= self.max_age_days
+            result[found] = rates[index[found]]
+            return result
+        
+        def pair(pair_base, pair_quote):
+            result = direct(pair_base, pair_quote)
+            missing = np.isnan(result)
+            if missing.any():
+                with np.errstate(divide='ignore'):
+                    result[missing] = 1.0 / direct(pair_quote, pair_base)[missing]
+            return result
+        
+        result = pair(base, quote)
+        pivot = self.pivot_currency
+        missing = np.isnan(result)
+        if missing.any() and pivot and pivot not in (base, quote):
+            result[missing] = (pair(base, pivot) * pair(pivot, quote))[missing]
+        return result
+    
+    def pairs(self):
+        self.refresh()
+        return sorted(self._series)
+
+
+rate_history = RateHistory()
+
+
+def configure_rate_history(app):
+    rate_history.ttl = app.config.get('RATE_HISTORY_TTL_SECONDS', 300)
+    rate_history.max_age_days = app.config.get('RATE_MAX_AGE_DAYS', 7)
+    rate_history.pivot_currency = app.config.get('RATE_PIVOT_CURRENCY', 'USD')
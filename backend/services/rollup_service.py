@@ -0,0 +1,191 @@
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import chain
+from types import SimpleNamespace
+from database import db
+from models import Company, Expense, ExpenseRollup
+from services.archive_service import ArchiveService
+from services.currency_service import CurrencyService
+from utils.db_helpers import upsert_increment
+
+
+class RollupService:
+    """
+    Maintains the expense_rollups table used by the analytics dashboards.
+    
+    Every write path takes a snapshot of the expense before changing it and
+    applies the difference after, inside the same transaction:
+        
+        before = rollup_service.snapshot(expense)
+        ... mutate expense ...
+        rollup_service.apply_change(before, rollup_service.snapshot(expense))
+        db.session.commit()
+    """
+    
+    def __init__(self):
+        self.currency_service = CurrencyService()
+    
+    @staticmethod
+    def month_of(day):
+        """
+        First day of the month containing `day`
+        """
+        return date(day.year, day.month, 1)
+    
+    def company_amount(self, expense, company_currency):
+        """
+        Expense amount in the company currency, rounded to cents
+        
+        Returns:
+            Decimal amount, or None when no exchange rate is available
+        """
+        stored = getattr(expense, 'amount_company_currency', None)
+        if stored is not None:
+            return Decimal(stored).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        
+        amount = self.currency_service.convert(expense.amount, expense.original_currency, company_currency,
+                                              on_date=expense.expense_date)
+        if amount is None:
+            # Never add a foreign amount to a company-currency total; the row
+            # is counted as unconverted until a rate arrives (as /stats does)
+            return None
+        return Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    
+    def snapshot(self, expense):
+        """
+        Capture the rollup key and amount an expense currently contributes
+        
+        Returns:
+            Dictionary with 'key' and 'amount', or None for a missing expense
+        """
+        if expense is None:
+            return None
+        
+        company_currency = expense.company.currency
+        return {
+            'key': {
+                'company_id': expense.company_id,
+                'month': self.month_of(expense.expense_date),
+                'category': expense.category,
+                'employee_id': expense.employee_id,
+                'status': expense.status,
+            },
+            'amount': self.company_amount(expense, company_currency),
+        }
+    
+    @staticmethod
+    def _contribution(snapshot, sign):
+        amount = snapshot['amount']
+        return {
+            'expense_count': sign,
+            'total_amount': sign * amount if amount is not None else Decimal('0'),
+            'unconverted_count': sign if amount is None else 0,
+        }
+    
+    def apply_change(self, before, after):
+        """
+        Move an expense's contribution from the `before` snapshot to `after`.
+        Pass before=None for a new expense and after=None for a deleted one.
+        An amount of None (no exchange rate) counts the expense as unconverted.
+        """
+        if before and after and before['key'] == after['key'] and before['amount'] == after['amount']:
+            return
+        
+        if before:
+            upsert_increment(ExpenseRollup, before['key'], self._contribution(before, -1))
+        if after:
+            upsert_increment(ExpenseRollup, after['key'], self._contribution(after, 1))
+    
+    def apply_changes(self, changes):
+        """
+        apply_change for many expenses at once (bulk updates), with one
+        upsert per rollup row touched instead of two per expense
+        
+        Args:
+            changes: Iterable of (before, after) snapshot pairs
+        """
+        deltas = {}
+        for before, after in changes:
+            if before and after and before['key'] == after['key'] and before['amount'] == after['amount']:
+                continue
+            for snapshot, sign in ((before, -1), (after, 1)):
+                if not snapshot:
+                    continue
+                key = tuple(sorted(snapshot['key'].items()))
+                totals = deltas.setdefault(key, {'expense_count': 0, 'total_amount': Decimal('0'),
+                                                 'unconverted_count': 0})
+                for column, value in self._contribution(snapshot, sign).items():
+                    totals[column] += value
+        
+        for key, increments in deltas.items():
+            if any(increments.values()):
+                upsert_increment(ExpenseRollup, dict(key), increments)
+    
+    def rebuild(self, company_id=None, batch_size=10000):
+        """
+        Recompute rollups from the raw expenses table to reconcile drift
+        
+        Archived expenses no longer have hot rows but still count on the
+        dashboards, so they are added back from the archive's Parquet files.
+        
+        Raises:
+            FileNotFoundError: A company's archive files are missing; its
+                rollups are left as they were
+        
+        Args:
+            company_id: Only rebuild this company (all companies if None)
+            batch_size: Rows fetched per round trip while streaming expenses
+        
+        Returns:
+            Number of rollup rows written
+        """
+        companies = Company.query
+        if company_id is not None:
+            companies = companies.filter_by(id=company_id)
+        
+        written = 0
+        for company in companies.all():
+            totals = {}
+            rows = db.session.query(
+                Expense.expense_date,
+                Expense.category,
+                Expense.employee_id,
+                Expense.status,
+                Expense.amount,
+                Expense.original_currency,
+                Expense.amount_company_currency
+            ).filter(Expense.company_id == company.id).yield_per(batch_size)
+            
+            archived = (SimpleNamespace(**record) for record in ArchiveService().iter_archived(
+                company.id, ('expense_date', 'category', 'employee_id', 'status', 'amount',
+                             'original_currency', 'amount_company_currency')
+            ))
+            
+            for row in chain(rows, archived):
+                key = (self.month_of(row.expense_date), row.category, row.employee_id, row.status)
+                count, amount, unconverted = totals.get(key, (0, Decimal('0'), 0))
+                converted = self.company_amount(row, company.currency)
+                if converted is None:
+                    totals[key] = (count + 1, amount, unconverted + 1)
+                else:
+                    totals[key] = (count + 1, amount + converted, unconverted)
+            
+            ExpenseRollup.query.filter_by(company_id=company.id).delete(synchronize_session=False)
+            if totals:
+                db.session.execute(ExpenseRollup.__table__.insert(), [
+                    {
+                        'company_id': company.id,
+                        'month': month,
+                        'category': category,
+                        'employee_id': employee_id,
+                        'status': status,
+                        'expense_count': count,
+                        'total_amount': amount,
+                        'unconverted_count': unconverted,
+                    }
+                    for (month, category, employee_id, status), (count, amount, unconverted) in totals.items()
+                ])
+            db.session.commit()
+            written += len(totals)
+        
+        return written
@@ -0,0 +1,310 @@
+import time
+import numpy as np
+from sqlalchemy import select
+from database import db
+from models import ApprovalRule, Expense, User
+from services.analytics_service import factorize
+
+RULE_TYPES = ('sequential', 'conditional', 'hybrid')
+NO_RULE = 'Manager (no rule)'
+
+
+def match_rules(amounts, category_codes, categories, rules):
+    """
+    Index of the first rule each expense matches, as _create_approval_workflow
+    picks it: min/max amount thresholds (unset or 0 means no bound) and an
+    optional category, one vectorized pass per rule
+    
+    Args:
+        amounts: float64 array of submitted amounts
+        category_codes: int64 codes into `categories`
+        categories: Sorted category labels
+        rules: Rule dicts in priority order
+    
+    Returns:
+        int64 array of rule indexes, -1 where no rule matches
+    """
+    matched = np.full(len(amounts), -1, dtype=np.int64)
+    unmatched = np.ones(len(amounts), dtype=bool)
+    for index, rule in enumerate(rules):
+        mask = unmatched.copy()
+        if rule['min_amount']:
+            mask &= amounts >= rule['min_amount']
+        if rule['max_amount']:
+            mask &= amounts <= rule['max_amount']
+        if rule['category']:
+            position = int(np.searchsorted(categories, rule['category']))
+            if position < len(categories) and categories[position] == rule['category']:
+                mask &= category_codes == position
+            else:
+                mask[:] = False
+        matched[mask] = index
+        unmatched &= ~mask
+        if not unmatched.any():
+            break
+    return matched
+
+
+def rule_approvers(rule):
+    """
+    Approver ids, in step order, of the steps a rule creates
+    """
+    if rule['rule_type'] in ('sequential', 'hybrid'):
+        return tuple(rule.get('approval_sequence') or ())
+    return tuple((rule.get('conditions') or {}).get('specific_approvers', ()))
+
+
+class RuleSimulationService:
+    """
+    Replays a company's expense history through a proposed rule set.
+    
+    Amount, category and employee columns are streamed into NumPy arrays in
+    one query. Each distinct approver list ("route") gets an integer code, so
+    routing both rule sets, diffing them and counting approver load are
+    array operations; Python only loops over rules and routes.
+    """
+    
+    def __init__(self, batch_size=50000, sample_size=20):
+        self.batch_size = batch_size
+        self.sample_size = sample_size
+    
+    # ----- Input -----
+    
+    @staticmethod
+    def normalize_rules(raw_rules, existing, validate=True):
+        """
+        Validate a proposed rule set. Entries with an "id" start from that
+        existing rule, so a proposal can change one field of one rule.
+        
+        Args:
+            raw_rules: List of rule objects in priority order
+            existing: Dictionary of the company's rules by id
+            validate: Apply the checks of rule creation (stored rules are
+                replayed as they are, like the workflow does)
+        
+        Returns:
+            List of active rule dicts
+        
+        Raises:
+            ValueError: On the first invalid rule
+        """
+        if not isinstance(raw_rules, list):
+            raise ValueError('rules must be a list')
+        
+        rules = []
+        for position, raw in enumerate(raw_rules, start=1):
+            if not isinstance(raw, dict):
+                raise ValueError(f'Rule {position} must be an object')
+            rule = {}
+            if raw.get('id') is not None:
+                if raw['id'] not in existing:
+                    raise ValueError(f"Rule {position}: unknown rule id {raw['id']}")
+                rule.update(existing[raw['id']])
+            rule.update(raw)
+            
+            if validate:
+                if rule.get('rule_type') not in RULE_TYPES:
+                    raise ValueError(f'Rule {position}: rule_type must be sequential, conditional, or hybrid')
+                if rule['rule_type'] in ('sequential', 'hybrid') and not rule.get('approval_sequence'):
+                    raise ValueError(f'Rule {position}: approval_sequence is required for sequential/hybrid rules')
+                if rule['rule_type'] in ('conditional', 'hybrid') and not rule.get('conditions'):
+                    raise ValueError(f'Rule {position}: conditions are required for conditional/hybrid rules')
+            try:
+                for field in ('min_amount', 'max_amount'):
+                    rule[field] = float(rule[field]) if rule.get(field) else None
+                approvers = tuple(int(approver_id) for approver_id in rule_approvers(rule))
+            except (TypeError, ValueError):
+                raise ValueError(f'Rule {position}: amounts and approver ids must be numbers')
+            
+            if rule.get('is_active', True):
+                rule.update({'id': rule.get('id'), 'name': rule.get('name') or f'Rule {position}',
+                             'category': rule.get('category') or None, 'approvers': approvers})
+                rules.append(rule)
+        return rules
+    
+    def load_columns(self, company_id, since=None, until=None):
+        """
+        Stream id, amount, category and employee_id of a company's expenses
+        
+        Returns:
+            Dictionary of arrays keyed by column name
+        """
+        stmt = select(Expense.id, Expense.amount, Expense.category, Expense.employee_id).where(
+            Expense.company_id == company_id
+        )
+        if since:
+            stmt = stmt.where(Expense.expense_date >= since)
+        if until:
+            stmt = stmt.where(Expense.expense_date <= until)
+        
+        result = db.session.execute(stmt.execution_options(yield_per=self.batch_size))
+        chunks = {'id': [], 'amount': [], 'category': [], 'employee_id': []}
+        for partition in result.partitions():
+            columns = list(zip(*partition))
+            chunks['id'].append(np.array(columns[0], dtype=np.int64))
+            chunks['amount'].append(np.array(columns[1], dtype=np.float64))
+            chunks['category'].append(np.array(columns[2], dtype=object))
+            chunks['employee_id'].append(np.array(columns[3], dtype=np.int64))
+        
+        empty = {'id': np.int64, 'amount': np.float64, 'category': object, 'employee_id': np.int64}
+        return {
+            name: np.concatenate(parts) if parts else np.array([], dtype=empty[name])
+            for name, parts in chunks.items()
+        }
+    
+    # ----- Simulation -----
+    
+    def simulate(self, company_id, proposed, since=None, until=None):
+        """
+        Route the history through the current and the proposed rules
+        
+        Args:
+            company_id: Company whose expenses are replayed
+            proposed: Proposed rule set (see normalize_rules)
+            since, until: Optional expense_date bounds
+        
+        Returns:
+            Dictionary with routing transitions, step totals and approver load
+        
+        Raises:
+            ValueError: The proposed rule set is invalid
+        """
+        started = time.perf_counter()
+        
+        # Rules in the order the workflow reads them
+        existing = {rule.id: rule.to_dict() for rule in ApprovalRule.query.filter_by(
+            company_id=company_id
+        ).order_by(ApprovalRule.id)}
+        current = self.normalize_rules([rule for rule in existing.values() if rule['is_active']], existing,
+                                       validate=False)
+        proposed = self.normalize_rules(proposed, existing)
+        
+        users = db.session.execute(
+            select(User.id, User.full_name, User.manager_id, User.is_manager_approver)
+            .where(User.company_id == company_id).order_by(User.id)
+        ).all()
+        
+        result = self.replay(self.load_columns(company_id, since=since, until=until), users, current, proposed)
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+    
+    def replay(self, columns, users, current, proposed):
+        """
+        Route expense columns through two normalized rule sets
+        
+        Args:
+            columns: Arrays from load_columns
+            users: (id, full_name, manager_id, is_manager_approver) rows by id
+            current, proposed: Rule lists from normalize_rules
+        
+        Returns:
+            Dictionary with routing transitions, step totals and approver load
+        """
+        names = {user[0]: user[1] for user in users}
+        categories, category_codes = factorize(columns['category'])
+        
+        # Route table: every rule's approver list, then each employee's no-rule route
+        routes = {}
+        
+        def route_code(approvers):
+            return routes.setdefault(approvers, len(routes))
+        
+        current_codes = np.array([route_code(rule['approvers']) for rule in current], dtype=np.int64)
+        proposed_codes = np.array([route_code(rule['approvers']) for rule in proposed], dtype=np.int64)
+        user_ids = np.array([user[0] for user in users], dtype=np.int64)
+        default_codes = np.array([
+            route_code((manager_id,) if manager_id and is_manager_approver else ())
+            for _, _, manager_id, is_manager_approver in users
+        ], dtype=np.int64)
+        
+        # Each expense's no-rule route, through its employee (a company
+        # always has a user, so user_ids is never empty)
+        employee_index = np.minimum(np.searchsorted(user_ids, columns['employee_id']), len(user_ids) - 1)
+        known = user_ids[employee_index] == columns['employee_id']
+        fallback = np.where(known, default_codes[employee_index], route_code(()))
+        
+        def route(rules, rule_codes):
+            matched = match_rules(columns['amount'], category_codes, categories, rules)
+            # -1 picks the appended sentinel, replaced by the fallback
+            codes = np.where(matched >= 0, np.append(rule_codes, -1)[matched], fallback)
+            return matched, codes
+        
+        current_rule, current_route = route(current, current_codes)
+        proposed_rule, proposed_route = route(proposed, proposed_codes)
+        
+        route_list = list(routes)
+        route_steps = np.array([len(approvers) for approvers in route_list], dtype=np.int64)
+        current_steps = route_steps[current_route]
+        proposed_steps = route_steps[proposed_route]
+        changed = current_route != proposed_route
+        
+        return {
+            'expenses': int(len(current_route)),
+            'changed': int(changed.sum()),
+            'steps': {
+                'current': int(current_steps.sum()),
+                'proposed': int(proposed_steps.sum()),
+                'added': int((proposed_steps - current_steps).sum()),
+            },
+            'transitions': self._transitions(current, proposed, current_rule, proposed_rule, changed,
+                                             proposed_steps - current_steps),
+            'approver_load': self._approver_load(route_list, current_route, proposed_route, names),
+            'sample_changed_expense_ids': columns['id'][changed][:self.sample_size].tolist(),
+        }
+    
+    @staticmethod
+    def _transitions(current, proposed, current_rule, proposed_rule, changed, step_delta):
+        """
+        Expenses per (current rule, proposed rule) pair that differ in rule or route
+        """
+        width = len(proposed) + 1
+        pairs = (current_rule + 1) * width + (proposed_rule + 1)
+        keys, inverse, counts = np.unique(pairs, return_inverse=True, return_counts=True)
+        changed_counts = np.bincount(inverse, weights=changed, minlength=len(keys))
+        step_deltas = np.bincount(inverse, weights=step_delta, minlength=len(keys))
+        
+        def label(rules, index):
+            if index < 0:
+                return {'rule_id': None, 'name': NO_RULE}
+            return {'rule_id': rules[index]['id'], 'name': rules[index]['name']}
+        
+        transitions = []
+        for key, count, changed_count, delta in zip(keys, counts, changed_counts, step_deltas):
+            before, after = int(key) // width - 1, int(key) % width - 1
+            from_rule, to_rule = label(current, before), label(proposed, after)
+            if from_rule == to_rule and not changed_count:
+                continue
+            transitions.append({
+                'from': from_rule,
+                'to': to_rule,
+                'expenses': int(count),
+                'changed_route': int(changed_count),
+                'steps_added': int(delta),
+            })
+        return sorted(transitions, key=lambda transition: -transition['expenses'])
+    
+    @staticmethod
+    def _approver_load(route_list, current_route, proposed_route, names):
+        """
+        Approval steps per approver under both rule sets
+        """
+        current_counts = np.bincount(current_route, minlength=len(route_list))
+        proposed_counts = np.bincount(proposed_route, minlength=len(route_list))
+        
+        load = {}
+        for approvers, before, after in zip(route_list, current_counts, proposed_counts):
+            for approver_id in approvers:
+                entry = load.setdefault(approver_id, [0, 0])
+                entry[0] += int(before)
+                entry[1] += int(after)
+        
+        return sorted([
+            {
+                'approver_id': approver_id,
+                'name': names.get(approver_id),
+                'current': before,
+                'proposed': after,
+                'delta': after - before,
+            }
+            for approver_id, (before, after) in load.items() if before or after
+        ], key=lambda entry: (-abs(entry['delta']), entry['approver_id']))
@@ -0,0 +1,242 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select, update
+from database import db
+from models import ApprovalInboxItem, ApprovalRule, ApprovalStep, Expense, User
+from services.change_log import record_changes
+from services.inbox_service import InboxService
+
+
+class SlaService:
+    """
+    Approval SLAs: due times of pending steps and escalation of overdue ones.
+    
+    A step gets due_at whenever it becomes pending: its rule's sla_hours
+    (APPROVAL_DUE_HOURS without one) from then. The sweeper
+    (`flask sla sweep`) claims overdue pending steps in batches through the
+    partial index on due_at WHERE status = 'pending', using FOR UPDATE SKIP
+    LOCKED on the steps and then on their expenses. A step whose expense a
+    request is approving right now is left for the next sweep, so request
+    workers never wait on the sweeper and several sweepers can run side by side.
+    
+    An overdue step goes to the approver's manager, else to the rule's
+    escalation user, else to the company's first admin, skipping the
+    expense's owner and anyone already holding a pending step of the expense.
+    After SLA_MAX_ESCALATIONS hand-offs, or with nobody to hand it to, the
+    step stays where it is and is no longer swept.
+    """
+    
+    def __init__(self, batch_size=None, max_escalations=None):
+        self.batch_size = batch_size
+        self.max_escalations = max_escalations
+        self.inbox_service = InboxService()
+    
+    def _config(self, key, default):
+        return current_app.config.get(key, default)
+    
+    def sla_hours(self, rule):
+        if rule is not None and rule.sla_hours:
+            return rule.sla_hours
+        return self._config('APPROVAL_DUE_HOURS', 72)
+    
+    # ----- Clock -----
+    
+    def start(self, steps, rule=None, now=None):
+        """
+        Set due_at on steps that just became pending; without `rule` each
+        step's own rule_id is used
+        """
+        now = now or datetime.utcnow()
+        for step in steps:
+            if step.status != 'pending':
+                continue
+            step_rule = rule
+            if step_rule is None and step.rule_id is not None:
+                step_rule = db.session.get(ApprovalRule, step.rule_id)
+            step.due_at = now + timedelta(hours=self.sla_hours(step_rule))
+    
+    def backfill(self, batch_size=1000, log=None):
+        """
+        Give pending steps from before SLAs a due_at. Steps in the inbox keep
+        the due time approvers already see there (so items and counters stay
+        put); others are due their rule's SLA after they were created.
+        
+        Returns:
+            Number of steps updated
+        """
+        updated = 0
+        rules = {}
+        while True:
+            rows = db.session.execute(
+                select(ApprovalStep.id, ApprovalStep.rule_id, ApprovalStep.created_at, ApprovalInboxItem.due_at,
+                       ApprovalStep.expense_id, ApprovalStep.approver_id, Expense.company_id, Expense.employee_id)
+                .join(Expense, Expense.id == ApprovalStep.expense_id)
+                .outerjoin(ApprovalInboxItem, ApprovalInboxItem.step_id == ApprovalStep.id)
+                .where(ApprovalStep.status == 'pending', ApprovalStep.due_at.is_(None))
+                .order_by(ApprovalStep.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            
+            values = []
+            changes = []
+            for step_id, rule_id, created_at, inbox_due_at, expense_id, approver_id, company_id, employee_id in rows:
+                if inbox_due_at is None:
+                    if rule_id not in rules:
+                        rules[rule_id] = db.session.get(ApprovalRule, rule_id) if rule_id is not None else None
+                    inbox_due_at = (created_at or datetime.utcnow()) + timedelta(hours=self.sla_hours(rules[rule_id]))
+                values.append({'id': step_id, 'due_at': inbox_due_at})
+                changes.append({'company_id': company_id, 'entity': 'approval_step', 'entity_id': step_id,
+                                'expense_id': expense_id, 'employee_id': employee_id, 'approver_id': approver_id,
+                                'op': 'update', 'changes': {'due_at': inbox_due_at}})
+            db.session.execute(update(ApprovalStep), values)
+            # Bulk UPDATE: not seen by the change-log flush hook
+            record_changes(changes)
+            db.session.commit()
+            updated += len(values)
+            if log:
+                log(f"  {updated} steps updated")
+        return updated
+    
+    # ----- Sweeping -----
+    
+    def _claim(self, now):
+        steps = ApprovalStep.query.filter(
+            ApprovalStep.status == 'pending',
+            ApprovalStep.due_at <= now
+        ).order_by(ApprovalStep.due_at).limit(self.batch_size or self._config('SLA_SWEEP_BATCH_SIZE', 200))
+        steps = steps.with_for_update(skip_locked=True).all()
+        if not steps:
+            return [], {}
+        expenses = Expense.query.filter(
+            Expense.id.in_({step.expense_id for step in steps})
+        ).with_for_update(skip_locked=True).all()
+        return steps, {expense.id: expense for expense in expenses}
+    
+    @staticmethod
+    def _fallbacks(steps, expenses):
+        """
+        Managers of the current approvers, rules, first admin per company and
+        pending approvers per expense, in four queries
+        """
+        approver_ids = {step.approver_id for step in steps}
+        managers = dict(db.session.execute(
+            select(User.id, User.manager_id).where(User.id.in_(approver_ids))
+        ).all())
+        rule_ids = {step.rule_id for step in steps if step.rule_id is not None}
+        rules = {rule.id: rule for rule in ApprovalRule.query.filter(ApprovalRule.id.in_(rule_ids))} \
+            if rule_ids else {}
+        admins = dict(db.session.execute(
+            select(User.company_id, func.min(User.id))
+            .where(User.role == 'admin', User.company_id.in_({expense.company_id for expense in expenses.values()}))
+            .group_by(User.company_id)
+        ).all())
+        pending = {}
+        for expense_id, approver_id in db.session.execute(
+            select(ApprovalStep.expense_id, ApprovalStep.approver_id)
+            .where(ApprovalStep.expense_id.in_(list(expenses)), ApprovalStep.status == 'pending')
+        ):
+            pending.setdefault(expense_id, set()).add(approver_id)
+        return managers, rules, admins, pending
+    
+    def sweep_batch(self):
+        """
+        Escalate one batch of overdue steps
+        
+        Returns:
+            Dictionary with counts of 'claimed', 'escalated', 'kept' (nobody to
+            escalate to) and 'skipped' (expense locked or no longer pending) steps
+        """
+        now = datetime.utcnow()
+        max_escalations = self.max_escalations or self._config('SLA_MAX_ESCALATIONS', 3)
+        stats = {'claimed': 0, 'escalated': 0, 'kept': 0, 'skipped': 0}
+        try:
+            steps, expenses = self._claim(now)
+            stats['claimed'] = len(steps)
+            if not expenses:
+                stats['skipped'] = len(steps)
+                db.session.commit()
+                return stats
+            
+            managers, rules, admins, pending = self._fallbacks(steps, expenses)
+            # Loaded once so add_steps() finds the employees in the identity map
+            User.query.filter(User.id.in_({expense.employee_id for expense in expenses.values()})).all()
+            
+            escalated = {}
+            for step in steps:
+                expense = expenses.get(step.expense_id)
+                if expense is None:
+                    stats['skipped'] += 1
+                    continue
+                if expense.status != 'pending':
+                    step.due_at = None
+                    stats['skipped'] += 1
+                    continue
+                
+                rule = rules.get(step.rule_id)
+                candidates = [managers.get(step.approver_id), rule.escalation_user_id if rule else None,
+                              admins.get(expense.company_id)]
+                holding = pending.get(expense.id, set())
+                target = next((user_id for user_id in candidates if user_id and user_id != expense.employee_id
+                               and user_id not in holding), None)
+                if target is None or step.escalation_count >= max_escalations:
+                    step.due_at = None
+                    stats['kept'] += 1
+                    continue
+                
+                holding.discard(step.approver_id)
+                holding.add(target)
+                step.original_approver_id = step.original_approver_id or step.approver_id
+                step.approver_id = target
+                step.escalated_at = now
+                step.escalation_count += 1
+                step.due_at = now + timedelta(hours=self.sla_hours(rule))
+                escalated.setdefault(expense.id, []).append(step)
+                stats['escalated'] += 1
+            
+            # Move the inbox items (and counters) to the new approvers
+            self.inbox_service.remove_steps([step.id for moved in escalated.values() for step in moved])
+            for expense_id, moved in escalated.items():
+                self.inbox_service.add_steps(expenses[expense_id], moved)
+            
+            db.session.commit()
+            return stats
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    def sweep(self, max_batches=None):
+        """
+        Escalate batches until no overdue step can be claimed
+        
+        Returns:
+            Totals across all batches
+        """
+        batch_size = self.batch_size or self._config('SLA_SWEEP_BATCH_SIZE', 200)
+        totals = {'claimed': 0, 'escalated': 0, 'kept': 0, 'skipped': 0}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            stats = self.sweep_batch()
+            batches += 1
+            for key in totals:
+                totals[key] += stats[key]
+            # Locked expenses come back every batch; leave them for the next sweep
+            if stats['claimed'] < batch_size or stats['skipped'] == stats['claimed']:
+                break
+        return totals
+    
+    def run_forever(self, interval=60.0):
+        """
+        Sweep until interrupted
+        """
+        while True:
+            try:
+                totals = self.sweep()
+            except Exception as e:
+                print(f"Error sweeping approval SLAs: {e}")
+                totals = {'claimed': 0}
+            if totals['claimed']:
+                print(f"SLA sweep: {totals['escalated']} escalated, {totals['kept']} kept, "
+                      f"{totals['skipped']} skipped")
+            time.sleep(interval)
@@ -0,0 +1,238 @@
+import csv
+import io
+import secrets
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select
+from database import db
+from models import User
+from utils.password_hashing import hash_passwords
+
+ROLES = ('employee', 'manager', 'admin')
+CSV_COLUMNS = ('email', 'full_name', 'role', 'password', 'manager_email', 'is_manager_approver')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+
+class ProvisioningError(Exception):
+    """Raised with per-row errors when a bulk import is rejected as a whole"""
+    
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid rows')
+        self.errors = errors
+
+
+class UserProvisioningService:
+    """
+    Creates many users of one company in a single transaction.
+    
+    Managers are referenced by e-mail, either to another row of the same
+    import or to an existing user of the company. Rows are ordered
+    top-down (Kahn's algorithm, one level per manager depth) so every
+    manager_id points at a user that already has an id; cycles and unknown
+    managers reject the whole import. E-mails are checked with one IN
+    query, passwords are hashed in a process pool, and each level is
+    written with batched multi-row INSERTs.
+    """
+    
+    def __init__(self, hash_workers=None, batch_size=1000, lookup_chunk_size=5000):
+        self.hash_workers = hash_workers
+        self.batch_size = batch_size
+        self.lookup_chunk_size = lookup_chunk_size
+    
+    # ----- Input -----
+    
+    @staticmethod
+    def parse_csv(text):
+        reader = csv.DictReader(io.StringIO(text))
+        missing = {'email', 'full_name', 'role'} - set(reader.fieldnames or ())
+        if missing:
+            raise ProvisioningError([{'row': 0, 'error': f"Missing CSV column(s): {', '.join(sorted(missing))}"}])
+        return [{key: (value or '').strip() for key, value in row.items() if key in CSV_COLUMNS} for row in reader]
+    
+    @staticmethod
+    def _normalize(index, raw):
+        if not isinstance(raw, dict):
+            return None, 'Row must be an object'
+        row = {
+            'email': str(raw.get('email') or '').strip(),
+            'full_name': str(raw.get('full_name') or '').strip(),
+            'role': str(raw.get('role') or '').strip(),
+            'password': raw.get('password') or None,
+            'manager_email': str(raw.get('manager_email') or '').strip() or None,
+            'is_manager_approver': raw.get('is_manager_approver', False),
+            'row': index,
+        }
+        if isinstance(row['is_manager_approver'], str):
+            row['is_manager_approver'] = row['is_manager_approver'].strip().lower() in TRUE_VALUES
+        row['is_manager_approver'] = bool(row['is_manager_approver'])
+        
+        for field in ('email', 'full_name', 'role'):
+            if not row[field]:
+                return row, f'Missing required field: {field}'
+        if '@' not in row['email']:
+            return row, 'Invalid email'
+        if row['role'] not in ROLES:
+            return row, 'Invalid role'
+        return row, None
+    
+    # ----- Planning -----
+    
+    def _existing_users(self, emails):
+        """
+        Map e-mail -> (id, company_id) for the given e-mails (one query per chunk)
+        """
+        emails = list(emails)
+        found = {}
+        for start in range(0, len(emails), self.lookup_chunk_size):
+            chunk = emails[start:start + self.lookup_chunk_size]
+            found.update({email: (user_id, company_id) for user_id, email, company_id in db.session.execute(
+                select(User.id, User.email, User.company_id).where(User.email.in_(chunk))
+            )})
+        return found
+    
+    @staticmethod
+    def _unreached_reason(email, rows, failed):
+        """
+        Why a row was never placed: follow its managers until the chain
+        reaches a rejected row, comes back to the row, or loops elsewhere
+        """
+        manager = rows[email]['manager_email']
+        if manager in failed:
+            return f'Manager row is invalid: {manager}'
+        seen = set()
+        current = manager
+        while current not in failed and current != email and current not in seen:
+            seen.add(current)
+            current = rows[current]['manager_email']
+        if current == email:
+            return f'Manager cycle: {manager}'
+        if current in failed:
+            return f'Manager {manager} reports to an invalid row: {current}'
+        return f'Manager {manager} reports into a manager cycle'
+    
+    def plan(self, company_id, raw_rows):
+        """
+        Validate the rows and order them by manager depth
+        
+        Returns:
+            List of levels; each a list of rows whose managers exist by then
+        
+        Raises:
+            ProvisioningError: With every invalid row
+        """
+        errors = []
+        rows = {}
+        for index, raw in enumerate(raw_rows, start=1):
+            row, error = self._normalize(index, raw)
+            if error is None and row['email'] in rows:
+                error = f"Duplicate email (also on row {rows[row['email']]['row']})"
+            if error:
+                errors.append({'row': index, 'email': row['email'] if row else None, 'error': error})
+            else:
+                rows[row['email']] = row
+        
+        manager_emails = {row['manager_email'] for row in rows.values() if row['manager_email']}
+        existing = self._existing_users(set(rows) | manager_emails)
+        
+        children = defaultdict(list)
+        level = []
+        for email, row in rows.items():
+            manager = row['manager_email']
+            if email in existing:
+                errors.append({'row': row['row'], 'email': email, 'error': 'Email already registered'})
+            elif manager is None:
+                row['manager_id'] = None
+                level.append(row)
+            elif manager in rows:
+                children[manager].append(row)
+            elif manager in existing and existing[manager][1] == company_id:
+                row['manager_id'] = existing[manager][0]
+                level.append(row)
+            else:
+                errors.append({'row': row['row'], 'email': email, 'error': f'Unknown manager: {manager}'})
+        
+        levels = []
+        placed = set()
+        while level:
+            levels.append(level)
+            placed.update(row['email'] for row in level)
+            level = [child for row in level for child in children.pop(row['email'], ())]
+        
+        # Whatever was never reached sits on a cycle or reports (possibly through
+        # other managers) to a rejected row or into a cycle
+        failed = {error.get('email') for error in errors}
+        for manager, rows_below in children.items():
+            for row in rows_below:
+                if row['email'] in placed or row['email'] in failed:
+                    continue
+                errors.append({'row': row['row'], 'email': row['email'],
+                               'error': self._unreached_reason(row['email'], rows, failed)})
+        
+        if errors:
+            raise ProvisioningError(sorted(errors, key=lambda error: error['row']))
+        return levels
+    
+    # ----- Writing -----
+    
+    def provision(self, company_id, raw_rows, dry_run=False):
+        """
+        Create the users; the caller commits
+        
+        Returns:
+            List of created users as dicts (with "temporary_password" for rows
+            that came without a password), in creation order
+        
+        Raises:
+            ProvisioningError: Nothing was written
+        """
+        levels = self.plan(company_id, raw_rows)
+        ordered = [row for level in levels for row in level]
+        if dry_run:
+            return [self._result(row) for row in ordered]
+        
+        for row in ordered:
+            if not row['password']:
+                row['password'] = row['temporary_password'] = secrets.token_urlsafe(12)
+        workers = self.hash_workers or current_app.config.get('BULK_HASH_WORKERS')
+        hashes = hash_passwords([str(row['password']) for row in ordered], workers=workers)
+        
+        now = datetime.utcnow()
+        ids = {}
+        position = 0
+        for level in levels:
+            values = []
+            for row in level:
+                if row['manager_email'] in ids:
+                    row['manager_id'] = ids[row['manager_email']]
+                values.append({
+                    'email': row['email'], 'password_hash': hashes[position], 'full_name': row['full_name'],
+                    'role': row['role'], 'company_id': company_id, 'manager_id': row['manager_id'],
+                    'is_manager_approver': row['is_manager_approver'], 'created_at': now, 'updated_at': now,
+                })
+                position += 1
+            for start in range(0, len(values), self.batch_size):
+                inserted = db.session.execute(
+                    insert(User).returning(User.id, User.email), values[start:start + self.batch_size]
+                )
+                ids.update({email: user_id for user_id, email in inserted})
+        
+        for row in ordered:
+            row['id'] = ids[row['email']]
+            row['created_at'] = now
+        return [self._result(row) for row in ordered]
+    
+    @staticmethod
+    def _result(row):
+        result = {
+            'id': row.get('id'),
+            'email': row['email'],
+            'full_name': row['full_name'],
+            'role': row['role'],
+            'manager_id': row.get('manager_id'),
+            'manager_email': row['manager_email'],
+            'is_manager_approver': row['is_manager_approver'],
+        }
+        if row.get('temporary_password'):
+            result['temporary_password'] = row['temporary_password']
+        return result
@@ -31,13 +31,20 @@ with app.app_context():
     print("✓ Database tables recreated successfully!")
 EOF
 
-# Step 5: Start the server in background
-echo "Step 5: Starting Flask server..."
+# Step 5: Check worker cold-start import budget
+echo "Step 5: Checking startup import-time budget..."
+python3 benchmarks/bench_startup.py --runs 3 || exit 1
+
+echo "Checking per-endpoint query budgets..."
+python3 scripts/check_query_budgets.py || exit 1
+
+# Step 6: Start the server in background
+echo "Step 6: Starting Flask server..."
 python3 app.py &
 SERVER_PID=$!
 sleep 3
 
-# Step 6: Test endpoints
+# Step 7: Test endpoints
 echo ""
 echo "=========================================="
 echo "Testing API Endpoints"
@@ -50,8 +57,15 @@ curl -s http://localhost:5000/health | python3 -m json.tool
 echo ""
 echo ""
 
+# Test readiness endpoint (checks the database)
+echo "2. Testing Readiness Endpoint..."
+curl -s http://localhost:5000/ready | python3 -m json.tool
+
+echo ""
+echo ""
+
 # Test root endpoint
-echo "2. Testing Root Endpoint..."
+echo "3. Testing Root Endpoint..."
 curl -s http://localhost:5000/ | python3 -m json.tool
 
 echo ""
@@ -1,5 +1,6 @@
 from .jwt_manager import get_current_user, jwt_required_with_user, optional_jwt_with_user
 from .role_required import role_required, admin_required, manager_or_admin_required, same_company_required
+from .db_helpers import upsert_increment, bulk_upsert
 
 __all__ = [
     'get_current_user',
@@ -8,5 +9,7 @@ __all__ = [
     'role_required',
     'admin_required',
     'manager_or_admin_required',
-    'same_company_required'
+    'same_company_required',
+    'upsert_increment',
+    'bulk_upsert'
 ]
\ No newline at end of file
@@ -0,0 +1,81 @@
+from sqlalchemy import update
+from database import db
+
+
+def upsert_increment(model, keys, increments):
+    """
+    Atomically add values to counter columns of the row identified by keys,
+    creating the row if it does not exist yet.
+    
+    Uses INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite so that
+    concurrent transactions never lose an increment. The columns in `keys`
+    must match a unique constraint on the table.
+    
+    Usage:
+        upsert_increment(ExpenseRollup,
+                         {'company_id': 1, 'month': date(2025, 1, 1), ...},
+                         {'expense_count': 1, 'total_amount': Decimal('12.50')})
+    """
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys.keys()),
+            set_={column: table.c[column] + stmt.excluded[column] for column in increments}
+        )
+        db.session.execute(stmt)
+        return
+    
+    # Generic fallback: update in place, insert when nothing matched
+    result = db.session.execute(
+        update(table)
+        .where(*[table.c[column] == value for column, value in keys.items()])
+        .values({column: table.c[column] + value for column, value in increments.items()})
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(**keys, **increments))
+
+
+def bulk_upsert(model, rows, keys, update_columns):
+    """
+    Insert rows, overwriting update_columns of rows whose keys already exist
+    
+    Uses a single INSERT ... ON CONFLICT DO UPDATE per call on PostgreSQL and
+    SQLite. `keys` must match a unique constraint on the table.
+    
+    Usage:
+        bulk_upsert(ExchangeRate, rows, ['base_currency', 'quote_currency', 'rate_date'], ['rate', 'source'])
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: stmt.excluded[column] for column in update_columns}
+        )
+        db.session.execute(stmt, rows)
+        return
+    
+    # Generic fallback: update each row, insert the ones that did not exist
+    for row in rows:
+        result = db.session.execute(
+            update(table)
+            .where(*[table.c[column] == row[column] for column in keys])
+            .values({column: row[column] for column in update_columns})
+        )
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(**row))
@@ -0,0 +1,328 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, g, has_request_context, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import db
+from models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# g attribute holding the claim of the idempotent request being handled
+CLAIM_KEY = 'idempotency_claim_id'
+
+
+class IdempotencyCache:
+    """
+    Per-worker LRU of completed responses, so most retries are answered
+    without touching the database
+    """
+    
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= datetime.utcnow():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+    
+    def put(self, cache_key, entry):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ClaimHeartbeat:
+    """
+    Keeps this worker's in_progress claims alive.
+    
+    While a request holding a key runs, a background thread refreshes the
+    row's heartbeat_at every `interval` seconds (one UPDATE for all held
+    claims). Another request only takes a claim over once its heartbeat is
+    older than IDEMPOTENCY_LOCK_SECONDS, i.e. the worker running it died,
+    however long the request itself takes.
+    """
+    
+    def __init__(self, interval=20.0):
+        self.interval = interval
+        self._claims = set()
+        self._engine = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def hold(self, claim_id):
+        with self._lock:
+            self._claims.add(claim_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._engine = db.engine
+                self._thread = threading.Thread(target=self._run, name='idempotency-heartbeat', daemon=True)
+                self._thread.start()
+    
+    def release(self, claim_id):
+        with self._lock:
+            self._claims.discard(claim_id)
+    
+    def beat(self):
+        with self._lock:
+            claim_ids = list(self._claims)
+        if not claim_ids:
+            return
+        with self._engine.begin() as connection:
+            connection.execute(update(IdempotencyKey.__table__).where(
+                IdempotencyKey.id.in_(claim_ids), IdempotencyKey.status.in_(('in_progress', 'applied'))
+            ).values(heartbeat_at=datetime.utcnow()))
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.beat()
+            except Exception as e:
+                print(f"Error refreshing idempotency claims: {e}")
+
+
+idempotency_cache = IdempotencyCache()
+claim_heartbeat = ClaimHeartbeat()
+
+
+def _mark_applied(session):
+    """
+    before_commit hook: the route's own commit also flips its claim to
+    'applied', so the key records the side effect atomically with it and a
+    retry can never run the route a second time
+    """
+    if not has_request_context():
+        return
+    claim_id = g.get(CLAIM_KEY)
+    if claim_id is not None:
+        session.execute(update(IdempotencyKey).where(
+            IdempotencyKey.id == claim_id, IdempotencyKey.status == 'in_progress'
+        ).values(status='applied'))
+
+
+def configure_idempotency(app):
+    idempotency_cache.max_size = app.config.get('IDEMPOTENCY_CACHE_SIZE', 10000)
+    claim_heartbeat.interval = app.config.get('IDEMPOTENCY_LOCK_SECONDS', 60) / 3
+    if not event.contains(Session, 'before_commit', _mark_applied):
+        event.listen(Session, 'before_commit', _mark_applied)
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _entry(row):
+    return {
+        'request_hash': row.request_hash,
+        'status': row.response_status,
+        'body': row.response_body,
+        'mimetype': row.response_mimetype,
+        'expires_at': row.expires_at,
+    }
+
+
+def _replay(entry, request_hash):
+    if entry['request_hash'] != request_hash:
+        return jsonify({'error': 'Idempotency-Key was already used with a different request'}), 422
+    response = Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _claim(user_id, key, request_hash):
+    """
+    Insert an in_progress row for (user_id, key)
+    
+    Returns:
+        Tuple of (claim id, None) when this request now owns the key,
+        otherwise (None, existing row)
+    """
+    existing = None
+    for _ in range(2):
+        now = datetime.utcnow()
+        try:
+            result = db.session.execute(insert(IdempotencyKey).values(
+                user_id=user_id, key=key, request_hash=request_hash, status='in_progress', created_at=now,
+                heartbeat_at=now,
+                expires_at=now + timedelta(hours=current_app.config.get('IDEMPOTENCY_TTL_HOURS', 24)),
+            ))
+            db.session.commit()
+            return result.inserted_primary_key[0], None
+        except IntegrityError:
+            db.session.rollback()
+        
+        existing = db.session.execute(
+            select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        ).scalar_one_or_none()
+        if existing is None:
+            continue  # removed in between; try again
+        
+        # Expired keys and claims whose worker stopped sending heartbeats can be taken over
+        last_seen = existing.heartbeat_at or existing.created_at
+        abandoned = (existing.status == 'in_progress' and
+                     last_seen < now - timedelta(seconds=current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 60)))
+        if existing.expires_at > now and not abandoned:
+            return None, existing
+        # Only if nothing changed since it was read (e.g. a heartbeat arrived)
+        db.session.execute(delete(IdempotencyKey).where(
+            IdempotencyKey.id == existing.id, IdempotencyKey.created_at == existing.created_at,
+            IdempotencyKey.heartbeat_at == existing.heartbeat_at
+        ))
+        db.session.commit()
+    return None, existing
+
+
+def _release(user_id, key):
+    """
+    Drop an in_progress claim so the client can retry the request. A claim
+    the route already committed ('applied') is kept: running it again would
+    repeat the side effect.
+    """
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.status == 'in_progress'
+    ))
+    db.session.commit()
+
+
+def idempotent(fn):
+    """
+    Honour an Idempotency-Key header on a POST route.
+    
+    The first request with a key runs normally and its response (anything
+    below 500) is stored for IDEMPOTENCY_TTL_HOURS. Retries with the same
+    key get the stored response back, marked with Idempotent-Replayed: true,
+    without running the route again. While the first request is still
+    running a retry gets 409; reusing a key for a different request gets 422.
+    Keys are scoped to the authenticated user, so place this below
+    @jwt_required().
+    
+    The route's commit marks the key 'applied' in the same transaction. If
+    the response is then lost (the worker dies, or the route fails after
+    committing), the key stays applied and retries get 409 instead of
+    running the route again.
+    
+    Usage:
+        @expense_bp.route('/', methods=['POST'])
+        @query_budget(14)
+        @jwt_required()
+        @idempotent
+        def create_expense():
+            ...
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+        
+        user_id = get_jwt_identity()
+        request_hash = _request_hash()
+        cached = idempotency_cache.get((user_id, key))
+        if cached is not None:
+            return _replay(cached, request_hash)
+        
+        claim_id, existing = _claim(user_id, key, request_hash)
+        if existing is not None:
+            if existing.status == 'completed':
+                entry = _entry(existing)
+                idempotency_cache.put((user_id, key), entry)
+                return _replay(entry, request_hash)
+            if existing.request_hash != request_hash:
+                return jsonify({'error': 'Idempotency-Key was already used with a different request'}), 422
+            last_seen = existing.heartbeat_at or existing.created_at
+            if existing.status == 'applied' and last_seen < datetime.utcnow() - timedelta(
+                    seconds=current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 60)):
+                return jsonify({'error': 'The request with this Idempotency-Key was applied but its '
+                                         'response was lost; fetch the resource instead of retrying'}), 409
+            response = jsonify({'error': 'A request with this Idempotency-Key is still being processed'})
+            response.headers['Retry-After'] = '1'
+            return response, 409
+        
+        # Kept alive until the response is stored, not just while the route runs
+        claim_heartbeat.hold(claim_id)
+        g.setdefault(CLAIM_KEY, claim_id)
+        try:
+            try:
+                response = current_app.make_response(fn(*args, **kwargs))
+            except Exception:
+                g.pop(CLAIM_KEY, None)
+                _release(user_id, key)
+                raise
+            g.pop(CLAIM_KEY, None)
+            
+            # Server errors aren't stored: the client should be able to retry them
+            # (unless the route committed first; _release keeps applied claims)
+            if response.status_code >= 500 or response.is_streamed:
+                _release(user_id, key)
+                return response
+            
+            entry = {
+                'request_hash': request_hash,
+                'status': response.status_code,
+                'body': response.get_data(as_text=True),
+                'mimetype': response.mimetype,
+            }
+            db.session.execute(update(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+            ).values(
+                status='completed', response_status=entry['status'], response_body=entry['body'],
+                response_mimetype=entry['mimetype'],
+            ))
+            db.session.commit()
+        finally:
+            claim_heartbeat.release(claim_id)
+        # The cached copy may outlive the row by the request's duration; harmless
+        entry['expires_at'] = datetime.utcnow() + timedelta(hours=current_app.config.get('IDEMPOTENCY_TTL_HOURS', 24))
+        idempotency_cache.put((user_id, key), entry)
+        return response
+    return wrapper
+
+
+def prune_expired_keys(batch_size=1000, log=None):
+    """
+    Delete expired idempotency keys in batches (one short transaction each)
+    
+    Returns:
+        Number of keys deleted
+    """
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            select(IdempotencyKey.id).where(IdempotencyKey.expires_at < datetime.utcnow()).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        if log:
+            log(f"  {deleted} deleted")
+    return deleted
@@ -0,0 +1,320 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements per request
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+DESCRIPTIONS = {
+    'http_requests_total': 'Requests handled, by route and status',
+    'http_request_duration_seconds': 'Request latency by blueprint and endpoint',
+    'db_queries_per_request': 'SQL statements executed per request',
+    'db_time_per_request_seconds': 'Time spent in SQL statements per request',
+    'http_client_request_duration_seconds': 'Outbound HTTP latency by external service',
+    'cache_requests_total': 'Cache lookups by cache and result (hit/miss)',
+}
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """
+    Process-local counters and histograms rendered in Prometheus text format.
+    
+    With gunicorn every worker has its own registry. When a shared directory is
+    configured each worker periodically writes a JSON snapshot there and
+    /metrics merges all snapshots, so any worker can answer the scrape.
+    """
+    
+    ARCHIVE_FILE = 'metrics_archive.json'
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.multiproc_dir = None
+        self.flush_interval = 1.0
+        self._last_flush = 0.0
+    
+    def configure(self, multiproc_dir=None, flush_interval=1.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        if multiproc_dir:
+            os.makedirs(multiproc_dir, exist_ok=True)
+    
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted((labels or {}).items())), tuple(buckets))
+        with self._lock:
+            state = self._histograms.get(key)
+            if state is None:
+                state = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+    
+    def snapshot(self):
+        """
+        JSON-serializable copy of the current values
+        """
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, list(labels), list(buckets), list(state[0]), state[1], state[2]]
+                    for (name, labels, buckets), state in self._histograms.items()
+                ],
+            }
+    
+    @staticmethod
+    def merge(snapshots):
+        counters = {}
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot.get('counters', []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, buckets, counts, total, count in snapshot.get('histograms', []):
+                key = (name, tuple(tuple(pair) for pair in labels), tuple(buckets))
+                state = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [
+                [name, list(labels), list(buckets), state[0], state[1], state[2]]
+                for (name, labels, buckets), state in histograms.items()
+            ],
+        }
+    
+    # ----- Multi-process aggregation -----
+    
+    def _process_file(self, pid=None):
+        return os.path.join(self.multiproc_dir, f'metrics_{pid or os.getpid()}.json')
+    
+    @staticmethod
+    def _write_atomic(path, data):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(data, handle)
+        os.replace(temp_path, path)
+    
+    def flush(self, force=False):
+        """
+        Write this process's snapshot to the shared directory (rate limited)
+        """
+        if not self.multiproc_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        self._write_atomic(self._process_file(), self.snapshot())
+    
+    @contextmanager
+    def _directory_lock(self, shared=False):
+        """
+        Lock the shared directory against concurrent archive updates. fcntl is
+        POSIX only; without it (Windows, single process) nothing is locked.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(os.path.join(self.multiproc_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def mark_process_dead(self, pid):
+        """
+        Fold an exited worker's snapshot into the archive so its counts survive
+        and its file can't be clobbered by a new process reusing the pid
+        """
+        if not self.multiproc_dir:
+            return
+        path = self._process_file(pid)
+        if not os.path.exists(path):
+            return
+        
+        with self._directory_lock():
+            archive_path = os.path.join(self.multiproc_dir, self.ARCHIVE_FILE)
+            snapshots = [self._read(path)]
+            if os.path.exists(archive_path):
+                snapshots.append(self._read(archive_path))
+            self._write_atomic(archive_path, self.merge(snapshots))
+            os.remove(path)
+    
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+    
+    def collect(self):
+        """
+        Snapshot across all workers (or just this process when not shared)
+        """
+        if not self.multiproc_dir:
+            return self.snapshot()
+        
+        own_file = self._process_file()
+        snapshots = [self.snapshot()]
+        # Shared lock: a dead worker's file is never counted both in itself
+        # and in the archive it is being folded into
+        with self._directory_lock(shared=True):
+            for filename in os.listdir(self.multiproc_dir):
+                path = os.path.join(self.multiproc_dir, filename)
+                if filename.endswith('.json') and path != own_file:
+                    snapshots.append(self._read(path))
+        return self.merge(snapshots)
+    
+    # ----- Prometheus text format -----
+    
+    @staticmethod
+    def _format_labels(labels, extra=None):
+        pairs = list(labels) + (list(extra) if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in pairs) + '}'
+    
+    def render(self, snapshot=None):
+        snapshot = snapshot or self.collect()
+        lines = []
+        seen = set()
+        
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {DESCRIPTIONS.get(name, name)}')
+                lines.append(f'# TYPE {name} {kind}')
+        
+        for name, labels, value in sorted(snapshot['counters'], key=lambda item: (item[0], item[1])):
+            header(name, 'counter')
+            lines.append(f'{name}{self._format_labels(labels)} {value}')
+        
+        for name, labels, buckets, counts, total, count in sorted(snapshot['histograms'], key=lambda item: (item[0], item[1])):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{self._format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{self._format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{self._format_labels(labels)} {total}')
+            lines.append(f'{name}_count{self._format_labels(labels)} {count}')
+        
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def time_http_call(service):
+    """
+    Time an outbound HTTP call
+    
+    Usage:
+        with time_http_call('exchangerate'):
+            response = requests.get(...)
+    """
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        metrics.observe('http_client_request_duration_seconds', time.perf_counter() - started,
+                        {'service': service, 'outcome': outcome})
+
+
+def record_cache_lookup(cache, hit):
+    metrics.inc('cache_requests_total', {'cache': cache, 'result': 'hit' if hit else 'miss'})
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    started = start_times.pop()
+    if has_app_context() and 'metrics_started' in g:
+        g.metrics_db_queries += 1
+        g.metrics_db_time += time.perf_counter() - started
+
+
+def init_metrics(app):
+    """
+    Install request/DB instrumentation and the /metrics endpoint
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    
+    metrics.configure(
+        multiproc_dir=app.config.get('METRICS_MULTIPROC_DIR') or None,
+        flush_interval=app.config.get('METRICS_FLUSH_INTERVAL', 1.0)
+    )
+    
+    # Listening on the Engine class covers every engine/bind the app creates
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_queries = 0
+        g.metrics_db_time = 0.0
+    
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_started' not in g or request.endpoint == 'metrics_endpoint':
+            return response
+        
+        endpoint = request.endpoint or 'unmatched'
+        labels = {
+            'blueprint': request.blueprint or 'app',
+            'endpoint': endpoint,
+            'method': request.method,
+        }
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - g.metrics_started, labels)
+        metrics.inc('http_requests_total', dict(labels, status=str(response.status_code)))
+        metrics.observe('db_queries_per_request', g.metrics_db_queries, {'endpoint': endpoint},
+                        buckets=QUERY_COUNT_BUCKETS)
+        metrics.observe('db_time_per_request_seconds', g.metrics_db_time, {'endpoint': endpoint})
+        
+        metrics.flush()
+        return response
+    
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
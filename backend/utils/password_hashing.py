@@ -0,0 +1,66 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash
+
+# Kept free of app imports: pool processes import this module on their own
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def hash_password(password):
+    """Same scheme as User.set_password"""
+    return generate_password_hash(password)
+
+
+def _hashing_pool(workers, reset=False):
+    """
+    The process's hashing pool, started on first use and then reused, so a
+    bulk import doesn't pay for spawning interpreters. Its size is fixed at
+    `workers`; concurrent imports queue on it instead of adding processes.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if reset and _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        # A pool inherited through fork has no live processes in this one
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def hash_passwords(passwords, workers=None, inline_below=8):
+    """
+    Hash many passwords on all cores.
+    
+    The hash is deliberately slow, so a bulk import hashes in a long-lived
+    process pool (started with "spawn", which is safe from threaded workers)
+    instead of on the request thread. Small lists are hashed inline, where
+    handing them to the pool costs more than it saves.
+    
+    Args:
+        passwords: Plain-text passwords
+        workers: Pool size, used when the pool is first started (default: one per CPU)
+        inline_below: Hash lists shorter than this on the calling thread
+    
+    Returns:
+        List of hashes in the order of `passwords`
+    """
+    passwords = list(passwords)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(passwords) < inline_below:
+        return [hash_password(password) for password in passwords]
+    
+    chunksize = max(1, math.ceil(len(passwords) / (workers * 4)))
+    try:
+        return list(_hashing_pool(workers).map(hash_password, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A pool process died (e.g. killed for memory); start a fresh pool once
+        return list(_hashing_pool(workers, reset=True).map(hash_password, passwords, chunksize=chunksize))
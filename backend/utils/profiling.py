@@ -0,0 +1,357 @@
+import hashlib
+import hmac
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import g, request
+
+# Header carrying "<unix timestamp>:<hex HMAC-SHA256>" of "<timestamp>:<METHOD>:<path>"
+PROFILE_HEADER = 'X-Profile-Request'
+# Optional: "cprofile" (default) or "sampling"
+PROFILE_MODE_HEADER = 'X-Profile-Mode'
+# Signed headers older than this are rejected so a leaked one can't be replayed forever
+SIGNATURE_MAX_AGE_SECONDS = 300
+
+PROFILE_ID_CHARS = set('0123456789abcdefT-')
+
+
+def sign_profile_request(secret, method, path, timestamp=None):
+    """
+    Build the X-Profile-Request header value for a request
+    
+    Args:
+        secret: PROFILING_SECRET of the server
+        method: HTTP method, e.g. 'GET'
+        path: Request path without query string, e.g. '/api/expenses/stats'
+        timestamp: Unix time to sign (defaults to now)
+    
+    Returns:
+        Header value string
+    """
+    timestamp = int(timestamp or time.time())
+    message = f'{timestamp}:{method.upper()}:{path}'.encode()
+    digest = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return f'{timestamp}:{digest}'
+
+
+def verify_profile_request(secret, header_value, method, path, now=None):
+    if not secret or not header_value or ':' not in header_value:
+        return False
+    timestamp, _, digest = header_value.partition(':')
+    if not timestamp.isdigit() or abs((now or time.time()) - int(timestamp)) > SIGNATURE_MAX_AGE_SECONDS:
+        return False
+    expected = sign_profile_request(secret, method, path, int(timestamp)).partition(':')[2]
+    return hmac.compare_digest(expected, digest)
+
+
+class StackSampler:
+    """
+    Low-overhead sampling profiler for one thread.
+    
+    A background thread snapshots the target thread's stack every `interval`
+    seconds and counts collapsed stacks ("a;b;c 42"), the input format of
+    flamegraph.pl and speedscope.
+    """
+    
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+    
+    def dump(self, path):
+        with open(path, 'w') as handle:
+            for stack, count in self.samples.most_common():
+                handle.write(f'{stack} {count}\n')
+    
+    def top(self, limit=25):
+        # Leaf frames with the most samples
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [{'function': name, 'samples': count, 'percent': round(100 * count / total, 1)}
+                for name, count in leaves.most_common(limit)]
+
+
+class ProfileStore:
+    """
+    Bounded directory of captured profiles.
+    
+    Each profile is a metadata file <id>.json plus the raw profile
+    (<id>.prof for cProfile, <id>.folded for the sampler). Only the newest
+    `max_profiles` are kept.
+    """
+    
+    EXTENSIONS = ('.json', '.prof', '.folded')
+    
+    def __init__(self, directory, max_profiles=50):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def new_id():
+        return f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    
+    @staticmethod
+    def valid_id(profile_id):
+        return bool(profile_id) and set(profile_id) <= PROFILE_ID_CHARS and len(profile_id) <= 40
+    
+    def path(self, profile_id, extension):
+        return os.path.join(self.directory, f'{profile_id}{extension}')
+    
+    def save(self, profile_id, metadata):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path(profile_id, '.json.tmp')
+        with open(temp_path, 'w') as handle:
+            json.dump(metadata, handle, default=str)
+        os.replace(temp_path, self.path(profile_id, '.json'))
+        self.rotate()
+    
+    def rotate(self):
+        with self._lock:
+            profile_ids = sorted(self._ids(), reverse=True)
+            for profile_id in profile_ids[self.max_profiles:]:
+                self.delete(profile_id)
+    
+    def delete(self, profile_id):
+        for extension in self.EXTENSIONS:
+            try:
+                os.remove(self.path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+    
+    def _ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-5] for name in os.listdir(self.directory) if name.endswith('.json')]
+    
+    def list(self, company_id=None):
+        """
+        Metadata of stored profiles, newest first, without the SQL and stats
+        detail; with company_id, only that company's profiles
+        """
+        summaries = []
+        for profile_id in sorted(self._ids(), reverse=True):
+            metadata = self.load(profile_id, company_id)
+            if metadata:
+                summaries.append({key: value for key, value in metadata.items()
+                                  if key not in ('sql', 'top_functions')})
+        return summaries
+    
+    def load(self, profile_id, company_id=None):
+        """
+        A profile's metadata; with company_id, None unless it belongs to that company
+        """
+        if not self.valid_id(profile_id):
+            return None
+        try:
+            with open(self.path(profile_id, '.json')) as handle:
+                metadata = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if company_id is not None and metadata.get('company_id') != company_id:
+            return None
+        return metadata
+
+
+def _should_profile(app):
+    secret = app.config.get('PROFILING_SECRET')
+    header = request.headers.get(PROFILE_HEADER)
+    if header:
+        if verify_profile_request(secret, header, request.method, request.path):
+            return 'signed_header'
+        print(f"Warning: rejected invalid {PROFILE_HEADER} header for {request.method} {request.path}")
+        return None
+    
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    return None
+
+
+def _cprofile_top(profiler, limit=25):
+    import pstats
+    
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (calls, _, self_time, cumulative, _) in stats.stats.items():
+        rows.append({'function': f'{name} ({os.path.basename(filename)}:{line})', 'calls': calls,
+                     'self_ms': round(self_time * 1000, 3), 'cumulative_ms': round(cumulative * 1000, 3)})
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+def _start_profile(app):
+    trigger = _should_profile(app)
+    if not trigger:
+        return
+    
+    from utils.query_budget import QueryRecorder
+    
+    mode = request.headers.get(PROFILE_MODE_HEADER, app.config.get('PROFILER', 'cprofile'))
+    if mode == 'sampling':
+        profiler = StackSampler(app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+        profiler.start()
+    else:
+        import cProfile
+        
+        mode = 'cprofile'
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler is already active in this interpreter
+            print(f"Warning: could not start profiler: {e}")
+            return
+    
+    # Bound parameters hold e-mails, password hashes and expense data; opt-in only
+    recorder = QueryRecorder(capture_parameters=app.config.get('PROFILE_CAPTURE_PARAMETERS', False)).__enter__()
+    g.profile = {'trigger': trigger, 'mode': mode, 'profiler': profiler, 'recorder': recorder,
+                 'started': time.perf_counter(), 'started_at': datetime.utcnow()}
+
+
+def _finish_profile(app, status_code):
+    state = g.pop('profile', None)
+    if state is None:
+        return None
+    
+    profiler, recorder = state['profiler'], state['recorder']
+    duration = time.perf_counter() - state['started']
+    if state['mode'] == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+    recorder.__exit__(None, None, None)
+    
+    store = app.extensions['profile_store']
+    profile_id = store.new_id()
+    user_id = _current_user_id()
+    try:
+        if state['mode'] == 'cprofile':
+            os.makedirs(store.directory, exist_ok=True)
+            profiler.dump_stats(store.path(profile_id, '.prof'))
+            top_functions = _cprofile_top(profiler)
+        else:
+            os.makedirs(store.directory, exist_ok=True)
+            profiler.dump(store.path(profile_id, '.folded'))
+            top_functions = profiler.top()
+        
+        store.save(profile_id, {
+            'id': profile_id,
+            'trigger': state['trigger'],
+            'mode': state['mode'],
+            'started_at': state['started_at'].isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'query_string': request.query_string.decode(errors='replace'),
+            'endpoint': request.endpoint,
+            'status': status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'user_id': user_id,
+            'company_id': _company_id(user_id),
+            'sql_count': recorder.count,
+            'sql_time_ms': round(recorder.total_time * 1000, 2),
+            'sql': [
+                dict({'statement': statement, 'duration_ms': round(elapsed * 1000, 3)},
+                     **({'parameters': repr(parameters)[:500]} if recorder.capture_parameters else {}))
+                for statement, parameters, elapsed in recorder.statements
+            ],
+            'top_functions': top_functions,
+        })
+    except OSError as e:
+        print(f"Warning: could not write profile {profile_id}: {e}")
+        return None
+    return profile_id
+
+
+def _current_user_id():
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def _company_id(user_id):
+    """
+    Company whose admins may read the profile (None for anonymous requests,
+    which only operators can read from PROFILE_DIR)
+    """
+    if user_id is None:
+        return None
+    try:
+        from database import db
+        from models import User
+        # The route has normally loaded the user already (identity-map hit)
+        user = db.session.get(User, user_id)
+        return user.company_id if user else None
+    except Exception:
+        return None
+
+
+def init_profiling(app):
+    """
+    Profile selected requests and keep the results for the admins of the
+    caller's company (listed and downloaded through /api/profiles).
+    
+    A request is profiled when it carries a valid signed X-Profile-Request
+    header (see sign_profile_request / `flask profiling sign`) or is picked
+    by PROFILE_SAMPLE_RATE.
+    """
+    # The store is always available so earlier profiles stay downloadable
+    app.extensions['profile_store'] = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_FILES'])
+    if not app.config.get('PROFILING_SECRET') and not app.config.get('PROFILE_SAMPLE_RATE'):
+        return
+    
+    from utils.query_budget import install_query_recorder
+    
+    # Listeners are registered here, not per profiled request
+    install_query_recorder()
+    
+    @app.before_request
+    def start_profile():
+        _start_profile(app)
+    
+    @app.after_request
+    def finish_profile(response):
+        profile_id = _finish_profile(app, response.status_code)
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+        return response
+    
+    @app.teardown_request
+    def abandon_profile(error):
+        # after_request is skipped when the view raised; still stop the profiler
+        if 'profile' in g:
+            _finish_profile(app, 500)
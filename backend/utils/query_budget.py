@@ -0,0 +1,145 @@
+import re
+import threading
+import time
+from collections import Counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Repeats of one parameterized statement tolerated inside a single request
+DEFAULT_MAX_REPEATS = 3
+
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER = r'(?:\?|%\(\w+\)s|%s|:\w+|\$\d+)'
+_IN_LIST = re.compile(rf'\bIN \(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)', re.IGNORECASE)
+
+
+def fingerprint(statement):
+    """
+    Normalize a SQL statement so executions that differ only in their
+    parameters (including the length of IN lists) compare equal
+    """
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    return _IN_LIST.sub('IN (?, ...)', statement)
+
+
+class QueryBudget:
+    def __init__(self, max_queries, max_repeats=DEFAULT_MAX_REPEATS):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+    
+    def __repr__(self):
+        return f'<QueryBudget {self.max_queries} queries, {self.max_repeats} repeats>'
+
+
+def query_budget(max_queries, max_repeats=DEFAULT_MAX_REPEATS):
+    """
+    Declare how many SQL statements a route may run per request.
+    Checked by scripts/check_query_budgets.py; has no runtime cost.
+    
+    Usage:
+        @expense_bp.route('/', methods=['GET'])
+        @query_budget(6)
+        @jwt_required()
+        def get_expenses():
+            ...
+    
+    Args:
+        max_queries: Maximum statements per request
+        max_repeats: Maximum executions of the same parameterized statement
+                     (more usually means a lazy load inside a loop)
+    """
+    def decorator(fn):
+        fn.query_budget = QueryBudget(max_queries, max_repeats)
+        return fn
+    return decorator
+
+
+# Recorders active on each thread, innermost last
+_active = threading.local()
+
+
+def _active_recorders():
+    if not hasattr(_active, 'recorders'):
+        _active.recorders = []
+    return _active.recorders
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_active, 'recorders', None):
+        conn.info.setdefault('query_recorder_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorders = getattr(_active, 'recorders', None)
+    if not recorders:
+        return
+    start_times = conn.info.get('query_recorder_start')
+    duration = time.perf_counter() - start_times.pop() if start_times else 0.0
+    for recorder in recorders:
+        recorder.statements.append((statement, parameters if recorder.capture_parameters else None, duration))
+
+
+def install_query_recorder():
+    """
+    Register the cursor listeners that feed QueryRecorder. Called once at
+    app init; the listeners cost one attribute lookup while no recorder is
+    active on the thread.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class QueryRecorder:
+    """
+    Capture the SQL statements executed by the current thread
+    
+    Usage:
+        with QueryRecorder() as recorder:
+            client.get('/api/expenses/')
+        print(recorder.count, recorder.repeated(3))
+    """
+    
+    def __init__(self, capture_parameters=False):
+        self.capture_parameters = capture_parameters
+        self.statements = []  # (statement, parameters, duration seconds)
+    
+    def __enter__(self):
+        # No-op after app init; keeps standalone scripts working
+        install_query_recorder()
+        _active_recorders().append(self)
+        return self
+    
+    def __exit__(self, *exc_info):
+        recorders = _active_recorders()
+        if self in recorders:
+            recorders.remove(self)
+        return False
+    
+    @property
+    def count(self):
+        return len(self.statements)
+    
+    @property
+    def total_time(self):
+        return sum(duration for _, _, duration in self.statements)
+    
+    def fingerprints(self):
+        return Counter(fingerprint(statement) for statement, _, _ in self.statements)
+    
+    def repeated(self, max_repeats=DEFAULT_MAX_REPEATS):
+        """
+        Statements executed more than max_repeats times, most frequent first
+        """
+        return [(statement, count) for statement, count in self.fingerprints().most_common() if count > max_repeats]
+    
+    def check(self, budget):
+        """
+        List budget violations as human-readable messages (empty when within budget)
+        """
+        problems = []
+        if self.count > budget.max_queries:
+            problems.append(f'{self.count} queries exceeds budget of {budget.max_queries}')
+        for statement, count in self.repeated(budget.max_repeats):
+            problems.append(f'statement ran {count}x (max {budget.max_repeats}): {statement[:160]}')
+        return problems
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from flask import current_app
+
+
+def created_range(args, use_default_window=True):
+    """
+    Parse ?created_from= / ?created_to= (YYYY-MM-DD, both inclusive)
+    
+    Hot list queries filter on created_at so that PostgreSQL can prune
+    month partitions. When HOT_QUERY_WINDOW_DAYS is set and no created_from
+    is given, the range defaults to that many days back.
+    
+    Returns:
+        Tuple of (start, end) datetimes (end exclusive); either may be None
+    
+    Raises:
+        ValueError: for malformed dates
+    """
+    start = args.get('created_from')
+    end = args.get('created_to')
+    start = datetime.strptime(start, '%Y-%m-%d') if start else None
+    end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+    
+    window = current_app.config.get('HOT_QUERY_WINDOW_DAYS', 0)
+    if start is None and use_default_window and window:
+        start = datetime.utcnow() - timedelta(days=window)
+    return start, end
+
+
+def filter_created(query, column, start, end):
+    """
+    Apply a created_range() to a query on `column`
+    """
+    if start is not None:
+        query = query.filter(column >= start)
+    if end is not None:
+        query = query.filter(column < end)
+    return query
@@ -0,0 +1,203 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from flask import jsonify, request
+from utils.metrics import metrics
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*(?:;\s*burst\s*=\s*(\d+))?\s*$')
+
+
+class Limit:
+    """
+    Token bucket parsed from "N/period" with an optional burst, e.g.
+    "10/minute", "100/hour; burst=20" or "5/10minutes"
+    """
+    
+    def __init__(self, spec):
+        match = _LIMIT.match(spec)
+        if not match:
+            raise ValueError(f'Invalid rate limit {spec!r} (expected e.g. "10/minute" or "10/minute; burst=20")')
+        count, multiple, period, burst = match.groups()
+        self.spec = spec
+        self.rate = int(count) / (int(multiple or 1) * PERIODS[period])  # tokens per second
+        self.capacity = int(burst) if burst else int(count)
+    
+    def __repr__(self):
+        return f'<Limit {self.spec}>'
+
+
+class MemoryBackend:
+    """
+    Buckets in this process only (single worker, or per-worker limits)
+    """
+    
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def consume(self, key, limit, cost=1):
+        """
+        Returns:
+            Tuple of (allowed, seconds until `cost` tokens are available)
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / limit.rate
+
+
+class RedisBackend:
+    """
+    Buckets shared by every worker and instance, updated atomically by a
+    Lua script using the Redis server clock
+    """
+    
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+    return {allowed, tostring(wait)}
+    """
+    
+    def __init__(self, url):
+        # redis is only needed when a shared store is configured
+        import redis
+        
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.script = self.client.register_script(self.SCRIPT)
+    
+    def consume(self, key, limit, cost=1):
+        try:
+            allowed, wait = self.script(keys=[key], args=[limit.capacity, limit.rate, cost])
+        except Exception as e:
+            # Fail open: an unreachable limiter must not take the API down with it
+            print(f"Rate limiter unavailable, allowing request: {e}")
+            return True, 0.0
+        return bool(allowed), float(wait)
+
+
+def _hashed(value):
+    # Account names (e-mails) are not stored in the limiter in clear
+    return hashlib.sha256(str(value).encode()).hexdigest()[:20]
+
+
+class RateLimiter:
+    """
+    Per-IP and per-account token buckets, checked in before_request, so an
+    over-limit request is rejected before any database query or password hash.
+    
+    RATE_LIMITS maps an endpoint ("auth.login") or a whole blueprint ("auth")
+    to limits per scope; both apply when both match. Scopes:
+        
+        ip       the client address (see RATE_LIMIT_TRUSTED_PROXIES)
+        account  the "email" field of a JSON body, or the JWT subject
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.backend = None
+        self.limits = {}
+        self.trusted_proxies = 0
+    
+    def configure(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.trusted_proxies = app.config.get('RATE_LIMIT_TRUSTED_PROXIES', 0)
+        self.limits = {
+            target: {scope: Limit(spec) for scope, spec in scopes.items()}
+            for target, scopes in app.config.get('RATE_LIMITS', {}).items()
+        }
+        storage = app.config.get('RATE_LIMIT_STORAGE_URL', 'memory://')
+        self.backend = MemoryBackend() if storage.startswith('memory') else RedisBackend(storage)
+    
+    # ----- Request identity -----
+    
+    def client_ip(self):
+        if self.trusted_proxies:
+            hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+            if len(hops) >= self.trusted_proxies:
+                return hops[-self.trusted_proxies]
+        return request.remote_addr or 'unknown'
+    
+    @staticmethod
+    def account():
+        body = request.get_json(silent=True) if request.is_json else None
+        if isinstance(body, dict) and isinstance(body.get('email'), str) and body['email'].strip():
+            return _hashed(body['email'].strip().lower())
+        
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            from flask_jwt_extended import decode_token
+            try:
+                return _hashed(decode_token(header[len('Bearer '):])['sub'])
+            except Exception:
+                return None  # invalid tokens are rejected by the route itself
+        return None
+    
+    # ----- Enforcement -----
+    
+    def check(self):
+        """
+        Returns:
+            A 429 response when a bucket is empty, otherwise None
+        """
+        if not self.enabled or request.method == 'OPTIONS' or not request.endpoint:
+            return None
+        
+        blueprint = request.endpoint.rsplit('.', 1)[0] if '.' in request.endpoint else None
+        for target in (request.endpoint, blueprint):
+            for scope, limit in self.limits.get(target, {}).items():
+                identity = self.client_ip() if scope == 'ip' else self.account() if scope == 'account' else None
+                if identity is None:
+                    continue
+                allowed, wait = self.backend.consume(f'ratelimit:{target}:{scope}:{identity}', limit)
+                if not allowed:
+                    metrics.inc('rate_limited_requests_total', {'target': target, 'scope': scope})
+                    retry_after = max(1, math.ceil(wait))
+                    response = jsonify({
+                        'error': 'Too many requests',
+                        'message': f'Rate limit {limit.spec} per {scope} exceeded. Retry in {retry_after}s.',
+                    })
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+        return None
+
+
+rate_limiter = RateLimiter()
+
+
+def init_rate_limiting(app):
+    """
+    Enforce RATE_LIMITS on every request before it reaches a view
+    """
+    rate_limiter.configure(app)
+    if rate_limiter.enabled and rate_limiter.limits:
+        app.before_request(rate_limiter.check)
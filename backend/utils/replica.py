@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_PREFIX = 'replica_'
+PRIMARY_COOKIE = 'db_primary_until'
+
+
+def use_replica(fn):
+    """
+    Let a read-only route run its queries on a read replica.
+    
+    Writes, SELECT ... FOR UPDATE, anything after a flush in the same
+    request, and every request from a client that wrote within
+    READ_AFTER_WRITE_SECONDS still go to the primary. Without configured
+    replicas this does nothing.
+    
+    Usage:
+        @expense_bp.route('/', methods=['GET'])
+        @query_budget(5)
+        @use_replica
+        @jwt_required()
+        def get_expenses():
+            ...
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.db_use_replica = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def _current_identity():
+    from flask_jwt_extended import get_jwt_identity
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None  # JWT not verified for this request
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine for each statement of a RoutingSession.
+    
+    Read-after-write is tracked two ways: per user id in this process, and
+    with a short-lived cookie so other workers route the client to the
+    primary as well.
+    """
+    
+    def __init__(self, bind_names, read_after_write_seconds=5.0):
+        self.bind_names = list(bind_names)
+        self.read_after_write_seconds = read_after_write_seconds
+        self._recent_writes = {}
+        self._lock = threading.Lock()
+    
+    # ----- Read-after-write -----
+    
+    def mark_write(self, identity):
+        until = time.time() + self.read_after_write_seconds
+        g.db_primary_until = until
+        if identity is None:
+            return
+        with self._lock:
+            self._recent_writes[identity] = until
+            if len(self._recent_writes) > 10000:
+                now = time.time()
+                self._recent_writes = {key: value for key, value in self._recent_writes.items() if value > now}
+    
+    def recently_wrote(self):
+        now = time.time()
+        try:
+            if float(request.cookies.get(PRIMARY_COOKIE, 0)) > now:
+                return True
+        except ValueError:
+            pass
+        identity = _current_identity()
+        return identity is not None and self._recent_writes.get(identity, 0) > now
+    
+    # ----- Routing -----
+    
+    def route(self, session, mapper, clause):
+        """
+        Returns:
+            A replica engine, or None to use the session's normal bind
+        """
+        if session._flushing or isinstance(clause, UpdateBase):
+            session.info['db_wrote'] = True
+            return None
+        if not self.bind_names or not g.get('db_use_replica'):
+            return None
+        if session.info.get('db_wrote') or getattr(clause, '_for_update_arg', None) is not None:
+            return None
+        if 'db_primary' not in g:
+            g.db_primary = self.recently_wrote()
+        if g.db_primary:
+            return None
+        
+        # One replica per session, so a request sees a single snapshot
+        name = session.info.get('db_replica')
+        if name is None:
+            name = session.info['db_replica'] = random.choice(self.bind_names)
+        from database import db
+        return db.engines[name]
+
+
+def _mark_flushed(session, flush_context):
+    session.info['db_wrote'] = True
+
+
+def _record_write(session):
+    if session.info.get('db_wrote') and has_request_context():
+        router = current_app.extensions.get('replica_router')
+        if router is not None:
+            router.mark_write(_current_identity())
+
+
+def init_replica_routing(app):
+    """
+    Enable @use_replica routing when DATABASE_REPLICA_URLS is configured
+    """
+    from database import db
+    
+    names = sorted(key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith(REPLICA_BIND_PREFIX))
+    if not names:
+        return
+    router = ReplicaRouter(names, app.config.get('READ_AFTER_WRITE_SECONDS', 5.0))
+    app.extensions['replica_router'] = router
+    
+    session_class = db.session.session_factory.class_
+    if not event.contains(session_class, 'after_flush', _mark_flushed):
+        event.listen(session_class, 'after_flush', _mark_flushed)
+        event.listen(session_class, 'after_commit', _record_write)
+    
+    @app.after_request
+    def _primary_cookie(response):
+        until = g.get('db_primary_until')
+        if until:
+            response.set_cookie(PRIMARY_COOKIE, f'{until:.3f}', max_age=int(router.read_after_write_seconds) + 1,
+                                httponly=True, samesite='Lax')
+        return response
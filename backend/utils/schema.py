@@ -0,0 +1,101 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+
+def _index_names(connection, inspector, table_name):
+    """
+    Names of a table's indexes. SQLite reflection skips (with a warning)
+    expression indexes such as lower(email), so there they come from sqlite_master.
+    """
+    if connection.dialect.name == 'sqlite':
+        return set(connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+            {'table': table_name}
+        ).scalars())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def _references(connection, column):
+    """
+    REFERENCES clause for a column added with ALTER TABLE, which CreateColumn
+    leaves out. Emitted on PostgreSQL only (SQLite doesn't enforce it), and not
+    towards partitioned tables, which can't be referenced by id alone.
+    """
+    if connection.dialect.name != 'postgresql':
+        return ''
+    for foreign_key in column.foreign_keys:
+        target = foreign_key.column
+        partitioned = connection.execute(
+            text("SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                 "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"),
+            {'table': target.table.name}
+        ).first()
+        if partitioned:
+            continue
+        clause = f' REFERENCES {target.table.name} ({target.name})'
+        if foreign_key.ondelete:
+            clause += f' ON DELETE {foreign_key.ondelete}'
+        return clause
+    return ''
+
+
+def upgrade_schema(db, log=None):
+    """
+    Bring an existing database up to the current models.
+    
+    db.create_all() only creates missing tables, so columns and indexes added
+    to existing models never reach a database created by an older version.
+    This adds, without touching existing data:
+      
+      - missing tables (with their indexes)
+      - missing columns, which must be nullable or have a server default
+        (with their foreign key on PostgreSQL)
+      - missing indexes on existing tables
+    
+    Args:
+        db: Flask-SQLAlchemy instance
+        log: Optional callable receiving one message per change
+    
+    Returns:
+        Number of changes applied
+    """
+    engine = db.engine
+    changes = 0
+    
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(connection)
+                changes += 1
+                if log:
+                    log(f"  created table {table.name}")
+                continue
+            
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    raise RuntimeError(
+                        f"Cannot add NOT NULL column {table.name}.{column.name} without a server default"
+                    )
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                references = _references(connection, column)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}{references}')
+                changes += 1
+                if log:
+                    log(f"  added column {table.name}.{column.name}")
+            
+            existing_indexes = _index_names(connection, inspector, table.name)
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.create(connection, checkfirst=True)
+                changes += 1
+                if log:
+                    log(f"  created index {index.name}")
+    
+    return changes
@@ -0,0 +1,230 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, event, or_, select
+from sqlalchemy.orm import Session
+from database import db
+from models import RevokedToken
+
+PENDING_REVOCATIONS_KEY = 'pending_revocations'
+
+
+def _epoch_ms(moment):
+    return int((moment - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+def issued_at_claims():
+    """
+    Millisecond issue time added to every JWT, so a user-wide revocation
+    doesn't also catch the tokens handed out in the same second
+    """
+    return {'iat_ms': int(time.time() * 1000)}
+
+
+class RevocationList:
+    """
+    Per-worker copy of the revoked_tokens table.
+    
+    Checks are two dict lookups (jti, then the user's cutoff) and never query
+    the database. A background thread follows the table by id every
+    `sync_seconds`, re-reading the last `overlap_seconds` of rows so ids
+    committed out of order aren't missed; revocations made by this worker
+    apply as soon as they commit. Entries are dropped once the tokens they
+    cover have expired.
+    """
+    
+    def __init__(self, sync_seconds=2.0, overlap_seconds=30):
+        self.sync_seconds = sync_seconds
+        self.overlap_seconds = overlap_seconds
+        self._jtis = {}  # jti -> expiry (epoch seconds)
+        self._cutoffs = {}  # user id -> (tokens issued before, epoch ms; expiry, epoch seconds)
+        self._cursor = 0
+        self._synced_at = None
+        self._engine = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+    
+    # ----- Contents -----
+    
+    def add(self, jti, user_id, revoked_at, expires_at):
+        expires = _epoch_ms(expires_at) / 1000
+        with self._lock:
+            if jti:
+                self._jtis[jti] = expires
+                return
+            key = str(user_id)
+            cutoff = _epoch_ms(revoked_at)
+            previous = self._cutoffs.get(key)
+            if previous is None or previous[0] < cutoff:
+                self._cutoffs[key] = (cutoff, max(expires, previous[1] if previous else 0))
+    
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            self._jtis = {jti: expires for jti, expires in self._jtis.items() if expires > now}
+            self._cutoffs = {key: value for key, value in self._cutoffs.items() if value[1] > now}
+    
+    def is_revoked(self, jwt_payload):
+        """
+        Returns:
+            True when the token's jti or its user's cutoff was revoked
+        """
+        self.ensure_started()
+        if jwt_payload.get('jti') in self._jtis:
+            return True
+        cutoff = self._cutoffs.get(str(jwt_payload.get('sub')))
+        if cutoff is None:
+            return False
+        issued = jwt_payload.get('iat_ms', jwt_payload.get('iat', 0) * 1000)
+        return issued < cutoff[0]
+    
+    def size(self):
+        return len(self._jtis) + len(self._cutoffs)
+    
+    # ----- Sync -----
+    
+    def sync(self, engine):
+        """
+        Load revocations added since the last sync (everything unexpired on the first)
+        
+        Returns:
+            Number of rows read
+        """
+        started = datetime.utcnow()
+        query = select(RevokedToken.id, RevokedToken.jti, RevokedToken.user_id,
+                       RevokedToken.revoked_at, RevokedToken.expires_at)
+        if self._synced_at is None:
+            query = query.where(RevokedToken.expires_at > started)
+        else:
+            query = query.where(or_(
+                RevokedToken.id > self._cursor,
+                RevokedToken.revoked_at >= self._synced_at - timedelta(seconds=self.overlap_seconds),
+            ))
+        with engine.connect() as connection:
+            rows = connection.execute(query).all()
+        
+        for row in rows:
+            self.add(row.jti, row.user_id, row.revoked_at, row.expires_at)
+            self._cursor = max(self._cursor, row.id)
+        self._prune()
+        self._synced_at = started
+        return len(rows)
+    
+    def ensure_started(self):
+        """
+        Load the list and start the sync thread on this worker's first check
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._engine = db.engine
+            self._synced_at = None  # a forked worker reloads rather than trusting the parent's copy
+            self.sync(self._engine)
+            self._thread = threading.Thread(target=self._run, name='token-revocation-sync', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.sync_seconds)
+            try:
+                self.sync(self._engine)
+            except Exception as e:
+                print(f"Error syncing revoked tokens: {e}")
+    
+    def reset(self):
+        with self._lock:
+            self._jtis = {}
+            self._cutoffs = {}
+        self._cursor = 0
+        self._synced_at = None
+
+
+revocation_list = RevocationList()
+
+
+# ----- Revoking -----
+
+def _stage(row):
+    db.session.add(row)
+    # Plain values: the row's attributes are expired by the time the commit hook runs
+    db.session.info.setdefault(PENDING_REVOCATIONS_KEY, []).append(
+        (row.jti, row.user_id, row.revoked_at, row.expires_at))
+    return row
+
+
+def revoke_token(jwt_payload, reason='logout'):
+    """
+    Revoke one decoded token in the current transaction
+    """
+    lifetime = current_app.config['JWT_REFRESH_TOKEN_EXPIRES']
+    expires_at = (datetime.utcfromtimestamp(jwt_payload['exp']) if jwt_payload.get('exp')
+                  else datetime.utcnow() + lifetime)
+    return _stage(RevokedToken(
+        jti=jwt_payload['jti'], user_id=int(jwt_payload['sub']), token_type=jwt_payload.get('type', 'access'),
+        reason=reason, revoked_at=datetime.utcnow(), expires_at=expires_at,
+    ))
+
+
+def revoke_user_tokens(user_id, reason):
+    """
+    Revoke every token issued to a user until now, in the current transaction
+    """
+    now = datetime.utcnow()
+    lifetime = max(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'], current_app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+    return _stage(RevokedToken(
+        jti=None, user_id=user_id, token_type='all', reason=reason, revoked_at=now, expires_at=now + lifetime,
+    ))
+
+
+def _apply_after_commit(session):
+    for values in session.info.pop(PENDING_REVOCATIONS_KEY, None) or ():
+        revocation_list.add(*values)
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(PENDING_REVOCATIONS_KEY, None)
+
+
+def init_token_revocation(app, jwt):
+    """
+    Check every JWT against the revocation list and stamp new tokens with iat_ms
+    """
+    revocation_list.sync_seconds = app.config.get('TOKEN_REVOCATION_SYNC_SECONDS', 2.0)
+    
+    @jwt.additional_claims_loader
+    def _issued_at(identity):
+        return issued_at_claims()
+    
+    @jwt.token_in_blocklist_loader
+    def _check_revoked(jwt_header, jwt_payload):
+        return revocation_list.is_revoked(jwt_payload)
+    
+    if not event.contains(Session, 'after_commit', _apply_after_commit):
+        event.listen(Session, 'after_commit', _apply_after_commit)
+        event.listen(Session, 'after_soft_rollback', _discard_after_rollback)
+
+
+def prune_revoked_tokens(batch_size=1000, log=None):
+    """
+    Delete revocations whose tokens have expired, in batches
+    
+    Returns:
+        Number of rows deleted
+    """
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            select(RevokedToken.id).where(RevokedToken.expires_at < datetime.utcnow()).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(RevokedToken).where(RevokedToken.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        if log:
+            log(f"  {deleted} deleted")
+    return deleted